@@ -1,4 +1,8 @@
-from typing import Awaitable, Callable, Generic, ParamSpec, TypeVar
+from typing import Any, Awaitable, Callable, Coroutine, Generic, ParamSpec, TypeVar
+
+import asyncio
+import signal
+import threading
 
 T = TypeVar('T')
 P = ParamSpec('P')
@@ -21,3 +25,20 @@ async def wrap_function_async(func: Callable[P, T], *args: P.args, **kwargs: P.k
 	Wrap a synchronous function as an asynchronous function.
 	"""
 	return func(*args, **kwargs)
+
+def _raise_keyboard_interrupt(signum, frame):
+	raise KeyboardInterrupt
+
+def run_interruptible(main: Coroutine[Any, Any, T]) -> T:
+	"""
+	Run a coroutine like `asyncio.run`, but raise `KeyboardInterrupt` immediately on Ctrl-C.
+
+	`asyncio.run` only cancels the main task on Ctrl-C, which never happens while a task is blocked in synchronous code.
+	"""
+	if threading.current_thread() is not threading.main_thread():
+		return asyncio.run(main)
+	previous = signal.signal(signal.SIGINT, _raise_keyboard_interrupt)
+	try:
+		return asyncio.run(main)
+	finally:
+		signal.signal(signal.SIGINT, previous)
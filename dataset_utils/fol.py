@@ -0,0 +1,180 @@
+from typing import Any, Iterable, Optional
+
+import re
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from z3 import BoolRef, SortRef
+
+class FOLParseError(ValueError):
+	pass
+
+_TOKEN = re.compile(r"\s*(?:(?P<symbol>[∀∃¬∧∨⊕→↔(),=≠])|(?P<name>[A-Za-z0-9_'\-]+))\s*")
+_BINARY = ['↔', '→', '⊕', '∨', '∧'] # loosest first; quantifiers extend as far right as possible
+
+def tokenize(formula: str) -> list[str]:
+	tokens: list[str] = []
+	position = 0
+	formula = formula.strip()
+	while position < len(formula):
+		match = _TOKEN.match(formula, position)
+		if match is None or match.end() == position:
+			raise FOLParseError(f'Unexpected character {formula[position]!r} at {position} of {formula!r}')
+		tokens.append(match.group('symbol') or match.group('name'))
+		position = match.end()
+	return tokens
+
+class FOLCompiler:
+	"""
+	Compiler of FOLIO first-order logic annotations, e.g. `∀x (Dog(x) → ¬Cat(x))`, into z3.
+
+	All terms are of a single sort `Entity`. Predicates are declared on first use with the arity they are applied with,
+	and a predicate used with several arities gets one symbol per arity.
+	Names bound by a quantifier are variables, other names are constants.
+	"""
+	def __init__(self, sort: "Optional[SortRef]" = None):
+		from z3 import DeclareSort
+
+		self.entity = sort if sort is not None else DeclareSort('Entity')
+		self.constants: dict[str, Any] = {}
+		self.predicates: dict[tuple[str, int], Any] = {}
+		self._arities: dict[str, set[int]] = {}
+
+	def _constant(self, name: str):
+		from z3 import Const
+		if name not in self.constants:
+			self.constants[name] = Const(name, self.entity)
+		return self.constants[name]
+
+	def _predicate(self, name: str, arity: int):
+		from z3 import Bool, BoolSort, Function
+		key = name, arity
+		if key not in self.predicates:
+			self._arities.setdefault(name, set()).add(arity)
+			symbol = name if len(self._arities[name]) == 1 else f'{name}_{arity}'
+			if arity == 0:
+				self.predicates[key] = Bool(symbol)
+			else:
+				self.predicates[key] = Function(symbol, *[self.entity] * arity, BoolSort())
+		return self.predicates[key]
+
+	def compile(self, formula: str) -> "BoolRef":
+		self._tokens = tokenize(formula)
+		self._position = 0
+		self._formula = formula
+		self._variables: dict[str, Any] = {}
+		expr = self._parse(0)
+		if self._position != len(self._tokens):
+			self._error('Trailing tokens')
+		return expr
+
+	def compile_all(self, formulas: Iterable[str]) -> list[tuple[str, "BoolRef"]]:
+		return [
+			(formula, self.compile(formula))
+			for formula in formulas
+			if formula.strip()
+		]
+
+	def _error(self, message: str):
+		raise FOLParseError(f'{message} at token {self._position} of {self._formula!r}')
+
+	def _peek(self):
+		return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+	def _next(self):
+		token = self._peek()
+		if token is None:
+			self._error('Unexpected end')
+		self._position += 1
+		return token
+
+	def _expect(self, token: str):
+		if self._next() != token:
+			self._position -= 1
+			self._error(f'Expected {token!r}')
+
+	def _parse(self, level: int):
+		from z3 import And, Implies, Or, Xor
+
+		if level == len(_BINARY):
+			return self._unary()
+		symbol = _BINARY[level]
+		left = self._parse(level + 1)
+		if symbol == '→': # right associative
+			if self._peek() == symbol:
+				self._next()
+				return Implies(left, self._parse(level))
+			return left
+		operands = [left]
+		while self._peek() == symbol:
+			self._next()
+			operands.append(self._parse(level + 1))
+		if len(operands) == 1:
+			return left
+		if symbol == '∧':
+			return And(*operands)
+		if symbol == '∨':
+			return Or(*operands)
+		expr = operands[0]
+		for operand in operands[1:]:
+			expr = (expr == operand) if symbol == '↔' else Xor(expr, operand)
+		return expr
+
+	def _unary(self):
+		from z3 import Const, Exists, ForAll, Not
+
+		token = self._peek()
+		if token == '¬':
+			self._next()
+			return Not(self._unary())
+		if token in ('∀', '∃'):
+			self._next()
+			name = self._name()
+			shadowed = self._variables.get(name)
+			variable = self._variables[name] = Const(name, self.entity)
+			body = self._parse(0) # maximal scope
+			if shadowed is None:
+				del self._variables[name]
+			else:
+				self._variables[name] = shadowed
+			return (ForAll if token == '∀' else Exists)([variable], body)
+		if token == '(':
+			self._next()
+			expr = self._parse(0)
+			self._expect(')')
+			return expr
+		return self._atom()
+
+	def _name(self):
+		token = self._next()
+		if not re.fullmatch(r"[A-Za-z0-9_'\-]+", token):
+			self._position -= 1
+			self._error('Expected a name')
+		return token
+
+	def _term(self):
+		name = self._name()
+		if self._peek() == '(':
+			self._error(f'Unsupported function term {name}')
+		return self._variables[name] if name in self._variables else self._constant(name)
+
+	def _atom(self):
+		from z3 import Not
+
+		start = self._position
+		name = self._name()
+		if self._peek() == '(':
+			self._next()
+			args = [self._term()]
+			while self._peek() == ',':
+				self._next()
+				args.append(self._term())
+			self._expect(')')
+			return self._predicate(name, len(args))(*args)
+		if self._peek() in ('=', '≠'):
+			self._position = start
+			left = self._term()
+			negated = self._next() == '≠'
+			right = self._term()
+			return Not(left == right) if negated else left == right
+		return self._predicate(name, 0)
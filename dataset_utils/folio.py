@@ -1,11 +1,15 @@
-from typing import Any, Literal, TypedDict
+from typing import Any, Iterable, Literal, Mapping, Optional, TypedDict, overload
 
 import json
 from logging import Logger, getLogger
+import time
+
+from .jsonl import JsonlDataset
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
 	from z3.z3 import CheckSatResult
+	from z3_utils import Logic
 
 	Label = Literal['True', 'False', 'Uncertain']
 
@@ -16,6 +20,16 @@ class Entry(TypedDict):
 	conclusion: str
 	label: "Label"
 
+_FOLAnnotations = TypedDict('_FOLAnnotations', {
+	'premises-FOL': str,
+	'conclusion-FOL': str,
+})
+
+class FOLEntry(Entry, _FOLAnnotations):
+	"""
+	`Entry` with the first-order logic annotations of FOLIO v2, one formula per line.
+	"""
+
 def convert_label(label: "Label"):
 	from z3.z3 import sat
 	match label:
@@ -26,9 +40,30 @@ def convert_label(label: "Label"):
 		case 'Uncertain':
 			return sat
 
+@overload
 def get_data(
-	data_path='data/FOLIO/folio_v2_train.jsonl',
+	data_path: str = 'data/FOLIO/folio_v2_train.jsonl',
+	lazy: Literal[False] = False,
 ) -> "list[Entry]":
+	...
+
+@overload
+def get_data(
+	data_path: str,
+	lazy: Literal[True],
+) -> "JsonlDataset[Entry]":
+	...
+
+def get_data(
+	data_path='data/FOLIO/folio_v2_train.jsonl',
+	lazy=False,
+):
+	"""
+	Args:
+		lazy: return a lazy sliceable view, parsing records only on access.
+	"""
+	if lazy:
+		return JsonlDataset(data_path, parse_record)
 	with open(data_path, 'r', encoding='utf-8') as file:
 		return [
 			parse_record(line)
@@ -42,19 +77,221 @@ def parse_record(record: str) -> Entry:
 		for k in Entry.__annotations__.keys()
 	}
 
+def parse_fol_record(record: str) -> FOLEntry:
+	j = json.loads(record)
+	return { # type: ignore
+		k: j[k]
+		for k in FOLEntry.__annotations__.keys()
+	}
+
+def get_fol_data(
+	data_path='data/FOLIO/folio_v2_validation.jsonl',
+	lazy=False,
+) -> "list[FOLEntry] | JsonlDataset[FOLEntry]":
+	"""
+	Same as `get_data`, keeping the FOL annotations.
+	"""
+	if lazy:
+		return JsonlDataset(data_path, parse_fol_record)
+	with open(data_path, 'r', encoding='utf-8') as file:
+		return [
+			parse_fol_record(line)
+			for line in file
+			if line.strip()
+		]
+
+def compile_fol(
+	entry: FOLEntry,
+	**kwargs,
+) -> "Logic":
+	"""
+	Compile the FOL annotations of a record into a `Logic` instance,
+	with the premises as claims and the conclusion as the assertion.
+
+	Raises:
+		FOLParseError: if an annotation cannot be parsed.
+	"""
+	from z3_utils import Logic
+	from .fol import FOLCompiler
+
+	compiler = FOLCompiler()
+	l = Logic(**kwargs)
+	l.claims = compiler.compile_all(entry['premises-FOL'].splitlines())
+	l.assertions = compiler.compile_all([entry['conclusion-FOL']])
+	return l
+
+def check_gold(
+	source: Iterable[FOLEntry],
+	allow_unknown: bool = False,
+	logger: Logger = getLogger(__name__),
+	**kwargs,
+):
+	"""
+	Judge the gold FOL annotations in process, without the LLM, as a translation baseline,
+	and as a timing reference for changes of `z3_utils`.
+
+	Returns:
+		(correct, wrong, failed, total), example ids of unparsable annotations, and elapsed seconds.
+	"""
+	from z3 import unknown
+	from .fol import FOLParseError
+
+	correct = wrong = failed = total = 0
+	unparsed: list[int] = []
+	start = time.perf_counter()
+	for entry in source:
+		try:
+			logic = compile_fol(entry, logger=logger, **kwargs)
+		except FOLParseError as e:
+			logger.warning('Cannot parse %d: %s', entry['example_id'], e)
+			unparsed.append(entry['example_id'])
+			continue
+		try:
+			results = logic.judge()
+		except AssertionError as e: # paradox premises
+			logger.error('Failed to judge %d: %s', entry['example_id'], e)
+			results = [unknown]
+		c, w, f, t = check_result(results, entry, allow_unknown, logger)
+		correct += c
+		wrong += w
+		failed += f
+		total += t
+	elapsed = time.perf_counter() - start
+	logger.info('Judged %d gold annotations in %.2f seconds, %d unparsable.', total, elapsed, len(unparsed))
+	return (correct, wrong, failed, total), unparsed, elapsed
+
 def generate_prompt(entry: Entry):
 	return 'Premises:\n' + entry['premises'] + '\n\nConclusion: ' + entry['conclusion'] \
 		#+ '\n(Simple case, treat all concepts as single sort Entity.)'
 
 def generate_prompts(
 	data_path='data/FOLIO/folio_v2_train.jsonl',
+	s: Optional[slice] = None,
 ):
-	data = get_data(data_path)
+	"""
+	Args:
+		s: only generate prompts of this slice, without parsing the rest.
+	"""
+	data = get_data(data_path, lazy=True)
+	if s:
+		data = data[s]
 	return [
 		generate_prompt(entry)
 		for entry in data
 	]
 
+class StoryGroup(TypedDict):
+	id: str
+	story_id: int
+	premises: str
+	conclusions: list[str]
+	example_ids: list[int]
+
+def group_by_story(entries: Iterable[Entry]) -> list[StoryGroup]:
+	"""
+	Group examples sharing a story, i.e. the same premises, keeping their order.
+	"""
+	groups: dict[tuple[int, str], StoryGroup] = {}
+	for entry in entries:
+		premises = entry['premises'].strip()
+		key = entry['story_id'], premises
+		group = groups.get(key)
+		if group is None:
+			group = groups[key] = {
+				"id": f'story-{entry["story_id"]}',
+				"story_id": entry['story_id'],
+				"premises": premises,
+				"conclusions": [],
+				"example_ids": [],
+			}
+		group['conclusions'].append(entry['conclusion'])
+		group['example_ids'].append(entry['example_id'])
+
+	story_ids = [group['story_id'] for group in groups.values()]
+	for group in groups.values():
+		if story_ids.count(group['story_id']) > 1: # same story, different premises
+			group['id'] += '-' + str(group['example_ids'][0])
+	return list(groups.values())
+
+def generate_story_prompt(group: StoryGroup):
+	return 'Premises:\n' + group['premises'] + '\n\nConclusions:\n' + '\n'.join(
+		f'{k + 1}. {conclusion}'
+		for k, conclusion in enumerate(group['conclusions'])
+	)
+
+@overload
+def generate_story_prompts(
+	data_path: str = 'data/FOLIO/folio_v2_train.jsonl',
+	return_groups: Literal[False] = False,
+) -> tuple[list[str], list[str]]:
+	...
+
+@overload
+def generate_story_prompts(
+	data_path: str,
+	return_groups: Literal[True],
+) -> tuple[list[str], list[str], list[StoryGroup]]:
+	...
+
+def generate_story_prompts(
+	data_path='data/FOLIO/folio_v2_train.jsonl',
+	return_groups=False,
+):
+	"""
+	One prompt per story, asking all conclusions of the story at once, numbered.
+	The generated program then adds the premises to a single solver in one worker,
+	and each conclusion is checked as an assumption against it.
+	Request with the demos of `demos/folio_stories.py`, and check with `method='judge_numbered'` and `check_story_result`.
+
+	Returns:
+		prompts, group ids, and groups if `return_groups`.
+	"""
+	groups = group_by_story(get_data(data_path, lazy=True))
+	prompts = [generate_story_prompt(group) for group in groups]
+	ids = [group['id'] for group in groups]
+	if return_groups:
+		return prompts, ids, groups
+	else:
+		return prompts, ids
+
+def check_story_result(
+	results: "list[bool | CheckSatResult]",
+	group: StoryGroup,
+	records: Mapping[int, Entry],
+	allow_unknown: bool = False,
+	logger: Logger = getLogger(__name__),
+):
+	"""
+	Check the verdicts of a story against each of its examples, keyed by `example_id` in `records`.
+	Verdicts are attributed by position, their order is validated by `Logic.judge_numbered`.
+
+	Returns:
+		correct, wrong, failed, total, summed over the examples.
+		If the verdicts do not match the conclusions one to one, every example failed.
+	"""
+	n = len(group['example_ids'])
+	if len(results) != n:
+		logger.error('len(results) (%d) does not match conclusions %d of %s.', len(results), n, group['id'])
+		return 0, 0, n, n
+
+	correct = wrong = failed = total = 0
+	for example_id, result in zip(group['example_ids'], results):
+		c, w, f, t = check_result([result], records[example_id], allow_unknown, logger)
+		correct += c
+		wrong += w
+		failed += f
+		total += t
+	return correct, wrong, failed, total
+
+def get_labels(entry: Entry) -> list[str]:
+	return [entry['label']]
+
+def get_prediction(verdict: bool | str) -> str:
+	"""
+	Label predicted by a journaled verdict, `unsat` and `unknown` are kept as is.
+	"""
+	return 'Uncertain' if verdict == 'sat' else str(verdict)
+
 def _result_equal(
 	judge_result: "bool | CheckSatResult",
 	answer: "Label",
@@ -0,0 +1,71 @@
+from typing import Callable, Generic, Iterator, Optional, Sequence, TypeVar, overload
+
+from array import array
+import os
+
+T = TypeVar('T')
+
+_indices: dict[tuple[str, int], array] = {}
+
+def index_lines(data_path: str) -> array:
+	"""
+	Byte offsets of the non-blank lines of a file, memoized on file mtime.
+	"""
+	path = os.path.abspath(data_path)
+	mtime = os.stat(path).st_mtime_ns
+	offsets = _indices.get((path, mtime))
+	if offsets is not None:
+		return offsets
+
+	offsets = array('q')
+	offset = 0
+	with open(path, 'rb') as file:
+		for line in file:
+			if line.strip():
+				offsets.append(offset)
+			offset += len(line)
+
+	_indices[(path, mtime)] = offsets
+	return offsets
+
+class JsonlDataset(Sequence[T], Generic[T]):
+	"""
+	Lazy view of a JSONL dataset. Records are parsed on access, located by a line-offset index.
+	Slicing returns another lazy view.
+	"""
+	def __init__(self,
+		data_path: str,
+		parse: Callable[[str], T],
+		offsets: Optional[Sequence[int]] = None,
+	):
+		self.data_path = data_path
+		self._parse = parse
+		self._offsets = offsets if offsets is not None else index_lines(data_path)
+
+	def __len__(self):
+		return len(self._offsets)
+
+	@overload
+	def __getitem__(self, key: int) -> T:
+		...
+
+	@overload
+	def __getitem__(self, key: slice) -> "JsonlDataset[T]":
+		...
+
+	def __getitem__(self, key: int | slice):
+		if isinstance(key, slice):
+			return JsonlDataset(self.data_path, self._parse, self._offsets[key])
+		offset = self._offsets[key]
+		with open(self.data_path, 'rb') as file:
+			file.seek(offset)
+			return self._parse(file.readline().decode('utf-8'))
+
+	def __iter__(self) -> Iterator[T]:
+		with open(self.data_path, 'rb') as file:
+			for offset in self._offsets:
+				file.seek(offset)
+				yield self._parse(file.readline().decode('utf-8'))
+
+	def __repr__(self):
+		return f'{self.__class__.__name__}({self.data_path!r}, len={len(self)})'
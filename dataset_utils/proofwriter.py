@@ -1,7 +1,13 @@
-from typing import Any, Literal, overload
+from typing import Any, Iterable, Literal, Mapping, Optional, Sequence, overload
 
+from array import array
+import hashlib
 from logging import Logger, getLogger
 import json
+import re
+import sys
+
+from .jsonl import JsonlDataset
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -19,9 +25,39 @@ if TYPE_CHECKING:
 		theory: str
 		questions: list[Question]
 
+	class TheoryGroup(TypedDict):
+		id: str
+		theory: str
+		questions: list[Question]
+		members: list[tuple[str, str, list[int]]]
+		"""
+		(source file, record id, index of each question of the record in `questions`)
+		"""
+
+@overload
 def get_data(
-	data_path='data/proofwriter/OWA/depth-5/meta-dev.jsonl',
+	data_path: str = 'data/proofwriter/OWA/depth-5/meta-dev.jsonl',
+	lazy: Literal[False] = False,
 ) -> "list[Entry]":
+	...
+
+@overload
+def get_data(
+	data_path: str,
+	lazy: Literal[True],
+) -> "JsonlDataset[Entry]":
+	...
+
+def get_data(
+	data_path='data/proofwriter/OWA/depth-5/meta-dev.jsonl',
+	lazy=False,
+):
+	"""
+	Args:
+		lazy: return a lazy sliceable view, parsing records only on access.
+	"""
+	if lazy:
+		return JsonlDataset(data_path, parse_record)
 	with open(data_path, 'r', encoding='utf-8') as file:
 		return [
 			parse_record(line)
@@ -49,6 +85,154 @@ def parse_record(record: str) -> "Entry":
 		"questions": qs,
 	}
 
+_ANSWERS: "tuple[bool | Literal['Unknown'], ...]" = (True, False, 'Unknown')
+_ANSWER_CODES = {answer: code for code, answer in enumerate(_ANSWERS)}
+
+class CompactQuestion:
+	"""
+	Read-only `Question` view into a `CompactCorpus`.
+	"""
+	__slots__ = ('_corpus', '_j')
+
+	def __init__(self, corpus: "CompactCorpus", j: int):
+		self._corpus = corpus
+		self._j = j
+
+	def __getitem__(self, key: str):
+		match key:
+			case 'id':
+				return self._corpus.question_ids[self._j]
+			case 'question':
+				return self._corpus.questions[self._j]
+			case 'answer':
+				return _ANSWERS[self._corpus.answers[self._j]]
+			case _:
+				raise KeyError(key)
+
+	def to_dict(self) -> "Question":
+		return {
+			"id": self['id'],
+			"question": self['question'],
+			"answer": self['answer'],
+		}
+
+class CompactQuestions(Sequence[CompactQuestion]):
+	__slots__ = ('_corpus', '_start', '_stop')
+
+	def __init__(self, corpus: "CompactCorpus", start: int, stop: int):
+		self._corpus = corpus
+		self._start = start
+		self._stop = stop
+
+	def __len__(self):
+		return self._stop - self._start
+
+	@overload
+	def __getitem__(self, key: int) -> CompactQuestion:
+		...
+
+	@overload
+	def __getitem__(self, key: slice) -> list[CompactQuestion]:
+		...
+
+	def __getitem__(self, key: int | slice):
+		if isinstance(key, slice):
+			return [self[i] for i in range(*key.indices(len(self)))]
+		if key < 0:
+			key += len(self)
+		if not 0 <= key < len(self):
+			raise IndexError(key)
+		return CompactQuestion(self._corpus, self._start + key)
+
+class CompactEntry:
+	"""
+	Read-only `Entry` view into a `CompactCorpus`.
+	"""
+	__slots__ = ('_corpus', '_i')
+
+	def __init__(self, corpus: "CompactCorpus", i: int):
+		self._corpus = corpus
+		self._i = i
+
+	def __getitem__(self, key: str):
+		match key:
+			case 'id':
+				return self._corpus.ids[self._i]
+			case 'theory':
+				return self._corpus.theories[self._i]
+			case 'questions':
+				offsets = self._corpus.question_offsets
+				return CompactQuestions(self._corpus, offsets[self._i], offsets[self._i + 1])
+			case _:
+				raise KeyError(key)
+
+	def to_dict(self) -> "Entry":
+		return {
+			"id": self['id'],
+			"theory": self['theory'],
+			"questions": [q.to_dict() for q in self['questions']],
+		}
+
+class CompactCorpus(Sequence[CompactEntry]):
+	"""
+	Struct-of-arrays storage of ProofWriter records, for loading many splits at once.
+	Theories and questions are interned, so identical texts across records and splits are stored once.
+	Records are accessed as `CompactEntry` views, which work with `generate_prompt` and `check_result`.
+	"""
+	def __init__(self):
+		self.ids: list[str] = []
+		self.theories: list[str] = []
+		self.question_offsets = array('l', [0])
+		self.question_ids: list[str] = []
+		self.questions: list[str] = []
+		self.answers = array('b')
+
+	def append(self, record: str):
+		j = json.loads(record)
+		self.ids.append(j['id'])
+		self.theories.append(sys.intern(j['theory']))
+		for key, value in j['questions'].items():
+			self.question_ids.append(sys.intern(key))
+			self.questions.append(sys.intern(value['question']))
+			self.answers.append(_ANSWER_CODES[value['answer']])
+		self.question_offsets.append(len(self.questions))
+
+	def load(self, data_path: str):
+		with open(data_path, 'r', encoding='utf-8') as file:
+			for line in file:
+				if line.strip():
+					self.append(line)
+		return self
+
+	def __len__(self):
+		return len(self.ids)
+
+	@overload
+	def __getitem__(self, key: int) -> CompactEntry:
+		...
+
+	@overload
+	def __getitem__(self, key: slice) -> list[CompactEntry]:
+		...
+
+	def __getitem__(self, key: int | slice):
+		if isinstance(key, slice):
+			return [self[i] for i in range(*key.indices(len(self)))]
+		if key < 0:
+			key += len(self)
+		if not 0 <= key < len(self):
+			raise IndexError(key)
+		return CompactEntry(self, key)
+
+def get_compact_data(*data_paths: str) -> CompactCorpus:
+	"""
+	Load one or more ProofWriter files into a single `CompactCorpus`.
+	"""
+	corpus = CompactCorpus()
+	for data_path in data_paths:
+		corpus.load(data_path)
+	return corpus
+
 def generate_prompt(entry: "Entry"):
 	return 'Theory: ' + entry['theory'] \
 		+ '\n\nQuestion: Which of the following statements can be inferred from the theory?\n' \
@@ -67,6 +251,7 @@ def generate_prompts(
 	return_ids: Literal[False] = False,
 	*,
 	baseline: bool = False,
+	s: Optional[slice] = None,
 ) -> list[str]:
 	...
 
@@ -76,6 +261,7 @@ def generate_prompts(
 	return_ids: Literal[True],
 	*,
 	baseline: bool = False,
+	s: Optional[slice] = None,
 ) -> tuple[list[str], list[str]]:
 	...
 
@@ -84,8 +270,15 @@ def generate_prompts(
 	return_ids: bool = False,
 	*,
 	baseline: bool = False,
+	s: Optional[slice] = None,
 ):
-	data = get_data(data_path)
+	"""
+	Args:
+		s: only generate prompts of this slice, without parsing the rest.
+	"""
+	data = get_data(data_path, lazy=True)
+	if s:
+		data = data[s]
 	generate_func = generate_prompt_baseline if baseline == True else generate_prompt
 	
 	prompts: list[str] = []
@@ -100,6 +293,153 @@ def generate_prompts(
 	else:
 		return prompts
 
+def get_labels(entry: "Entry") -> list[str]:
+	return [str(q['answer']) for q in entry['questions']]
+
+def get_prediction(verdict: bool | str) -> str:
+	"""
+	Label predicted by a journaled verdict, `unsat` and `unknown` are kept as is.
+	"""
+	return 'Unknown' if verdict == 'sat' else str(verdict)
+
+def get_split(entry: "Entry") -> str:
+	"""
+	Theory family of the record, e.g. `AttNoneg-OWA-D5` of `AttNoneg-OWA-D5-1027`.
+	"""
+	return entry['id'].rsplit('-', 1)[0]
+
+def normalize_theory(theory: str) -> str:
+	return ' '.join(theory.split())
+
+def group_by_theory(entries: "Iterable[tuple[str, Entry]]") -> "list[TheoryGroup]":
+	"""
+	Group records by normalized theory. Each group asks the union of the questions of its records once.
+	Answers are left to the records, as they depend on the world assumption of the file.
+
+	Args:
+		entries: (source file, record), records are told apart by both, as files share record ids.
+	"""
+	groups: "dict[str, TheoryGroup]" = {}
+	indices: dict[str, dict[str, int]] = {}
+	for source, entry in entries:
+		theory = normalize_theory(entry['theory'])
+		group = groups.get(theory)
+		if group is None:
+			group = groups[theory] = {
+				"id": 'theory-' + hashlib.sha1(theory.encode('utf-8')).hexdigest()[:12],
+				"theory": theory,
+				"questions": [],
+				"members": [],
+			}
+			indices[theory] = {}
+		question_indices = indices[theory]
+
+		member: list[int] = []
+		for q in entry['questions']:
+			text = q['question']
+			if text not in question_indices:
+				question_indices[text] = len(group['questions'])
+				group['questions'].append({
+					"id": f'Q{len(group["questions"]) + 1}',
+					"question": text,
+					"answer": 'Unknown', # placeholder, see above
+				})
+			member.append(question_indices[text])
+		group['members'].append((source, entry['id'], member))
+
+	return list(groups.values())
+
+@overload
+def generate_theory_prompts(
+	data_paths: "str | Sequence[str]",
+	return_groups: Literal[False] = False,
+) -> tuple[list[str], list[str]]:
+	...
+
+@overload
+def generate_theory_prompts(
+	data_paths: "str | Sequence[str]",
+	return_groups: Literal[True],
+) -> "tuple[list[str], list[str], list[TheoryGroup]]":
+	...
+
+def generate_theory_prompts(
+	data_paths: "str | Sequence[str]",
+	return_groups: bool = False,
+):
+	"""
+	One prompt per unique theory across the given files.
+
+	Returns:
+		prompts, group ids, and groups if `return_groups`.
+	"""
+	if isinstance(data_paths, str):
+		data_paths = [data_paths]
+	groups = group_by_theory(
+		(data_path, entry)
+		for data_path in data_paths
+		for entry in get_data(data_path, lazy=True)
+	)
+
+	prompts = [generate_prompt(group) for group in groups] # type: ignore # TheoryGroup is a superset of Entry
+	ids = [group['id'] for group in groups]
+	if return_groups:
+		return prompts, ids, groups
+	else:
+		return prompts, ids
+
+def get_theory_records(data_paths: "str | Sequence[str]") -> "dict[tuple[str, str], Entry]":
+	"""
+	Records of the files grouped by `generate_theory_prompts`, keyed by (source file, record id).
+	"""
+	if isinstance(data_paths, str):
+		data_paths = [data_paths]
+	return {
+		(data_path, entry['id']): entry
+		for data_path in data_paths
+		for entry in get_data(data_path)
+	}
+
+def fan_out_results(
+	results: "list[bool | CheckSatResult]",
+	group: "TheoryGroup",
+) -> "dict[tuple[str, str], list[bool | CheckSatResult]]":
+	"""
+	Per-question verdicts of each record of the group, keyed by (source file, record id).
+	"""
+	if len(results) != len(group['questions']):
+		# Failure or mismatch, let `check_result` handle it for every record.
+		return {(source, id): results for source, id, _ in group['members']}
+	return {
+		(source, id): [results[k] for k in member]
+		for source, id, member in group['members']
+	}
+
+def check_theory_result(
+	results: "list[bool | CheckSatResult]",
+	group: "TheoryGroup",
+	records: "Mapping[tuple[str, str], Entry]",
+	allow_unknown: bool = False,
+	logger: Logger = getLogger(__name__),
+):
+	"""
+	Check the verdicts of a theory group against every record of it.
+
+	Args:
+		records: records keyed by (source file, record id), see `get_theory_records`.
+
+	Returns:
+		correct, wrong, failed, total, summed over the records.
+	"""
+	correct = wrong = failed = total = 0
+	for key, member_results in fan_out_results(results, group).items():
+		c, w, f, t = check_result(member_results, records[key], allow_unknown, logger)
+		correct += c
+		wrong += w
+		failed += f
+		total += t
+	return correct, wrong, failed, total
+
 def _result_equal(
 	judge_result: "bool | CheckSatResult",
 	answer: "bool | Literal['Unknown']",
@@ -158,3 +498,280 @@ def check_result(
 
 	#return correct, wrong, failed, total
 	return _binarize(1 - wrong - failed), _binarize(wrong), _binarize(failed), _binarize(total)
+
+class TheoryParseError(ValueError):
+	"""
+	Some sentences of a theory do not follow the ProofWriter templates.
+	"""
+	def __init__(self, sentences: list[str]):
+		super().__init__(f'Cannot parse {len(sentences)} sentence(s): {sentences}')
+		self.sentences = sentences
+
+_VARIABLES = {'something', 'someone'}
+_PRONOUNS = {'it', 'they', 'them'}
+_COPULAS = {'is', 'are'}
+_NEGATIONS = (['does', 'not'], ['do', 'not'])
+_KEYWORDS = _VARIABLES | _PRONOUNS | _COPULAS | {'the', 'not', 'and', 'if', 'then', 'all', 'does', 'do'}
+
+def _split_sentences(text: str) -> list[str]:
+	sentences = [sentence.strip().rstrip('.').strip() for sentence in re.split(r'(?<=\.)\s+', text.strip())]
+	return [sentence for sentence in sentences if sentence]
+
+def _is_word(token: str):
+	return token.isalpha() and token.islower() and token not in _KEYWORDS
+
+class TheoryCompiler:
+	"""
+	Deterministic translator of the templated English of ProofWriter into z3, e.g.
+	"The cat chases the dog.", "Bob is not big.", "If something is big and it chases the cat then it is red.",
+	"All big, red things are kind.".
+
+	Everything is of a single sort `Entity`; adjectives are unary and verbs are binary predicates.
+	`something` and `someone` are universally quantified, and pronouns refer to them, or else to the first subject of the sentence.
+	"""
+	def __init__(self):
+		from z3 import Const, DeclareSort
+
+		self.entity = DeclareSort('Entity')
+		self.x = Const('x', self.entity)
+		self._constants: dict[str, Any] = {}
+		self._attributes: dict[str, Any] = {}
+		self._relations: dict[str, Any] = {}
+		self._reset()
+
+	def _reset(self):
+		self.uses_variable = False
+		self._antecedent: Optional[Any] = None
+
+	def _constant(self, name: str):
+		from z3 import Const
+		if name not in self._constants:
+			self._constants[name] = Const(name, self.entity)
+		return self._constants[name]
+
+	def _attribute(self, adjective: str):
+		from z3 import BoolSort, Function
+		if adjective not in self._attributes:
+			self._attributes[adjective] = Function(adjective, self.entity, BoolSort())
+		return self._attributes[adjective]
+
+	def _relation(self, verb: str):
+		from z3 import BoolSort, Function
+		if verb.endswith('s') and not verb.endswith('ss'): # chases -> chase, but not kiss -> kis
+			verb = verb[:-1]
+		if verb not in self._relations:
+			self._relations[verb] = Function(verb, self.entity, self.entity, BoolSort())
+		return self._relations[verb]
+
+	def _term(self, tokens: list[str]):
+		if len(tokens) == 1:
+			token = tokens[0].lower()
+			if token in _VARIABLES:
+				self.uses_variable = True
+				return self.x
+			if token in _PRONOUNS:
+				return self.x if self.uses_variable else self._antecedent
+			if tokens[0].istitle() and tokens[0].isalpha() and token not in _KEYWORDS:
+				return self._constant(tokens[0])
+		elif tokens[0].lower() == 'the' and all(_is_word(token) for token in tokens[1:]):
+			return self._constant('_'.join(tokens[1:]))
+		return None
+
+	def _predicate(self, subject, tokens: list[str]):
+		"""
+		`is [not] <adjective>`, `does not <verb> <term>` or `<verb> <term>` applied to `subject`.
+		"""
+		from z3 import Not
+
+		negated = False
+		if tokens[:1] and tokens[0] in _COPULAS:
+			tokens = tokens[1:]
+			if tokens[:1] == ['not']:
+				negated = True
+				tokens = tokens[1:]
+			if len(tokens) != 1 or not _is_word(tokens[0]):
+				return None
+			expr = self._attribute(tokens[0])(subject)
+		else:
+			if tokens[:2] in _NEGATIONS:
+				negated = True
+				tokens = tokens[2:]
+			if len(tokens) < 2 or not _is_word(tokens[0]):
+				return None
+			obj = self._term(tokens[1:])
+			if obj is None:
+				return None
+			expr = self._relation(tokens[0])(subject, obj)
+		return Not(expr) if negated else expr
+
+	def _clause(self, tokens: list[str], previous: Optional[Any]):
+		"""
+		`<subject> <predicate>`. Without a subject, as in "big and not red", the clause continues the previous one.
+		"""
+		for k in range(1, len(tokens)):
+			subject = self._term(tokens[:k])
+			if subject is None:
+				continue
+			expr = self._predicate(subject, tokens[k:])
+			if expr is not None:
+				if self._antecedent is None and not subject.eq(self.x):
+					self._antecedent = subject
+				return expr, subject
+		if previous is None:
+			return None
+		if tokens in ([tokens[-1]], ['not', tokens[-1]]):
+			tokens = ['is'] + tokens # bare adjective
+		expr = self._predicate(previous, tokens)
+		return (expr, previous) if expr is not None else None
+
+	def _conjunction(self, text: str):
+		exprs = []
+		previous = None
+		for part in text.replace(',', ' ').split(' and '):
+			parsed = self._clause(part.split(), previous)
+			if parsed is None:
+				return None
+			expr, previous = parsed
+			exprs.append(expr)
+		return exprs
+
+	def compile(self, sentence: str):
+		"""
+		Translate a sentence, without the final period, into a z3 expression.
+
+		Returns:
+			`None` if the sentence cannot be parsed.
+		"""
+		from z3 import And, ForAll, Implies
+
+		self._reset()
+		match = re.fullmatch(r'[Ii]f (.+?),? then (.+)', sentence)
+		if match:
+			conditions = self._conjunction(match.group(1))
+			conclusions = self._conjunction(match.group(2)) if conditions is not None else None
+		elif match := re.fullmatch(r'(?:[Aa]ll )?([A-Za-z]+(?:,? (?:and )?[a-z]+)*) (?:things|people) (.+)', sentence):
+			adjectives = [a for a in match.group(1).lower().replace(',', ' ').split() if a != 'and']
+			if not all(_is_word(a) for a in adjectives):
+				return None
+			self.uses_variable = True
+			conditions = [self._attribute(a)(self.x) for a in adjectives]
+			conclusions = self._conjunction('something ' + match.group(2))
+		else:
+			facts = self._conjunction(sentence)
+			if facts is None or self.uses_variable:
+				return None
+			return And(*facts) if len(facts) > 1 else facts[0]
+
+		if conditions is None or conclusions is None:
+			return None
+		condition = And(*conditions) if len(conditions) > 1 else conditions[0]
+		conclusion = And(*conclusions) if len(conclusions) > 1 else conclusions[0]
+		if self.uses_variable:
+			return ForAll([self.x], Implies(condition, conclusion))
+		return Implies(condition, conclusion)
+
+def compile_theory(
+	entry: "Entry",
+	**kwargs,
+) -> "Logic":
+	"""
+	Compile a record into a `Logic` instance without the LLM,
+	with the sentences of the theory as claims and the questions as assertions.
+	Only open-world semantics are supported.
+
+	Raises:
+		TheoryParseError: if some sentences cannot be parsed.
+	"""
+	from z3_utils import Logic
+
+	compiler = TheoryCompiler()
+	claims: list[tuple[str, Any]] = []
+	assertions: list[tuple[str, Any]] = []
+	unparsed: list[str] = []
+	for sentence in _split_sentences(entry['theory']):
+		expr = compiler.compile(sentence)
+		if expr is None:
+			unparsed.append(sentence)
+		else:
+			claims.append((sentence + '.', expr))
+	for q in entry['questions']:
+		sentence = q['question'].strip().rstrip('.')
+		expr = compiler.compile(sentence)
+		if expr is None:
+			unparsed.append(sentence)
+		else:
+			assertions.append((sentence + '.', expr))
+	if unparsed:
+		raise TheoryParseError(unparsed)
+
+	l = Logic(**kwargs)
+	l.claims = claims
+	l.assertions = assertions
+	return l
+
+def partition_by_parser(
+	source: "Iterable[Entry]",
+) -> tuple[list[int], list[int]]:
+	"""
+	Returns:
+		(indices of records `compile_theory` can handle, indices of records left for the LLM)
+	"""
+	compiled: list[int] = []
+	fallback: list[int] = []
+	for i, entry in enumerate(source):
+		try:
+			compile_theory(entry)
+			compiled.append(i)
+		except TheoryParseError:
+			fallback.append(i)
+	return compiled, fallback
+
+def check_rule_based(
+	source: "Sequence[Entry]",
+	allow_unknown: bool = False,
+	logger: Logger = getLogger(__name__),
+	**kwargs,
+):
+	"""
+	Check records compiled by `compile_theory` in process, as a fast path and a gold reference for LLM translations.
+
+	Returns:
+		(correct, wrong, failed, total) of the compiled records, and indices of the records left for the LLM.
+	"""
+	from z3.z3 import unknown
+
+	correct = wrong = failed = total = 0
+	fallback: list[int] = []
+	for i, entry in enumerate(source):
+		try:
+			logic = compile_theory(entry, logger=logger, **kwargs)
+		except TheoryParseError as e:
+			logger.debug('Leaving %s for the LLM. %s', entry['id'], e)
+			fallback.append(i)
+			continue
+		try:
+			results = logic.judge()
+		except AssertionError as e: # paradox claims
+			logger.error('Failed to judge %s: %s', entry['id'], e)
+			results = [unknown]
+		c, w, f, t = check_result(results, entry, allow_unknown, logger)
+		correct += c
+		wrong += w
+		failed += f
+		total += t
+	logger.info('Compiled %d records, left %d for the LLM.', len(source) - len(fallback), len(fallback))
+	return (correct, wrong, failed, total), fallback
+
+def generate_fallback_prompts(
+	data_path: str,
+	s: Optional[slice] = None,
+) -> tuple[list[str], list[str]]:
+	"""
+	Prompts and ids of only the records `compile_theory` cannot handle.
+	"""
+	data = get_data(data_path, lazy=True)
+	if s:
+		data = data[s]
+	_, fallback = partition_by_parser(data)
+	entries = [data[i] for i in fallback]
+	return [generate_prompt(entry) for entry in entries], [entry['id'] for entry in entries]
@@ -1,9 +1,12 @@
 from typing import Any, Callable, Literal, Optional, Sequence, TypedDict, overload
 
+import hashlib
 from logging import Logger, getLogger
+import os
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+	import pandas as pd
 	from z3 import CheckSatResult
 
 class RevealRecord(TypedDict):
@@ -16,18 +19,84 @@ class RevealRecord(TypedDict):
 	answer_is_fully_attributable: bool
 	answer_is_fully_attributable_and_correct: bool
 
+_DTYPES = {
+	# Boolean labels are left to inference, like the other columns of the CSV.
+	"answer_id": str,
+	"question_id": str,
+	"dataset": str,
+	"question": str,
+	"full_answer": str,
+}
+
+_frames: "dict[tuple[str, int], pd.DataFrame]" = {}
+
+def _read_frame(
+	data_path: str,
+	cache_dir: Optional[str],
+	logger: Logger,
+) -> "pd.DataFrame":
+	"""
+	Read the `RevealRecord` columns of a REVEAL CSV, deduplicated by `answer_id`.
+	The frame is memoized in process, and snapshotted to `cache_dir`, both keyed on file mtime.
+	"""
+	import pandas as pd
+
+	path = os.path.abspath(data_path)
+	mtime = os.stat(path).st_mtime_ns
+	df = _frames.get((path, mtime))
+	if df is not None:
+		return df
+
+	snapshot = None
+	if cache_dir:
+		key = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+		prefix = f'{os.path.splitext(os.path.basename(path))[0]}-{key}-'
+		snapshot = os.path.join(cache_dir, f'{prefix}{mtime}.pkl')
+		if os.path.exists(snapshot):
+			logger.debug('Loading snapshot %s.', snapshot)
+			df = pd.read_pickle(snapshot)
+
+	if df is None:
+		df = pd.read_csv(
+			path,
+			encoding='utf-8',
+			usecols=list(RevealRecord.__annotations__.keys()),
+			dtype=_DTYPES, # type: ignore
+		)
+		df = df[[k for k in RevealRecord.__annotations__.keys()]]
+		df = df.drop_duplicates(['answer_id'])
+		df['dataset'] = df['dataset'].astype('category')
+
+		if snapshot and cache_dir:
+			os.makedirs(cache_dir, exist_ok=True)
+			for name in os.listdir(cache_dir):
+				if name.startswith(prefix): # stale snapshots of the same file
+					os.remove(os.path.join(cache_dir, name))
+			df.to_pickle(snapshot)
+			logger.debug('Saved snapshot %s.', snapshot)
+
+	_frames[(path, mtime)] = df
+	return df
+
 def get_data(
 	data_path = 'data/reveal/eval/reveal_eval.csv',
 	filter: Optional[Callable[[RevealRecord], bool]] = None,
+	*,
+	datasets: Optional[Sequence[str]] = None,
+	cache_dir: Optional[str] = 'cache/reveal',
+	logger: Logger = getLogger(__name__),
 ) -> Sequence[RevealRecord]:
-	import pandas as pd
-
-	df = pd.read_csv(data_path, encoding='utf-8')
-
-	df = df[[k for k in RevealRecord.__annotations__.keys()]]
-	df = df.drop_duplicates(['answer_id'])
-
-	d = df.to_dict(orient='records')
+	"""
+	Args:
+		filter: filter applied to each record after materialization.
+		datasets: keep only these datasets, e.g. `['strategy_qa']`, before materialization.
+		cache_dir: directory of the binary snapshots, `None` to always read the CSV.
+	"""
+	df = _read_frame(data_path, cache_dir, logger)
+	if datasets is not None:
+		df = df[df['dataset'].isin(datasets)]
+
+	d = df.astype({"dataset": str}).to_dict(orient='records')
 
 	return [
 		r for r in d if filter is None or filter(r) # type: ignore
@@ -40,6 +109,8 @@ def generate_prompt(record: RevealRecord):
 def generate_prompts(
 	data_path = 'data/reveal/eval/reveal_eval.csv',
 	filter: Optional[Callable[[RevealRecord], bool]] = None,
+	*,
+	datasets: Optional[Sequence[str]] = None,
 ) -> list[str]:
 	...
 
@@ -49,6 +120,7 @@ def generate_prompts(
 	filter: Optional[Callable[[RevealRecord], bool]] = None,
 	*,
 	return_ids: Literal[True],
+	datasets: Optional[Sequence[str]] = None,
 ) -> tuple[list[str], list[str]]:
 	...
 
@@ -57,11 +129,12 @@ def generate_prompts(
 	filter: Optional[Callable[[RevealRecord], bool]] = None,
 	*,
 	return_ids = False,
+	datasets: Optional[Sequence[str]] = None,
 ):
 	prompts: list[str] = []
 	ids: list[str] = []
 
-	for record in get_data(data_path, filter):
+	for record in get_data(data_path, filter, datasets=datasets):
 		prompts.append(generate_prompt(record))
 		if return_ids:
 			ids.append(record['answer_id'])
@@ -71,6 +144,18 @@ def generate_prompts(
 	else:
 		return prompts
 
+def get_labels(record: RevealRecord) -> list[str]:
+	return [str(record['answer_is_logically_correct'])]
+
+def get_prediction(verdict: bool | str) -> str:
+	"""
+	Label predicted by a journaled verdict, `sat` counts as `False`, `unsat` and `unknown` are kept as is.
+	"""
+	return 'False' if verdict == 'sat' else str(verdict)
+
+def get_split(record: RevealRecord) -> str:
+	return record['dataset']
+
 def _result_equal(
 	judge_result: "bool | CheckSatResult",
 	answer: bool
@@ -107,3 +192,29 @@ def check_result(
 	else:
 		logger.warning('WA: %s: %s - %s', data['answer_id'], result, data['answer_is_logically_correct'])
 		return 0, 1, 0, 1
+
+STEP_LABELS = {
+	"True": 'entailed',
+	"False": 'contradicted',
+	"sat": 'unsupported',
+	"unsat": 'paradox',
+	"unknown": 'unknown',
+}
+
+def label_steps(results: "list[bool | CheckSatResult]") -> list[str]:
+	"""
+	Validity labels of the steps, from the verdicts of `Logic.judge_steps` without the final assertion.
+	"""
+	return [STEP_LABELS[str(result)] for result in results[:-1]]
+
+def check_step_result(
+	results: "list[bool | CheckSatResult]",
+	data: RevealRecord,
+	logger: Logger = getLogger(__name__),
+) -> tuple[Literal[0, 1], Literal[0, 1], Literal[0, 1], Literal[1]]:
+	"""
+	`check_result` of the verdicts of `Logic.judge_steps`, i.e. step verdicts followed by the final assertion.
+	"""
+	if len(results) > 1:
+		logger.info('Steps of %s: %s', data['answer_id'], label_steps(results))
+	return check_result(results[-1:], data, logger)
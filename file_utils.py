@@ -4,3 +4,15 @@ import stat
 def set_file_read_only(file_path: str):
     current_permissions = os.stat(file_path).st_mode
     os.chmod(file_path, current_permissions & ~stat.S_IWUSR)
+
+def set_file_writable(file_path: str):
+    current_permissions = os.stat(file_path).st_mode
+    os.chmod(file_path, current_permissions | stat.S_IWUSR)
+
+def append_line(file, line: str):
+    """
+    Append a line and make it durable, so that an interrupted run keeps every finished line.
+    """
+    file.write(line + '\n')
+    file.flush()
+    os.fsync(file.fileno())
@@ -1,13 +1,21 @@
-from typing import Any, Coroutine, Iterable, Literal, Sequence, Optional, Unpack, overload
+from typing import IO, Any, Awaitable, Callable, Iterable, Literal, Sequence, Optional, Unpack, overload
 
 import anthropic
 import asyncio
 import json
 from logging import Logger, getLogger
+import os
+import time
 from tqdm.auto import tqdm
 
-from file_utils import set_file_read_only
+from file_utils import append_line, set_file_read_only, set_file_writable
+from .batch_writer import ANTHROPIC_LIMITS, ShardedBatchWriter, format_custom_id, get_custom_id_key, read_requests
+from .cache import get_demos_hash, get_response_cache, make_key
+from .clients import get_client
+from .prompt_cache import get_cached_prompt, get_demo_boundaries, log_usage, min_cacheable_tokens, summarize_usage
 from .prompting import get_demos
+from .rate_limit import RateLimiter, estimate_tokens, get_rate_limiter
+from .stream import STOP_SEQUENCE, SyntaxMonitor, read_anthropic_stream
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -27,40 +35,22 @@ if TYPE_CHECKING:
 		max_tokens: NotRequired[int] # type: ignore
 		model: NotRequired[str] # type: ignore
 
-def _get_anthropic_messages(
-	demos: "Sequence[Sequence[Message]]",
-) -> "Sequence[BetaMessageParam]":
-	messages: "Sequence[BetaMessageParam]" = []
-
-	for message_pair in demos:
-		for message in message_pair:
-			messages.append({
-				"role": message["role"],
-				"content": message["content"],
-			})
-
-	l = len(messages)
-	if l == 0:
-		return []
-
-	for i in range(0, l, 2):
-		if i >= 2 * 3:
-			break
-		j = -i - 1
-		assert messages[j]["role"] == 'assistant'
-		content = messages[j]["content"]
-		assert isinstance(content, str)
-		messages[j]["content"] = [
-			{
-				"type": 'text',
-				"text": content,
-				"cache_control": {
-					"type": 'ephemeral'
-				}
-			}
-		]
-
-	return messages
+def _get_cached_prompt(
+	model: str,
+	demos_path = 'demos/common.py',
+	additional_path: Optional[str] = None,
+	replace: bool = False,
+) -> "tuple[list[BetaTextBlockParam], list[BetaMessageParam]]":
+	"""
+	System blocks and demo messages of a demos file, with prompt cache breakpoints planned by `get_cached_prompt`.
+	"""
+	system, messages = get_demos(file_path=demos_path, additional_path=additional_path, replace=replace)
+	return get_cached_prompt(
+		system,
+		messages,
+		get_demo_boundaries(demos_path, additional_path, replace),
+		min_tokens=min_cacheable_tokens(model),
+	)
 
 @overload
 def _get_anthropic_client(
@@ -84,59 +74,42 @@ def _get_anthropic_client(
 	*,
 	asynchronous=False,
 ):
+	"""
+	Client on the connection pool shared by the process, see `clients.get_client`.
+	An asynchronous client has to be requested inside the event loop using it.
+	"""
 	from private.apikey import anthropic_key, anthropic_base_url, anthropic_base_url_nocache
 	base_url = anthropic_base_url if use_cache else anthropic_base_url_nocache
-	Ant = anthropic.Anthropic if not asynchronous else anthropic.AsyncAnthropic
-	return Ant(
-		api_key=anthropic_key.get_secret_value(),
-		base_url=base_url,
-		max_retries=max_retries,
-	)
+	return get_client('anthropic', base_url, anthropic_key.get_secret_value(), max_retries, asynchronous)
 
-def get_requests(
-	job_prefix: str,
-	params: "list[MessageCreateParamsNonStreaming]",
-	custom_ids: Optional[Sequence[str]] = None,
-	base_id = 0,
-) -> "list[Request]":
-	l = len(params)
-	if custom_ids:
-		assert len(custom_ids) == l
-		prefixes = [
-			f"{job_prefix}-{i + base_id :04}({custom_id})"
-			for i, custom_id in enumerate(custom_ids)
-		]
-	else:
-		prefixes = [f"{job_prefix}-{i + base_id :04}" for i in range(l)]
-	return [
+def get_prompt(
+	user: str,
+	msgs: "Sequence[BetaMessageParam]",
+	prefill: Optional[str] = None,
+):
+	prompt: "list[BetaMessageParam]" = [
+		*msgs,
 		{
-			"custom_id": prefixes[i],
-			"params": params[i],
-		} for i in range(l)
+			"role": 'user',
+			"content": user
+		}
 	]
+	if prefill:
+		prompt.append({
+			"role": 'assistant',
+			"content": prefill
+		})
+	return prompt
 
 def get_prompts(
 	user_prompts: "Sequence[str]",
 	msgs: "Sequence[BetaMessageParam]",
 	prefill: Optional[str] = None,
 ):
-	prompts: "list[list[BetaMessageParam]]" = []
-	for user in user_prompts:
-		prompt: "list[BetaMessageParam]" = [
-			*msgs,
-			{
-				"role": 'user',
-				"content": user
-			}
-		]
-		if prefill:
-			prompt.append({
-				"role": 'assistant',
-				"content": prefill
-			})
-		prompts.append(prompt)
-
-	return prompts
+	return [
+		get_prompt(user, msgs, prefill)
+		for user in user_prompts
+	]
 
 def generate_batch(
 	user_prompts: "Sequence[str]",
@@ -152,54 +125,68 @@ def generate_batch(
 	max_tokens: int = 2048,
 	temperature: float = 0,
 	top_p: float = 1,
+	output_dir: str = 'data/anthropic_batch_request',
+	max_requests: int = ANTHROPIC_LIMITS[0],
+	max_bytes: int = ANTHROPIC_LIMITS[1],
+	cached_output: Optional[str] = None,
+	logger: Logger = getLogger(__name__),
 	**kwargs: "Unpack[MessageCreateParameters]", # type: ignore
-):
-	system, messages = get_demos(file_path=demos_path, additional_path=additional_path, replace=replace)
-	msgs = _get_anthropic_messages(messages)
-	prompts = get_prompts(user_prompts, msgs, prefill)
-
-	top = base_id + min(size, len(prompts) - base_id)
-	requests = get_requests(
-		job_prefix = job_prefix,
-		custom_ids = custom_ids[base_id:top] if custom_ids else None,
-		base_id = base_id,
-		params = [
-			{
-				"model": model,
-				"system": [
-					{
-						"type": 'text',
-						"text": system,
-						"cache_control": {
-							"type": 'ephemeral'
-						},
-					}
-				],
-				"messages": prompt,
-				"max_tokens": max_tokens,
-				"temperature": temperature,
-				"top_p": top_p,
-				**kwargs,
+) -> list[str]:
+	"""
+	Stream requests of `user_prompts[base_id:base_id + size]` into batch files,
+	sharded on the request count and size limits of the Message Batches API.
+
+	Args:
+		cached_output: answer prompts from the shared response cache instead of requesting them,
+			and write their results to this file in the batch result format.
+			Check the downloaded results with `indices_from_ids`, as the skipped prompts leave gaps in the shards.
+
+	Returns:
+		paths of the shards, listed in a manifest next to them.
+	"""
+	system, msgs = _get_cached_prompt(model, demos_path, additional_path, replace)
+	cache = get_response_cache() if cached_output is not None else None
+	demos_hash = get_demos_hash(system, msgs)
+	params = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p, **kwargs}
+
+	top = min(base_id + size, len(user_prompts))
+	cached = 0
+	with ShardedBatchWriter(output_dir, job_prefix, base_id, max_requests, max_bytes) as writer, \
+		open(cached_output or os.devnull, 'w', encoding='utf-8') as cached_file:
+		for i in range(base_id, top):
+			custom_id = format_custom_id(job_prefix, i, custom_ids[i] if custom_ids else None)
+			if cache is not None:
+				message = cache.get(make_key('anthropic', model, get_prompt(user_prompts[i], [], prefill), params, demos_hash=demos_hash))
+				if message is not None:
+					print(json.dumps({"custom_id": custom_id, "result": {"type": 'succeeded', "message": message}}), file=cached_file)
+					cached += 1
+					continue
+			request: "Request" = {
+				"custom_id": custom_id,
+				"params": {
+					"model": model,
+					"system": system,
+					"messages": get_prompt(user_prompts[i], msgs, prefill),
+					**params, # type: ignore
+				},
 			}
-			for prompt in prompts[base_id:top]
-		],
-	)
-
-	outfile = f'data/anthropic_batch_request/{job_prefix}-{base_id:04}-{top:04}.jsonl'
-	with open(outfile, 'w', encoding='utf-8') as file:
-		for request in requests:
-			print(json.dumps(request), file=file)
+			writer.write(request, i)
 
-	set_file_read_only(outfile)
-	return requests
+	if cached_output is not None:
+		logger.info('%d prompts answered from the response cache, written to %s.', cached, cached_output)
+	return writer.paths
 
 def submit_batch(
-	requests: "list[Request]",
+	requests: "str | Iterable[Request]",
 ):
+	"""
+	Args:
+		requests: a batch file written by `generate_batch`, or the requests.
+	"""
 	client = _get_anthropic_client(use_cache=False)
 
 	return client.beta.messages.batches.create(
-		requests=requests,
+		requests=read_requests(requests) if isinstance(requests, str) else requests, # type: ignore
 		betas=['prompt-caching-2024-07-31'],
 	)
 
@@ -239,7 +226,7 @@ def save_batch_results(
 	assert r.processing_status == 'ended', f'Status: {r.processing_status}'
 	_results = client.beta.messages.batches.results(batch_id)
 	results = list(_results)
-	results.sort(key = lambda r: r.custom_id)
+	results.sort(key = lambda r: get_custom_id_key(r.custom_id))
 	with open(output_file, 'w', encoding='utf-8') as file:
 		for result in results:
 			print(result.to_json(indent=None), file=file)
@@ -251,16 +238,7 @@ async def hit_cache(
 	*,
 	interval: int = 240,
 ):
-	msgs = _get_anthropic_messages(messages)
-	sys: "Iterable[BetaTextBlockParam]" = [
-		{
-			"type": 'text',
-			"text": system,
-			"cache_control": {
-				"type": 'ephemeral'
-			},
-		}
-	]
+	sys, msgs = get_cached_prompt(system, messages, min_tokens=min_cacheable_tokens(model))
 
 	client = _get_anthropic_client(use_cache=False, asynchronous=True)
 
@@ -283,6 +261,116 @@ async def hit_cache(
 
 	print(f'Break. Hit {i} times.')
 
+def sort_indexed_lines(output_file: str):
+	"""
+	Put lines tagged with `index` back in order.
+	"""
+	with open(output_file, 'r', encoding='utf-8') as file:
+		lines = [line for line in file if line.strip()]
+	lines.sort(key=lambda line: json.loads(line)['index'])
+	with open(output_file, 'w', encoding='utf-8') as file:
+		file.writelines(lines)
+
+def read_completed(
+	output_file: str,
+	logger: Logger = getLogger(__name__),
+) -> dict[str, dict]:
+	"""
+	Successful responses of an output file written by `batch_request_async`, keyed by custom id.
+	Error lines and a truncated last line are skipped.
+	"""
+	completed: dict[str, dict] = {}
+	with open(output_file, 'r', encoding='utf-8') as file:
+		for n, line in enumerate(file):
+			if not line.strip():
+				continue
+			try:
+				j = json.loads(line)
+			except json.JSONDecodeError:
+				logger.warning('Skipping malformed line %d of %s.', n, output_file)
+				continue
+			if 'error' not in j:
+				completed[j.get('custom_id', str(j.get('index', n)))] = j
+	return completed
+
+def _report_latency(
+	latencies: "Sequence[float]",
+	elapsed: float,
+	logger: Logger,
+):
+	if not latencies:
+		return
+	ordered = sorted(latencies)
+	logger.info(
+		'%d requests in %.1f seconds, %.2f requests/s; latency mean %.2fs, p50 %.2fs, p95 %.2fs, max %.2fs.',
+		len(ordered), elapsed, len(ordered) / elapsed if elapsed else float('nan'),
+		sum(ordered) / len(ordered), ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], ordered[-1],
+	)
+
+async def _create_raw(
+	client: anthropic.AsyncAnthropic,
+	limiter: RateLimiter,
+	reserved: float,
+	max_rate_limit_retries: int,
+	**params,
+):
+	"""
+	Send a request paced by `limiter`, retrying rate-limited and overloaded requests.
+	`client` should not retry by itself (`max_retries=0`), so that every attempt is paced.
+
+	Returns:
+		raw response, and latency of the successful attempt in seconds.
+	"""
+	for retry in range(max_rate_limit_retries + 1):
+		await limiter.acquire_async(reserved)
+		start = time.perf_counter()
+		try:
+			raw = await client.beta.messages.with_raw_response.create(**params)
+			break
+		except anthropic.APIStatusError as e:
+			limiter.settle(reserved, 0)
+			if e.status_code not in (429, 529) or retry == max_rate_limit_retries: # rate limited, overloaded
+				raise
+			limiter.on_rate_limited(e.response.headers)
+	limiter.update(raw.headers)
+	return raw, time.perf_counter() - start
+
+async def _create_message(
+	client: anthropic.AsyncAnthropic,
+	limiter: RateLimiter,
+	reserved: float,
+	max_rate_limit_retries: int,
+	**params,
+) -> "tuple[BetaMessage, float]":
+	"""
+	Create a message, see `_create_raw`.
+	"""
+	raw, latency = await _create_raw(client, limiter, reserved, max_rate_limit_retries, **params)
+	result: "BetaMessage" = raw.parse()
+	limiter.settle(reserved, result.usage.input_tokens + result.usage.output_tokens)
+	return result, latency
+
+async def _stream_message(
+	client: anthropic.AsyncAnthropic,
+	limiter: RateLimiter,
+	reserved: float,
+	max_rate_limit_retries: int,
+	prefill: Optional[str] = None,
+	**params,
+) -> "tuple[dict, float]":
+	"""
+	Stream a message stopping at `return l`, and abort it on irrecoverable syntax, see `SyntaxMonitor`.
+
+	Returns:
+		message, and latency until the end of the stream in seconds.
+	"""
+	stop_sequences = [*params.pop('stop_sequences', []), STOP_SEQUENCE]
+	raw, latency = await _create_raw(client, limiter, reserved, max_rate_limit_retries, stream=True, stop_sequences=stop_sequences, **params)
+	start = time.perf_counter()
+	message = await read_anthropic_stream(raw.parse(), SyntaxMonitor(prefill))
+	limiter.settle(reserved, message['usage']['input_tokens'] + message['usage']['output_tokens'])
+	return message, latency + time.perf_counter() - start
+
 async def batch_request_async(
 	user_prompts: "Sequence[str]",
 	model: str,
@@ -295,50 +383,219 @@ async def batch_request_async(
 	top_p: float = 1,
 	prefill: Optional[str] = None,
 	max_concurrency: int = 2,
+	rate_limiter: Optional[RateLimiter] = None,
+	max_rate_limit_retries: int = 8,
+	custom_ids: Optional[Sequence[str]] = None,
+	resume: bool = False,
+	use_response_cache: bool = True,
+	on_response: Optional[Callable[[int, dict], Any]] = None,
+	stream: bool = False,
+	logger: Logger = getLogger(__name__),
 	**kwargs,
 ):
-	system, messages = get_demos(file_path=demos_path, additional_path=additional_path, replace=replace)
-	msgs = _get_anthropic_messages(messages)
-	prompts = get_prompts(user_prompts, msgs, prefill)
-
-	client = _get_anthropic_client(asynchronous=True)
+	"""
+	Request the prompts online, keeping `max_concurrency` requests in flight.
+	The first request is sent alone to warm up the prompt cache.
+	Requests are paced by `rate_limiter`, by default the one shared by all clients of the model,
+	which adapts to the rate-limit headers and pauses on 429 and overload responses.
+
+	Each response is appended and synced as soon as it arrives, tagged with the `index` and `custom_id` of its prompt,
+	and the output file is sorted by index at the end. A failed request is written as an error line instead.
+	The file is made read-only only if every request succeeded.
+
+	Args:
+		custom_ids: ids of the prompts, defaults to indices.
+		resume: keep the successful responses in `output_file`, and request only the missing or failed ones.
+		use_response_cache: answer prompts from the shared response cache, and store new responses in it.
+			Disable it to sample new responses to already answered prompts.
+		on_response: called with the index and message of each successful response as soon as it is available,
+			including resumed and cached ones, e.g. `VerificationPipeline.submit`.
+		stream: stream the responses, stopping at `return l` and aborting on irrecoverable syntax.
+			Aborted responses are saved with `stop_reason` `aborted`, and are not cached.
+	"""
+	system, msgs = _get_cached_prompt(model, demos_path, additional_path, replace)
+
+	client = _get_anthropic_client(max_retries=0, asynchronous=True)
+	limiter = rate_limiter or get_rate_limiter(f'anthropic/{model}')
+	demo_tokens = estimate_tokens(json.dumps(system) + json.dumps(msgs))
+	semaphore = asyncio.Semaphore(max_concurrency)
+	results: "list[Optional[BetaMessage | dict]]" = [None] * len(user_prompts)
+	latencies: list[float] = []
+	usages: list[dict] = []
+	failed: list[int] = []
+	cache = get_response_cache() if use_response_cache else None
+	demos_hash = get_demos_hash(system, msgs)
+	params = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p, **kwargs}
+	keys = [
+		make_key('anthropic', model, get_prompt(user, [], prefill), params, demos_hash=demos_hash)
+		for user in user_prompts
+	] if cache is not None else []
+
+	ids = list(custom_ids) if custom_ids is not None else [str(i) for i in range(len(user_prompts))]
+	assert len(ids) == len(user_prompts), f'len(custom_ids) ({len(ids)}) does not match len(user_prompts) ({len(user_prompts)}).'
+	completed: dict[str, dict] = {}
+	if resume and os.path.exists(output_file):
+		set_file_writable(output_file)
+		indices = {id: i for i, id in enumerate(ids)}
+		completed = {
+			id: {"index": indices[id], "custom_id": id, **j}
+			for id, j in read_completed(output_file, logger).items()
+			if id in indices
+		}
+		# Compact, dropping error lines and a truncated last line before appending.
+		with open(output_file, 'w', encoding='utf-8') as file:
+			for j in completed.values():
+				print(json.dumps(j), file=file)
+	pending = [i for i in range(len(user_prompts)) if ids[i] not in completed]
+	for i in range(len(user_prompts)):
+		results[i] = completed.get(ids[i])
+		if on_response is not None and ids[i] in completed:
+			on_response(i, completed[ids[i]])
+	logger.info('Requesting %d prompts, %d already completed.', len(pending), len(user_prompts) - len(pending))
+
+	async def request(i: int, file: "IO[str]", pbar: tqdm):
+		try:
+			await _request(i, file)
+		except Exception as e:
+			failed.append(i)
+			logger.error('Request #%d (%s) failed: %s', i, ids[i], e)
+			append_line(file, json.dumps({
+				"index": i,
+				"custom_id": ids[i],
+				"error": {
+					"type": e.__class__.__name__,
+					"message": str(e),
+				},
+			}))
+		pbar.update()
 
-	coros: "list[Coroutine[Any, Any, BetaMessage]]" = [
-		client.beta.messages.create(
+	async def _request(i: int, file: "IO[str]"):
+		reserved = demo_tokens + estimate_tokens(user_prompts[i]) + max_tokens
+		params = dict(
 			max_tokens=max_tokens,
-			messages=message,
+			messages=get_prompt(user_prompts[i], msgs, prefill),
 			model=model,
-			system=[{
-				"type": 'text',
-				"text": system,
-				"cache_control": {
-					"type": 'ephemeral'
-				},
-			}],
+			system=system,
 			temperature=temperature,
 			top_p=top_p,
 			**kwargs
 		)
-		for message in prompts
-	]
-
-	results = []
-
-	with open(output_file, 'w', encoding='utf-8') as file, tqdm(total=len(prompts)) as pbar:
-		r0 = await coros[0]
-		pbar.update()
-		results.append(r0)
-		print(r0.to_json(indent=None), file=file)
-		for i in range(1, len(prompts), max_concurrency):
-			tasks = [
-				asyncio.create_task(coros[j])
-				for j in range(i, min(i + max_concurrency, len(prompts)))
-			]
+		async with semaphore:
+			if stream:
+				message, latency = await _stream_message(client, limiter, reserved, max_rate_limit_retries, prefill, **params)
+				results[i] = message
+			else:
+				result, latency = await _create_message(client, limiter, reserved, max_rate_limit_retries, **params)
+				results[i] = result
+				message = json.loads(result.to_json(indent=None))
+			latencies.append(latency)
+		usages.append(message['usage'])
+		if message['stop_reason'] == 'aborted':
+			logger.warning('Response #%d (%s) aborted: %s', i, ids[i], message['abort_reason'])
+		elif cache is not None:
+			cache.put(keys[i], 'anthropic', model, message)
+		append_line(file, json.dumps({"index": i, "custom_id": ids[i], **message}))
+		if on_response is not None:
+			on_response(i, message)
+
+	start = time.perf_counter()
+	with open(output_file, 'a' if resume else 'w', encoding='utf-8') as file:
+		if cache is not None:
+			uncached = []
+			for i in pending:
+				message = cache.get(keys[i])
+				if message is None:
+					uncached.append(i)
+					continue
+				results[i] = {"index": i, "custom_id": ids[i], **message}
+				print(json.dumps(results[i]), file=file)
+				if on_response is not None:
+					on_response(i, message)
+			file.flush()
+			logger.info('%d prompts answered from the response cache.', len(pending) - len(uncached))
+			pending = uncached
+		pbar = tqdm(total=len(pending))
+		if pending:
+			await request(pending[0], file, pbar)
+		tasks = [
+			asyncio.create_task(request(i, file, pbar))
+			for i in pending[1:]
+		]
+		try:
+			await asyncio.gather(*tasks)
+		finally:
 			for task in tasks:
-				result = await task
-				pbar.update()
-				results.append(result)
-				print(result.to_json(indent=None), file=file)
-
-	set_file_read_only(output_file)
+				task.cancel()
+			pbar.close()
+			_report_latency(latencies, time.perf_counter() - start, logger)
+			if usages:
+				log_usage(summarize_usage(usages), logger)
+
+	if cache is not None:
+		cache.log_stats()
+	sort_indexed_lines(output_file)
+	if failed:
+		logger.warning('%d requests failed, rerun with resume=True to retry them.', len(failed))
+	else:
+		set_file_read_only(output_file)
 	return results
+
+def get_sampler(
+	model: str,
+	demos_path = 'demos/common.py',
+	additional_path: Optional[str] = None,
+	replace: bool = False,
+	max_tokens: int = 2048,
+	temperature: float = 1,
+	top_p: float = 1,
+	prefill: Optional[str] = None,
+	max_concurrency: int = 2,
+	rate_limiter: Optional[RateLimiter] = None,
+	max_rate_limit_retries: int = 8,
+	stream: bool = False,
+	**kwargs,
+) -> "Callable[[str, Sequence[tuple[str, str]]], Awaitable[str]]":
+	"""
+	Sampler of candidate responses for `resample`.
+
+	The sampler requests a response to a user prompt, after the previous candidates and their feedback if any,
+	and returns its text with `prefill` prepended.
+
+	Args:
+		stream: see `batch_request_async`, an aborted candidate is returned as is and fails verification.
+	"""
+	from .anthropic_response import get_message_content
+
+	system, msgs = _get_cached_prompt(model, demos_path, additional_path, replace)
+
+	limiter = rate_limiter or get_rate_limiter(f'anthropic/{model}')
+	demo_tokens = estimate_tokens(json.dumps(system) + json.dumps(msgs))
+	semaphore = asyncio.Semaphore(max_concurrency)
+
+	async def sample(user: str, history: "Sequence[tuple[str, str]]"):
+		client = _get_anthropic_client(max_retries=0, asynchronous=True)
+		prompt = get_prompt(user, msgs)
+		for response, feedback in history:
+			prompt.append({"role": 'assistant', "content": response})
+			prompt.append({"role": 'user', "content": feedback})
+		if prefill:
+			prompt.append({"role": 'assistant', "content": prefill})
+		reserved = demo_tokens + estimate_tokens(user + ''.join(r + f for r, f in history)) + max_tokens
+		params = dict(
+			max_tokens=max_tokens,
+			messages=prompt,
+			model=model,
+			system=system,
+			temperature=temperature,
+			top_p=top_p,
+			**kwargs
+		)
+		async with semaphore:
+			if stream:
+				message, _ = await _stream_message(client, limiter, reserved, max_rate_limit_retries, prefill, **params)
+			else:
+				result, _ = await _create_message(client, limiter, reserved, max_rate_limit_retries, **params)
+				message = json.loads(result.to_json(indent=None))
+		return get_message_content(message, prefill)
+
+	return sample
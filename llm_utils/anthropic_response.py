@@ -1,24 +1,49 @@
 from typing import Callable, Optional
 
 import json
+from logging import Logger, getLogger
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
 	from z3.z3 import CheckSatResult
 
-def get_assistant_content(result: str, prefill: Optional[str] = None):
+def get_error(result: str) -> Optional[str]:
+	"""
+	Why the request of a saved response failed, if so:
+	an error line of `batch_request_async`, or a batch result that did not succeed.
+	"""
 	j = json.loads(result)
-	content: list[dict] = j['content']
+	if 'error' in j:
+		return f"{j['error']['type']}: {j['error']['message']}"
+	if 'result' in j and j['result']['type'] != 'succeeded':
+		return j['result']['type']
+	return None
+
+def _raise_error(result: str):
+	error = get_error(result)
+	if error is not None:
+		from .response import ResponseError
+		raise ResponseError(f'Request failed with {error}')
+
+def get_message_content(message: dict, prefill: Optional[str] = None):
+	if 'error' in message:
+		from .response import ResponseError
+		raise ResponseError(f"Request failed with {message['error']['type']}: {message['error']['message']}")
+	content: list[dict] = message['content']
 	assert len(content) == 1
 	text: str = content[0]['text']
 	if prefill:
 		text = prefill + text
 	return text
 
+def get_assistant_content(result: str, prefill: Optional[str] = None):
+	return get_message_content(json.loads(result), prefill)
+
 def get_assistant_batch_content(
 	result: str,
 	prefill: Optional[str] = None,
 ) -> str:
+	_raise_error(result)
 	j = json.loads(result)
 	_result: dict = j['result']
 	message: dict = _result['message']
@@ -29,6 +54,29 @@ def get_assistant_batch_content(
 		text = prefill + text
 	return text
 
+def get_custom_id(result: str) -> str:
+	j = json.loads(result)
+	return j['custom_id']
+
+def _get_id(i: int, result: str) -> str:
+	# Online responses saved before custom ids were added fall back to indices.
+	return json.loads(result).get('custom_id', str(i))
+
+def read_responses(
+	response_file_path: str,
+	batch: bool = False,
+	prefill: Optional[str] = None,
+):
+	from .response import collect_responses
+
+	get_content = get_assistant_batch_content if batch else get_assistant_content
+	with open(response_file_path, 'r', encoding='utf-8') as file:
+		return collect_responses(
+			[line for line in file if line.strip()],
+			(lambda i, line: get_custom_id(line)) if batch else _get_id,
+			lambda line: get_content(line, prefill),
+		)
+
 def check_batch_response(
 	response_file_path: str,
 	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
@@ -37,14 +85,23 @@ def check_batch_response(
 	use_definitions: bool = True,
 	use_common_knowledge: bool = True,
 	sync: bool = False,
+	journal_path: Optional[str] = None,
+	method: str = 'judge',
+	indices_from_ids: bool = False,
+	logger: Logger = getLogger(__name__),
 ):
-	from .response import process_response, check_responses
+	"""
+	Failed requests and responses that cannot be processed are journaled as LLM failures without being checked,
+	so that `retry.get_failed_ids` finds them.
 
-	get_content = get_assistant_batch_content if batch else get_assistant_content
+	Args:
+		indices_from_ids: pass `check_cb` the prompt index in each custom id by `batch_writer.format_custom_id`
+			instead of the line number, e.g. for batches without the prompts answered from the response cache.
+	"""
+	from .batch_writer import get_custom_id_key
+	from .response import check_responses
 
-	with open(response_file_path, 'r', encoding='utf-8') as file:
-		responses = [
-			process_response(get_content(line, prefill))
-			for line in file
-		]
-	return check_responses(responses, check_cb, use_definitions, use_common_knowledge, sync)
+	items = read_responses(response_file_path, batch, prefill)
+	return check_responses([response for _, response in items], check_cb, use_definitions, use_common_knowledge, sync, logger,
+		ids=[id for id, _ in items], journal_path=journal_path, method=method,
+		indices=[get_custom_id_key(id)[0] for id, _ in items] if indices_from_ids else None)
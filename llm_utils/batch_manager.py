@@ -0,0 +1,409 @@
+from typing import Any, Callable, Iterable, Literal, Optional, TypedDict
+
+import json
+from logging import Logger, getLogger
+import os
+import shutil
+import time
+
+from .batch_writer import get_custom_id_key, read_manifest, read_requests
+from .cache import ResponseCache, cache_batch_results
+
+_logger = getLogger(__name__)
+
+BatchStatus = Literal['submitted', 'ended', 'downloaded', 'checked', 'failed']
+
+class BatchRecord(TypedDict):
+	id: str
+	provider: str
+	input_path: Optional[str]
+	output_path: str
+	first: int
+	"""
+	index of the first request in the prompts, to offset check callbacks
+	"""
+	status: BatchStatus
+	provider_status: Optional[str]
+	progress: Optional[dict[str, int]]
+	submitted_at: float
+	ended_at: Optional[float]
+	next_poll_at: float
+	interval: float
+	error: Optional[str]
+	result: Any
+	"""
+	return value of `on_ended`
+	"""
+
+class ProviderStatus(TypedDict):
+	status: str
+	ended: bool
+	progress: dict[str, int]
+
+class BatchProvider:
+	"""
+	Adapter of a batch API.
+	"""
+	name: str
+	style: Literal['openai', 'anthropic']
+	"""
+	format of the requests and results
+	"""
+
+	def submit(self, input_path: str) -> str:
+		"""
+		Returns:
+			batch id.
+		"""
+		raise NotImplementedError
+
+	def retrieve(self, batch_id: str) -> ProviderStatus:
+		raise NotImplementedError
+
+	def download(self, batch_id: str, output_path: str, input_path: Optional[str] = None) -> int:
+		"""
+		Stream the results to `output_path`, sorted by custom id.
+
+		Args:
+			input_path: requests of the batch, to write a placeholder for each request without a result.
+
+		Returns:
+			number of results.
+		"""
+		raise NotImplementedError
+
+def _sort_results(
+	part_path: str,
+	output_path: str,
+	input_path: Optional[str] = None,
+	placeholder: Optional[Callable[[str], dict[str, Any]]] = None,
+):
+	"""
+	Sort result lines by the index in their custom id, so that they line up with the prompts, then move them to `output_path`.
+	If `input_path` and `placeholder` are given, requests without a result get a placeholder line, so that none is shifted.
+	"""
+	with open(part_path, 'r', encoding='utf-8') as file:
+		lines = [line if line.endswith('\n') else line + '\n' for line in file if line.strip()]
+	if input_path is not None and placeholder is not None:
+		found = {json.loads(line)['custom_id'] for line in lines}
+		missing = [request['custom_id'] for request in read_requests(input_path) if request['custom_id'] not in found]
+		if missing:
+			_logger.warning('%d requests without a result, writing placeholders.', len(missing))
+			lines.extend(json.dumps(placeholder(custom_id)) + '\n' for custom_id in missing)
+	lines.sort(key=lambda line: get_custom_id_key(json.loads(line)['custom_id']))
+	with open(output_path, 'w', encoding='utf-8') as file:
+		file.writelines(lines)
+	os.remove(part_path)
+	return len(lines)
+
+def _openai_placeholder(custom_id: str) -> dict[str, Any]:
+	return {
+		"id": None,
+		"custom_id": custom_id,
+		"response": None,
+		"error": {"code": 'missing_result', "message": 'No result in the output or error file of the batch.'},
+	}
+
+class AnthropicBatchProvider(BatchProvider):
+	name = 'anthropic'
+	style = 'anthropic'
+
+	def __init__(self):
+		from .anthropic_request import _get_anthropic_client
+		self.client = _get_anthropic_client(use_cache=False)
+
+	def submit(self, input_path: str):
+		from .anthropic_request import submit_batch
+		return submit_batch(input_path).id
+
+	def retrieve(self, batch_id: str) -> ProviderStatus:
+		r = self.client.beta.messages.batches.retrieve(batch_id)
+		return {
+			"status": r.processing_status,
+			"ended": r.processing_status == 'ended',
+			"progress": r.request_counts.to_dict(),
+		}
+
+	def download(self, batch_id: str, output_path: str, input_path: Optional[str] = None):
+		# Every request has a result, errored and expired ones included.
+		part_path = output_path + '.part'
+		with open(part_path, 'w', encoding='utf-8') as file:
+			for result in self.client.beta.messages.batches.results(batch_id):
+				print(result.to_json(indent=None), file=file)
+		return _sort_results(part_path, output_path)
+
+class OpenAIBatchProvider(BatchProvider):
+	name = 'openai'
+	style = 'openai'
+
+	def __init__(self):
+		from .openai_request import _get_openai_client
+		self.client = _get_openai_client()
+
+	def submit(self, input_path: str):
+		from .openai_request import submit_batch
+		return submit_batch(input_path).id
+
+	def retrieve(self, batch_id: str) -> ProviderStatus:
+		r = self.client.batches.retrieve(batch_id)
+		return {
+			"status": r.status,
+			"ended": r.status in ('completed', 'failed', 'expired', 'cancelled'),
+			"progress": r.request_counts.to_dict() if r.request_counts else {},
+		}
+
+	def download(self, batch_id: str, output_path: str, input_path: Optional[str] = None):
+		"""
+		Merge the output file and the error file, where failed requests are, with placeholders for requests in neither.
+		"""
+		r = self.client.batches.retrieve(batch_id)
+		file_ids = [file_id for file_id in (r.output_file_id, r.error_file_id) if file_id is not None]
+		if not file_ids and input_path is None:
+			raise RuntimeError(f'Batch {batch_id} {r.status} without output.')
+		part_path = output_path + '.part'
+		with open(part_path, 'wb') as file:
+			for file_id in file_ids:
+				for chunk in self.client.files.content(file_id).iter_bytes():
+					file.write(chunk)
+				file.write(b'\n')
+		return _sort_results(part_path, output_path, input_path, _openai_placeholder)
+
+class LocalBatchProvider(BatchProvider):
+	"""
+	In-process stand-in of a batch API, answering each request with `respond` once `latency` seconds passed.
+
+	Results are in the OpenAI or Anthropic batch output format, so that they can be checked like real ones.
+	"""
+	name = 'local'
+
+	def __init__(self,
+		respond: Callable[[dict[str, Any]], str],
+		style: Literal['openai', 'anthropic'] = 'openai',
+		latency: float = 0,
+		work_dir: str = 'data/local_batch',
+	):
+		self.respond = respond
+		self.style = style
+		self.latency = latency
+		self.work_dir = work_dir
+		self._submitted: dict[str, float] = {}
+
+	def submit(self, input_path: str):
+		os.makedirs(self.work_dir, exist_ok=True)
+		batch_id = f'local-{time.time_ns()}'
+		shutil.copyfile(input_path, os.path.join(self.work_dir, batch_id + '.jsonl'))
+		self._submitted[batch_id] = time.time()
+		return batch_id
+
+	def retrieve(self, batch_id: str) -> ProviderStatus:
+		ended = time.time() - self._submitted[batch_id] >= self.latency
+		return {
+			"status": 'ended' if ended else 'in_progress',
+			"ended": ended,
+			"progress": {},
+		}
+
+	def _result(self, request: dict[str, Any]) -> dict[str, Any]:
+		text = self.respond(request)
+		if self.style == 'anthropic':
+			return {
+				"custom_id": request['custom_id'],
+				"result": {
+					"type": 'succeeded',
+					"message": {"role": 'assistant', "content": [{"type": 'text', "text": text}]},
+				},
+			}
+		return {
+			"custom_id": request['custom_id'],
+			"response": {
+				"status_code": 200,
+				"body": {"choices": [{"index": 0, "message": {"role": 'assistant', "content": text}}]},
+			},
+		}
+
+	def download(self, batch_id: str, output_path: str, input_path: Optional[str] = None):
+		part_path = output_path + '.part'
+		with open(part_path, 'w', encoding='utf-8') as file:
+			for request in read_requests(os.path.join(self.work_dir, batch_id + '.jsonl')):
+				print(json.dumps(self._result(request)), file=file)
+		return _sort_results(part_path, output_path)
+
+class BatchManager:
+	"""
+	Track submitted batches of several providers in a JSON state file, poll them with adaptive backoff,
+	download the results as soon as a batch ends, and hand them to `on_ended`, e.g. a checker.
+
+	The poll interval of a batch starts at `min_interval`, grows by `backoff` on each poll without progress,
+	and is reset when progress is made. The state file is rewritten after every change,
+	so a restarted manager resumes polling where it left off.
+
+	Downloaded results of batches with a known input are stored in `response_cache`, if given.
+	"""
+	def __init__(self,
+		state_path: str,
+		providers: Iterable[BatchProvider],
+		output_dir: str = 'data/batch_response',
+		on_ended: Optional[Callable[[BatchRecord], Any]] = None,
+		min_interval: float = 30,
+		max_interval: float = 600,
+		backoff: float = 1.5,
+		response_cache: Optional[ResponseCache] = None,
+		logger: Logger = _logger,
+	):
+		self.state_path = state_path
+		self.providers = {provider.name: provider for provider in providers}
+		self.output_dir = output_dir
+		self.on_ended = on_ended
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.backoff = backoff
+		self.response_cache = response_cache
+		self._logger = logger
+		self.batches: dict[str, BatchRecord] = self._load()
+
+	def _load(self) -> dict[str, BatchRecord]:
+		if not os.path.exists(self.state_path):
+			return {}
+		with open(self.state_path, 'r', encoding='utf-8') as file:
+			return json.load(file)
+
+	def save(self):
+		dirname = os.path.dirname(self.state_path)
+		if dirname:
+			os.makedirs(dirname, exist_ok=True)
+		tmp_path = self.state_path + '.tmp'
+		with open(tmp_path, 'w', encoding='utf-8') as file:
+			json.dump(self.batches, file, indent='\t')
+		os.replace(tmp_path, self.state_path)
+
+	def track(self,
+		provider: str,
+		batch_id: str,
+		output_path: Optional[str] = None,
+		input_path: Optional[str] = None,
+		first: int = 0,
+	) -> BatchRecord:
+		"""
+		Track a batch submitted elsewhere.
+		"""
+		assert provider in self.providers, f'Unknown provider {provider}.'
+		if output_path is None:
+			name = os.path.splitext(os.path.basename(input_path))[0] if input_path else batch_id
+			output_path = os.path.join(self.output_dir, name + '.jsonl')
+		now = time.time()
+		record: BatchRecord = {
+			"id": batch_id,
+			"provider": provider,
+			"input_path": input_path,
+			"output_path": output_path,
+			"first": first,
+			"status": 'submitted',
+			"provider_status": None,
+			"progress": None,
+			"submitted_at": now,
+			"ended_at": None,
+			"next_poll_at": now,
+			"interval": self.min_interval,
+			"error": None,
+			"result": None,
+		}
+		self.batches[batch_id] = record
+		self.save()
+		return record
+
+	def submit(self,
+		provider: str,
+		input_path: str,
+		output_path: Optional[str] = None,
+		first: int = 0,
+	) -> BatchRecord:
+		batch_id = self.providers[provider].submit(input_path)
+		self._logger.info('Submitted %s to %s as %s.', input_path, provider, batch_id)
+		return self.track(provider, batch_id, output_path, input_path, first)
+
+	def submit_manifest(self,
+		provider: str,
+		manifest_path: str,
+	):
+		"""
+		Submit every shard listed in a manifest written by `ShardedBatchWriter`.
+		"""
+		return [
+			self.submit(provider, shard['path'], first=shard['first'])
+			for shard in read_manifest(manifest_path)['shards']
+		]
+
+	@property
+	def pending(self):
+		return [record for record in self.batches.values() if record['status'] in ('submitted', 'ended', 'downloaded')]
+
+	def _finish(self, record: BatchRecord):
+		provider = self.providers[record['provider']]
+		if record['status'] == 'ended':
+			os.makedirs(os.path.dirname(record['output_path']) or '.', exist_ok=True)
+			n = provider.download(record['id'], record['output_path'], record['input_path'])
+			record['status'] = 'downloaded'
+			self._logger.info('Downloaded %d results of %s to %s.', n, record['id'], record['output_path'])
+			self.save()
+			if self.response_cache is not None and record['input_path']:
+				cache_batch_results(self.response_cache, provider.style, [record['input_path']], record['output_path'], self._logger)
+		if record['status'] == 'downloaded':
+			if self.on_ended is not None:
+				record['result'] = self.on_ended(record)
+			record['status'] = 'checked'
+			self.save()
+
+	def poll(self, record: BatchRecord):
+		"""
+		Poll a batch once, and finish it if it ended.
+		"""
+		try:
+			if record['status'] == 'submitted':
+				status = self.providers[record['provider']].retrieve(record['id'])
+				progressed = status['progress'] != record['progress']
+				record['provider_status'] = status['status']
+				record['progress'] = status['progress']
+				if status['ended']:
+					record['status'] = 'ended'
+					record['ended_at'] = time.time()
+					self._logger.info('Batch %s ended after %.0f seconds.', record['id'], record['ended_at'] - record['submitted_at'])
+				else:
+					record['interval'] = self.min_interval if progressed else min(record['interval'] * self.backoff, self.max_interval)
+					record['next_poll_at'] = time.time() + record['interval']
+					self._logger.debug('Batch %s %s %s, next poll in %.0f seconds.',
+						record['id'], status['status'], status['progress'], record['interval'])
+				self.save()
+			self._finish(record)
+		except Exception as e:
+			record['error'] = f'{e.__class__.__name__}: {e}'
+			if record['status'] != 'submitted':
+				# Polling errors are retried, failures after the batch ended are not.
+				record['status'] = 'failed'
+			record['next_poll_at'] = time.time() + record['interval']
+			self._logger.error('Batch %s: %s', record['id'], record['error'])
+			self.save()
+		return record
+
+	def poll_due(self):
+		"""
+		Poll batches due for a poll.
+
+		Returns:
+			seconds until the next poll, or `None` if nothing is pending.
+		"""
+		for record in self.pending:
+			if record['next_poll_at'] <= time.time():
+				self.poll(record)
+		pending = self.pending
+		if not pending:
+			return None
+		return max(0., min(record['next_poll_at'] for record in pending) - time.time())
+
+	def run(self):
+		"""
+		Poll until every batch is checked or failed.
+		Runs synchronously, since `on_ended` checkers start their own event loops.
+		"""
+		while (delay := self.poll_due()) is not None:
+			time.sleep(delay)
+		return self.batches
@@ -0,0 +1,178 @@
+from typing import Any, Iterable, Mapping, Optional, TypedDict
+
+import json
+from logging import Logger, getLogger
+import os
+import re
+
+from file_utils import set_file_read_only
+
+_logger = getLogger(__name__)
+
+# (max requests, max bytes) of a batch input
+OPENAI_LIMITS = 50_000, 200 * 1024 * 1024
+ANTHROPIC_LIMITS = 100_000, 256 * 1024 * 1024
+
+class ShardInfo(TypedDict):
+	path: str
+	first: int
+	"""
+	index of the first request in the prompts
+	"""
+	count: int
+	bytes: int
+
+class BatchManifest(TypedDict):
+	job_prefix: str
+	base_id: int
+	top: int
+	shards: list[ShardInfo]
+
+def format_custom_id(
+	job_prefix: str,
+	i: int,
+	custom_id: Optional[str] = None,
+):
+	return f"{job_prefix}-{i:04}({custom_id})" if custom_id else f"{job_prefix}-{i:04}"
+
+_CUSTOM_ID = re.compile(r'^.*?-(\d+)(?:\(.*\))?$', re.DOTALL)
+
+def get_custom_id_key(custom_id: str) -> tuple[int, str]:
+	"""
+	Sort key of a custom id by `format_custom_id`, ordering by the numeric index, as `-10000` sorts before `-9999` as a string.
+	"""
+	match = _CUSTOM_ID.match(custom_id)
+	return (int(match.group(1)) if match else -1), custom_id
+
+class ShardedBatchWriter:
+	"""
+	Write batch requests one at a time into JSONL shards, starting a new shard before a provider limit is exceeded.
+
+	A shard is written to a `.part` file and renamed on completion to `{job_prefix}-{first:04}-{top:04}.jsonl`,
+	so a job fitting in one shard keeps the name of an unsharded batch file.
+	On close, a manifest listing the shards is written next to them.
+	"""
+	def __init__(self,
+		output_dir: str,
+		job_prefix: str,
+		base_id: int = 0,
+		max_requests: int = OPENAI_LIMITS[0],
+		max_bytes: int = OPENAI_LIMITS[1],
+		read_only: bool = True,
+		logger: Logger = _logger,
+	):
+		self.output_dir = output_dir
+		self.job_prefix = job_prefix
+		self.base_id = base_id
+		self.max_requests = max_requests
+		self.max_bytes = max_bytes
+		self.read_only = read_only
+		self._logger = logger
+
+		self.shards: list[ShardInfo] = []
+		self._next = base_id
+		self._file: Any = None
+		self._first = base_id
+		self._count = 0
+		self._bytes = 0
+		self.manifest_path: Optional[str] = None
+		os.makedirs(output_dir, exist_ok=True)
+
+	def _part_path(self):
+		return os.path.join(self.output_dir, f'{self.job_prefix}-{self._first:04}.jsonl.part')
+
+	def _open_shard(self):
+		self._first = self._next
+		self._count = 0
+		self._bytes = 0
+		self._file = open(self._part_path(), 'wb')
+
+	def _close_shard(self):
+		if self._file is None:
+			return
+		self._file.close()
+		self._file = None
+		path = os.path.join(self.output_dir, f'{self.job_prefix}-{self._first:04}-{self._next:04}.jsonl')
+		os.replace(self._part_path(), path)
+		if self.read_only:
+			set_file_read_only(path)
+		self.shards.append({
+			"path": path,
+			"first": self._first,
+			"count": self._count,
+			"bytes": self._bytes,
+		})
+		self._logger.info('Wrote %d requests (%d bytes) to %s.', self._count, self._bytes, path)
+
+	def write(self, request: Mapping[str, Any], index: Optional[int] = None):
+		"""
+		Serialize and write a request.
+
+		Args:
+			index: index of the request in the prompts, if some prompts before it were skipped.
+
+		Returns:
+			index of the request in the prompts.
+		"""
+		line = (json.dumps(request) + '\n').encode('utf-8')
+		if len(line) > self.max_bytes:
+			raise ValueError(f'Request {self._next if index is None else index} alone ({len(line)} bytes) exceeds the limit of {self.max_bytes} bytes.')
+		if self._file is not None and (self._count >= self.max_requests or self._bytes + len(line) > self.max_bytes):
+			self._close_shard()
+		if index is not None:
+			assert index >= self._next, f'Request {index} is written after request {self._next - 1}.'
+			self._next = index
+		if self._file is None:
+			self._open_shard()
+		self._file.write(line)
+		self._count += 1
+		self._bytes += len(line)
+		self._next += 1
+		return self._next - 1
+
+	def write_all(self, requests: Iterable[Mapping[str, Any]]):
+		for request in requests:
+			self.write(request)
+
+	@property
+	def paths(self):
+		return [shard['path'] for shard in self.shards]
+
+	def close(self) -> BatchManifest:
+		self._close_shard()
+		manifest: BatchManifest = {
+			"job_prefix": self.job_prefix,
+			"base_id": self.base_id,
+			"top": self._next,
+			"shards": self.shards,
+		}
+		if self.manifest_path is None:
+			self.manifest_path = os.path.join(
+				self.output_dir, f'{self.job_prefix}-{self.base_id:04}-{self._next:04}.manifest.json')
+			with open(self.manifest_path, 'w', encoding='utf-8') as file:
+				json.dump(manifest, file, indent='\t')
+		return manifest
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is not None and self._file is not None:
+			# Leave the unfinished shard as `.part`.
+			self._file.close()
+			self._file = None
+			return
+		self.close()
+
+def read_manifest(manifest_path: str) -> BatchManifest:
+	with open(manifest_path, 'r', encoding='utf-8') as file:
+		return json.load(file)
+
+def read_requests(batch_path: str) -> Iterable[dict[str, Any]]:
+	"""
+	Stream the requests of a batch file.
+	"""
+	with open(batch_path, 'r', encoding='utf-8') as file:
+		for line in file:
+			if line.strip():
+				yield json.loads(line)
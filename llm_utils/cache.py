@@ -0,0 +1,278 @@
+from typing import Any, Iterable, Mapping, Optional, Sequence, TypedDict
+
+import hashlib
+import json
+from logging import Logger, getLogger
+import os
+import sqlite3
+import threading
+import time
+
+_logger = getLogger(__name__)
+
+# Sampling parameters that change the response, the rest of a request body is either messages or transport options.
+_PARAMS = ('max_tokens', 'temperature', 'top_p', 'top_k', 'stop', 'stop_sequences', 'seed', 'n', 'response_format', 'tools', 'tool_choice')
+
+class CacheStats(TypedDict):
+	hits: int
+	misses: int
+	puts: int
+	hit_rate: float
+	entries: int
+	bytes: int
+
+def _normalize(value: Any) -> Any:
+	"""
+	Drop `cache_control` markers, and unwrap single text blocks, which do not change the response.
+	"""
+	if isinstance(value, Mapping):
+		return {k: _normalize(v) for k, v in value.items() if k != 'cache_control'}
+	if isinstance(value, (list, tuple)):
+		if len(value) == 1 and isinstance(value[0], Mapping) and value[0].get('type') == 'text':
+			return value[0].get('text')
+		return [_normalize(v) for v in value]
+	return value
+
+def _digest(value: Any) -> str:
+	return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def split_demos(
+	messages: Sequence[Mapping[str, Any]],
+) -> tuple[Sequence[Mapping[str, Any]], Sequence[Mapping[str, Any]]]:
+	"""
+	Split messages into the few-shot demos (and system message), and the tail from the last user message on.
+	"""
+	last_user = max((i for i, message in enumerate(messages) if message['role'] == 'user'), default=0)
+	return messages[:last_user], messages[last_user:]
+
+def get_demos_hash(
+	system: Any,
+	demos: Sequence[Mapping[str, Any]],
+) -> str:
+	return _digest([_normalize(system), _normalize(list(demos))])
+
+def make_key(
+	provider: str,
+	model: str,
+	messages: Sequence[Mapping[str, Any]],
+	params: Mapping[str, Any],
+	system: Any = None,
+	demos_hash: Optional[str] = None,
+) -> str:
+	"""
+	Content address of a request.
+
+	Args:
+		messages: full messages, or only the tail after the demos if `demos_hash` is given.
+		params: request parameters, only sampling parameters are part of the key.
+		demos_hash: hash of the system message and demos by `get_demos_hash`, to avoid rehashing them per request.
+	"""
+	if demos_hash is None:
+		demos, messages = split_demos(messages)
+		demos_hash = get_demos_hash(system, demos)
+	return _digest({
+		"provider": provider,
+		"model": model,
+		"demos": demos_hash,
+		"messages": _normalize(list(messages)),
+		"params": {k: params[k] for k in _PARAMS if params.get(k) is not None},
+	})
+
+def make_prompt_key(
+	provider: str,
+	prompt: str,
+	llm_string: str,
+) -> str:
+	"""
+	Content address of a request serialized by a framework, e.g. a langchain prompt and the parameters of its model.
+	"""
+	return _digest({
+		"provider": provider,
+		"prompt": prompt,
+		"llm": llm_string,
+	})
+
+class ResponseCache:
+	"""
+	Persistent content-addressed cache of LLM responses shared by all providers and processes, in SQLite with WAL.
+
+	Args:
+		max_entries: evict least recently used entries beyond this count.
+		max_age: evict entries not used for this many seconds.
+	"""
+	def __init__(self,
+		path: str = 'cache/responses.db',
+		max_entries: Optional[int] = None,
+		max_age: Optional[float] = None,
+		logger: Logger = _logger,
+	):
+		dirname = os.path.dirname(path)
+		if dirname:
+			os.makedirs(dirname, exist_ok=True)
+		self.path = path
+		self.max_entries = max_entries
+		self.max_age = max_age
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+		self._connection.execute('PRAGMA journal_mode=WAL')
+		self._connection.execute('PRAGMA synchronous=NORMAL')
+		self._connection.execute('''
+			CREATE TABLE IF NOT EXISTS responses (
+				key TEXT PRIMARY KEY,
+				provider TEXT NOT NULL,
+				model TEXT NOT NULL,
+				response TEXT NOT NULL,
+				created REAL NOT NULL,
+				accessed REAL NOT NULL,
+				hits INTEGER NOT NULL DEFAULT 0
+			)
+		''')
+		self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+		self.hits = 0
+		self.misses = 0
+		self.puts = 0
+
+	def get(self, key: str) -> Optional[dict[str, Any]]:
+		with self._lock:
+			row = self._connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			self._connection.execute('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+		return json.loads(row[0])
+
+	def put(self,
+		key: str,
+		provider: str,
+		model: str,
+		response: Mapping[str, Any],
+	):
+		now = time.time()
+		with self._lock:
+			self._connection.execute(
+				'INSERT OR REPLACE INTO responses (key, provider, model, response, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+				(key, provider, model, json.dumps(response, ensure_ascii=False), now, now),
+			)
+			self.puts += 1
+		if self.max_entries is not None and self.puts % 100 == 0:
+			self.evict()
+
+	def put_many(self, entries: Iterable[tuple[str, str, str, Mapping[str, Any]]]):
+		now = time.time()
+		with self._lock:
+			rows = [
+				(key, provider, model, json.dumps(response, ensure_ascii=False), now, now)
+				for key, provider, model, response in entries
+			]
+			self._connection.execute('BEGIN')
+			self._connection.executemany(
+				'INSERT OR REPLACE INTO responses (key, provider, model, response, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+				rows,
+			)
+			self._connection.execute('COMMIT')
+			self.puts += len(rows)
+		return len(rows)
+
+	def evict(self,
+		max_entries: Optional[int] = None,
+		max_age: Optional[float] = None,
+	) -> int:
+		"""
+		Remove entries unused for `max_age` seconds, then the least recently used ones beyond `max_entries`.
+
+		Returns:
+			number of removed entries.
+		"""
+		max_entries = max_entries if max_entries is not None else self.max_entries
+		max_age = max_age if max_age is not None else self.max_age
+		removed = 0
+		with self._lock:
+			if max_age is not None:
+				removed += self._connection.execute('DELETE FROM responses WHERE accessed < ?', (time.time() - max_age,)).rowcount
+			if max_entries is not None:
+				removed += self._connection.execute('''
+					DELETE FROM responses WHERE key IN (
+						SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+					)
+				''', (max_entries,)).rowcount
+		if removed:
+			self._logger.info('Evicted %d cached responses.', removed)
+		return removed
+
+	def stats(self) -> CacheStats:
+		with self._lock:
+			entries, size = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM responses').fetchone()
+		lookups = self.hits + self.misses
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"puts": self.puts,
+			"hit_rate": self.hits / lookups if lookups else float('nan'),
+			"entries": entries,
+			"bytes": size,
+		}
+
+	def log_stats(self):
+		stats = self.stats()
+		self._logger.info('Response cache: %d hits, %d misses (%.0f%%), %d puts, %d entries (%d bytes).',
+			stats['hits'], stats['misses'], stats['hit_rate'] * 100, stats['puts'], stats['entries'], stats['bytes'])
+
+	def close(self):
+		with self._lock:
+			self._connection.close()
+
+_caches: dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_response_cache(path: str = 'cache/responses.db') -> ResponseCache:
+	"""
+	Response cache shared in process by all clients using `path`.
+	"""
+	with _caches_lock:
+		cache = _caches.get(path)
+		if cache is None:
+			cache = _caches[path] = ResponseCache(path)
+		return cache
+
+def cache_batch_results(
+	cache: ResponseCache,
+	provider: str,
+	request_paths: Iterable[str],
+	result_path: str,
+	logger: Logger = _logger,
+) -> int:
+	"""
+	Populate the cache from downloaded batch results, matched with their requests by custom id.
+
+	Returns:
+		number of cached responses.
+	"""
+	from .batch_writer import read_requests
+
+	responses: dict[str, dict[str, Any]] = {}
+	with open(result_path, 'r', encoding='utf-8') as file:
+		for line in file:
+			if not line.strip():
+				continue
+			j = json.loads(line)
+			if provider == 'anthropic':
+				if j['result']['type'] == 'succeeded':
+					responses[j['custom_id']] = j['result']['message']
+			elif j['response'] and j['response']['status_code'] == 200:
+				responses[j['custom_id']] = j['response']['body']
+
+	def entries():
+		for request_path in request_paths:
+			for request in read_requests(request_path):
+				response = responses.get(request['custom_id'])
+				if response is None:
+					continue
+				params = request['params'] if provider == 'anthropic' else request['body']
+				key = make_key(provider, params['model'], params['messages'], params, params.get('system'))
+				yield key, provider, params['model'], response
+
+	n = cache.put_many(entries())
+	logger.info('Cached %d responses of %s.', n, result_path)
+	return n
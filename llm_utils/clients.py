@@ -0,0 +1,131 @@
+from typing import Any, Optional, TypedDict
+
+import asyncio
+from logging import getLogger
+import threading
+import weakref
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	import httpx
+
+_logger = getLogger(__name__)
+
+class PoolConfig(TypedDict):
+	http2: bool
+	max_connections: int
+	max_keepalive_connections: int
+	keepalive_expiry: float
+	timeout: float
+	connect_timeout: float
+
+def _http2_available():
+	try:
+		import h2 # noqa: F401
+		return True
+	except ImportError:
+		return False
+
+_config: PoolConfig = {
+	"http2": _http2_available(),
+	"max_connections": 100,
+	"max_keepalive_connections": 20,
+	"keepalive_expiry": 30,
+	"timeout": 600,
+	"connect_timeout": 5,
+}
+
+_lock = threading.Lock()
+_sync_clients: dict[tuple, Any] = {}
+# Async connections belong to the event loop that opened them, so async clients are pooled per loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+
+def configure_pool(**config: Any):
+	"""
+	Set the `PoolConfig` of clients created from now on, e.g. `configure_pool(max_connections=200)`.
+	HTTP/2 is used by default if `h2` is installed.
+	"""
+	unknown = config.keys() - _config.keys()
+	assert not unknown, f'Unknown pool options {unknown}.'
+	if config.get('http2') and not _http2_available():
+		_logger.warning('HTTP/2 requested, but h2 is not installed. Install httpx[http2].')
+		config['http2'] = False
+	with _lock:
+		_config.update(config) # type: ignore
+
+def _get_clients(asynchronous: bool) -> dict[tuple, Any]:
+	if not asynchronous:
+		return _sync_clients
+	loop = asyncio.get_running_loop()
+	clients = _async_clients.get(loop)
+	if clients is None:
+		clients = _async_clients[loop] = {}
+	return clients
+
+def _create_http_client(asynchronous: bool):
+	import httpx
+
+	Client = httpx.AsyncClient if asynchronous else httpx.Client
+	return Client(
+		http2=_config['http2'],
+		limits=httpx.Limits(
+			max_connections=_config['max_connections'],
+			max_keepalive_connections=_config['max_keepalive_connections'],
+			keepalive_expiry=_config['keepalive_expiry'],
+		),
+		timeout=httpx.Timeout(_config['timeout'], connect=_config['connect_timeout']),
+		follow_redirects=True,
+	)
+
+def get_http_client(asynchronous: bool = False) -> "httpx.Client | httpx.AsyncClient":
+	"""
+	Keep-alive connection pool shared by all clients of the process, or of the running event loop if `asynchronous`.
+	"""
+	with _lock:
+		clients = _get_clients(asynchronous)
+		key = ('http',)
+		if key not in clients:
+			clients[key] = _create_http_client(asynchronous)
+		return clients[key]
+
+def get_client(
+	provider: str,
+	base_url: Optional[str],
+	api_key: str,
+	max_retries: int,
+	asynchronous: bool = False,
+):
+	"""
+	SDK client of `provider` (`anthropic` or `openai`) on the shared connection pool, created once per configuration.
+	Async clients have to be requested inside the event loop that uses them.
+	"""
+	http_client = get_http_client(asynchronous)
+	with _lock:
+		clients = _get_clients(asynchronous)
+		key = provider, base_url, api_key, max_retries
+		if key not in clients:
+			if provider == 'anthropic':
+				import anthropic
+				Client = anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+			elif provider == 'openai':
+				import openai
+				Client = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+			else:
+				raise ValueError(f'Unknown provider {provider}.')
+			clients[key] = Client(
+				api_key=api_key,
+				base_url=base_url,
+				max_retries=max_retries,
+				http_client=http_client,
+			)
+		return clients[key]
+
+def close_clients():
+	"""
+	Close the synchronous connection pool, e.g. before forking.
+	"""
+	with _lock:
+		http_client = _sync_clients.get(('http',))
+		_sync_clients.clear()
+	if http_client is not None:
+		http_client.close()
@@ -0,0 +1,102 @@
+from typing import Callable, Mapping, Optional, Sequence, TypeVar
+
+import hashlib
+from logging import Logger, getLogger
+
+from .journal import JournalEntry, dump_outcome
+from .pipeline import VerificationPipeline
+from .response import ResponseError
+from .results import build_results_table, compare_results, summarize
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	import pandas as pd
+	from z3.z3 import CheckSatResult
+
+T = TypeVar('T')
+
+_logger = getLogger(__name__)
+
+def get_program_id(code: str) -> str:
+	return hashlib.sha1(code.encode('utf-8')).hexdigest()
+
+def compare_runs(
+	runs: "Mapping[str, Sequence[tuple[str, str | ResponseError]]]",
+	source: Sequence[T],
+	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
+	get_labels: Callable[[T], list[str]],
+	get_split: Optional[Callable[[T], str]] = None,
+	get_prediction: Optional[Callable[[bool | str], str]] = None,
+	use_definitions: bool = True,
+	use_common_knowledge: bool = True,
+	timeout: Optional[float] = 30,
+	max_workers: Optional[int] = None,
+	journal_path: Optional[str] = None,
+	logger: Logger = _logger,
+) -> "tuple[pd.DataFrame, dict[str, pd.DataFrame]]":
+	"""
+	Check several runs over the same dataset in one pass.
+	Identical programs across runs are executed only once, on a pool of `max_workers` shared by all runs.
+
+	Args:
+		runs: run name to responses, as returned by `read_responses` of the provider modules.
+			The i-th response of every run must correspond to `source[i]`.
+		get_prediction: label predicted by a verdict, see `build_results_table`.
+		journal_path: checkpoint journal of the unique programs, keyed by program hash.
+
+	Returns:
+		Side-by-side summary of the runs, and the results table of each run.
+	"""
+	import pandas as pd
+
+	unique: dict[str, str] = {}
+	for responses in runs.values():
+		for _, response in responses:
+			if isinstance(response, str):
+				unique.setdefault(get_program_id(response), response)
+	n_responses = sum(len(responses) for responses in runs.values())
+	logger.info('%d unique programs out of %d responses in %d runs.', len(unique), n_responses, len(runs))
+
+	program_ids = list(unique.keys())
+	with VerificationPipeline(
+		len(program_ids),
+		check_cb, # unused, programs are tallied per run
+		use_definitions=use_definitions,
+		use_common_knowledge=use_common_knowledge,
+		timeout=timeout,
+		max_workers=max_workers,
+		ids=program_ids,
+		journal_path=journal_path,
+		logger=logger,
+	) as pipeline:
+		for i, id in enumerate(program_ids):
+			pipeline.submit_program(i, unique[id])
+		results = pipeline.wait()
+	outcomes = {id: results[i] for i, id in enumerate(program_ids)}
+
+	tables: "dict[str, pd.DataFrame]" = {}
+	for name, responses in runs.items():
+		entries: dict[str, JournalEntry] = {}
+		for i, (id, response) in enumerate(responses):
+			if isinstance(response, str):
+				outcome, elapsed = outcomes[get_program_id(response)]
+				entries[id] = dump_outcome(id, i, outcome, elapsed)
+			else:
+				entries[id] = dump_outcome(id, i, (False, response), 0.)
+		tables[name] = build_results_table(entries, source, check_cb, get_labels, get_split,
+			flags={"run": name}, get_prediction=get_prediction, logger=logger)
+
+	summary = pd.concat({
+		name: summarize(df, by=None).iloc[0]
+		for name, df in tables.items()
+	}, axis=1)
+	return summary, tables
+
+def compare_items(
+	tables: "Mapping[str, pd.DataFrame]",
+) -> "pd.DataFrame":
+	"""
+	Items on which the runs disagree, with the correctness of each run side by side.
+	"""
+	correct = compare_results(tables, 'correct')
+	return correct[correct.nunique(axis=1) > 1]
@@ -1,10 +1,14 @@
-from typing import Any, Awaitable, Iterable, Literal, Optional
+from typing import Any, Awaitable, Callable, Iterable, Literal, Optional
 
 import ast
 import asyncio
 from logging import Logger, getLogger, DEBUG
-from multiprocessing import Process, Queue
+import multiprocessing
+from multiprocessing import Queue
 import re
+import signal
+import threading
+import time
 
 from async_utils import wrap_function_async
 from z3_utils import Logic
@@ -13,6 +17,8 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
 	from z3.z3 import CheckSatResult
 
+	ResultCallback = Callable[[int, tuple[Literal[True], list[bool | CheckSatResult]] | tuple[Literal[False], Exception], float], Any]
+
 def get_function_name(code: str) -> str:
 	tree = ast.parse(code)
 	node = tree.body[0]
@@ -174,6 +180,24 @@ def _switch_sorts_context(code: str) -> str:
 
 _logger = getLogger(__name__)
 
+_forkserver = multiprocessing.get_context('forkserver') if 'forkserver' in multiprocessing.get_all_start_methods() else None
+if _forkserver is not None:
+	_forkserver.set_forkserver_preload(['z3', 'z3_utils'])
+
+def _get_context():
+	"""
+	Start method of the worker processes.
+
+	Forking while other threads run, e.g. in `VerificationPipeline` or under `asyncio.to_thread`,
+	may deadlock the child on a lock held by another thread at the fork,
+	so workers are then forked by a fork server started from a single-threaded process instead.
+	Like with `spawn`, those workers import the main module, which has to guard its entry point,
+	and do not inherit logging handlers.
+	"""
+	if _forkserver is None or threading.active_count() == 1:
+		return multiprocessing.get_context()
+	return _forkserver
+
 def execute_code(
 	code: str,
 	context: dict[str, Any],
@@ -182,15 +206,34 @@ def execute_code(
 	use_common_knowledge: bool,
 	translate: bool,
 	timeout: Optional[float],
-) -> "tuple[Literal[True], list[bool | CheckSatResult]] | tuple[Literal[False], Exception]":
-	queue = Queue()
-	process = Process(target=_execute_code, args=(queue, code, context, logger, use_definitions, use_common_knowledge, translate))
+	method: str = 'judge',
+	method_args: tuple = (),
+) -> "tuple[Literal[True], Any] | tuple[Literal[False], Exception]":
+	"""
+	Args:
+		method: method of the constructed `Logic` to call, e.g. `judge` or `judge_grid`.
+		method_args: positional arguments of the method.
+	"""
+	mp = _get_context()
+	queue = mp.Queue()
+	process = mp.Process(target=_execute_code, args=(queue, code, context, logger, use_definitions, use_common_knowledge, translate, method, method_args))
 	process.start()
-	process.join(timeout)
+	try:
+		process.join(timeout)
+	except KeyboardInterrupt:
+		# Workers ignore SIGINT, terminate them here so no orphan is left behind.
+		logger.warning('Interrupted, terminating worker process.')
+		process.terminate()
+		process.join()
+		raise
 	if process.is_alive():
 		logger.error('Execution timed out after %.2f seconds.', timeout)
 		process.terminate()
 		return False, TimeoutError(f'Execution timed out after {timeout} seconds.')
+	elif process.exitcode != 0:
+		# Died without a result, e.g. killed or failed to start.
+		logger.error('Worker process exited with code %s.', process.exitcode)
+		return False, RuntimeError(f'Worker process exited with code {process.exitcode}.')
 	else:
 		return queue.get()
 
@@ -203,11 +246,38 @@ def execute_codes(
 	translate: bool = False,
 	timeout: Optional[float] = 30,
 	sync: bool = False,
+	on_result: "Optional[ResultCallback]" = None,
+	method: str = 'judge',
+	method_args: tuple = (),
 ) -> "Iterable[Awaitable[tuple[Literal[True], list[bool | CheckSatResult]] | tuple[Literal[False], Exception]]]":
+	"""
+	Args:
+		on_result: called with (index, result, elapsed seconds) as soon as each code finishes.
+		method: method of the constructed `Logic` to call, see `execute_code`.
+	"""
 	if sync:
-		return _execute_codes_sync(codes, contexts, logger, use_definitions, use_common_knowledge, translate, timeout)
+		return _execute_codes_sync(codes, contexts, logger, use_definitions, use_common_knowledge, translate, timeout, on_result, method, method_args)
 	else:
-		return _execute_codes_async(codes, contexts, logger, use_definitions, use_common_knowledge, translate, timeout)
+		return _execute_codes_async(codes, contexts, logger, use_definitions, use_common_knowledge, translate, timeout, on_result, method, method_args)
+
+def _execute_code_and_report(
+	index: int,
+	on_result: "Optional[ResultCallback]",
+	code: str,
+	context: dict[str, Any],
+	logger: Logger,
+	use_definitions: bool,
+	use_common_knowledge: bool,
+	translate: bool,
+	timeout: Optional[float],
+	method: str,
+	method_args: tuple,
+):
+	start = time.perf_counter()
+	result = execute_code(code, context, logger, use_definitions, use_common_knowledge, translate, timeout, method, method_args)
+	if on_result:
+		on_result(index, result, time.perf_counter() - start)
+	return result
 
 def _execute_codes_sync(
 	codes: list[str],
@@ -217,11 +287,16 @@ def _execute_codes_sync(
 	use_common_knowledge: bool,
 	translate: bool,
 	timeout: Optional[float],
+	on_result: "Optional[ResultCallback]",
+	method: str,
+	method_args: tuple,
 ):
 	from async_utils import SyncAwaitable
 	return [
 		SyncAwaitable(
-			execute_code,
+			_execute_code_and_report,
+			i,
+			on_result,
 			code,
 			context,
 			logger,
@@ -229,8 +304,10 @@ def _execute_codes_sync(
 			use_common_knowledge,
 			translate,
 			timeout,
+			method,
+			method_args,
 		)
-		for code, context in zip(codes, contexts or [{}] * len(codes))
+		for i, (code, context) in enumerate(zip(codes, contexts or [{}] * len(codes)))
 	]
 
 def _execute_codes_async(
@@ -241,11 +318,16 @@ def _execute_codes_async(
 	use_common_knowledge: bool,
 	translate: bool,
 	timeout: Optional[float],
+	on_result: "Optional[ResultCallback]",
+	method: str,
+	method_args: tuple,
 ):
 	tasks = [
 		asyncio.create_task(
 			wrap_function_async(
-				execute_code,
+				_execute_code_and_report,
+				i,
+				on_result,
 				code,
 				context,
 				logger,
@@ -253,9 +335,11 @@ def _execute_codes_async(
 				use_common_knowledge,
 				translate,
 				timeout,
+				method,
+				method_args,
 			)
 		)
-		for code, context in zip(codes, contexts or [{}] * len(codes))
+		for i, (code, context) in enumerate(zip(codes, contexts or [{}] * len(codes)))
 	]
 	return tasks
 
@@ -267,7 +351,11 @@ def _execute_code(
 	use_definitions: bool,
 	use_common_knowledge: bool,
 	translate: bool,
+	method: str = 'judge',
+	method_args: tuple = (),
 ):
+	# The parent process handles Ctrl-C and terminates workers.
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
 	exec('''from z3.z3 import *
 from z3_utils import Logic
 ''', context)
@@ -302,7 +390,7 @@ from z3_utils import Logic
 	logger.debug('Judging...')
 	# TODO: handle common exceptions
 	try:
-		result = logic.judge()
+		result = getattr(logic, method)(*method_args)
 		logger.debug('Judged.')
 		queue.put((True, result))
 		return
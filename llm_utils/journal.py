@@ -0,0 +1,173 @@
+from typing import Any, Iterable, Literal, Optional, TypedDict, Union
+
+import json
+from logging import Logger, getLogger
+import os
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from z3.z3 import CheckSatResult
+
+	Outcome = Union[tuple[Literal[True], list[bool | CheckSatResult]], tuple[Literal[False], Exception]]
+
+_logger = getLogger(__name__)
+
+class JournalEntry(TypedDict):
+	id: str
+	index: int
+	success: bool
+	results: Optional[list[bool | str]]
+	error_type: Optional[str]
+	error: Optional[str]
+	elapsed: float
+
+def dump_verdict(verdict: "bool | CheckSatResult") -> bool | str:
+	if isinstance(verdict, bool):
+		return verdict
+	return str(verdict) # sat, unsat, unknown
+
+def load_verdict(verdict: bool | str) -> "bool | CheckSatResult":
+	from z3.z3 import sat, unsat, unknown
+
+	if isinstance(verdict, bool):
+		return verdict
+	return {
+		'sat': sat,
+		'unsat': unsat,
+	}.get(verdict, unknown)
+
+def dump_outcome(
+	id: str,
+	index: int,
+	outcome: "Outcome",
+	elapsed: float,
+) -> JournalEntry:
+	if outcome[0] == True:
+		return {
+			"id": id,
+			"index": index,
+			"success": True,
+			"results": [dump_verdict(r) for r in outcome[1]],
+			"error_type": None,
+			"error": None,
+			"elapsed": elapsed,
+		}
+	else:
+		return {
+			"id": id,
+			"index": index,
+			"success": False,
+			"results": None,
+			"error_type": outcome[1].__class__.__name__,
+			"error": str(outcome[1]),
+			"elapsed": elapsed,
+		}
+
+def load_outcome(entry: JournalEntry) -> "Outcome":
+	if entry['success']:
+		assert entry['results'] is not None
+		return True, [load_verdict(r) for r in entry['results']]
+	elif entry['error_type'] == TimeoutError.__name__:
+		return False, TimeoutError(entry['error'])
+	else:
+		return False, RuntimeError(f"{entry['error_type']}: {entry['error']}")
+
+def read_journal(
+	journal_path: str,
+	logger: Logger = _logger,
+) -> dict[str, JournalEntry]:
+	"""
+	Read a journal. Later entries of the same id override earlier ones.
+	"""
+	entries: dict[str, JournalEntry] = {}
+	if not os.path.exists(journal_path):
+		return entries
+
+	with open(journal_path, 'r', encoding='utf-8') as file:
+		for n, line in enumerate(file):
+			if not line.strip():
+				continue
+			try:
+				entry: JournalEntry = json.loads(line)
+			except json.JSONDecodeError:
+				# Most likely the last line of an interrupted run.
+				logger.warning('Skipping malformed journal line %d of %s.', n, journal_path)
+				continue
+			entries[entry['id']] = entry
+	return entries
+
+def drop_entries(
+	journal_path: str,
+	ids: Iterable[str],
+	logger: Logger = _logger,
+):
+	"""
+	Rewrite a journal without the entries of `ids`, so that they are checked again.
+	"""
+	drop = set(ids)
+	entries = read_journal(journal_path, logger)
+	tmp_path = journal_path + '.tmp'
+	with open(tmp_path, 'w', encoding='utf-8') as file:
+		for id, entry in entries.items():
+			if id not in drop:
+				print(json.dumps(entry, ensure_ascii=False), file=file)
+	os.replace(tmp_path, journal_path)
+	logger.info('Dropped %d of %d journal entries.', len(drop & entries.keys()), len(entries))
+
+class CheckJournal:
+	"""
+	Append-only checkpoint journal of check outcomes, keyed by response id.
+	"""
+	def __init__(self,
+		journal_path: str,
+		flush_every: int = 16,
+		logger: Logger = _logger,
+	):
+		self.journal_path = journal_path
+		self.flush_every = flush_every
+		self._logger = logger
+		self.entries = read_journal(journal_path, logger)
+		self._buffer: list[str] = []
+		self._file = open(journal_path, 'a', encoding='utf-8')
+		if self.entries:
+			logger.info('Resuming from %s with %d finished items.', journal_path, len(self.entries))
+
+	def __contains__(self, id: str):
+		return id in self.entries
+
+	def get(self, id: str):
+		return self.entries.get(id)
+
+	def record(self,
+		id: str,
+		index: int,
+		outcome: "Outcome",
+		elapsed: float,
+	):
+		entry = dump_outcome(id, index, outcome, elapsed)
+		self.entries[id] = entry
+		self._buffer.append(json.dumps(entry, ensure_ascii=False))
+		if len(self._buffer) >= self.flush_every:
+			self.flush()
+		return entry
+
+	def flush(self):
+		if not self._buffer:
+			return
+		self._file.write('\n'.join(self._buffer) + '\n')
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self._logger.debug('Flushed %d journal entries.', len(self._buffer))
+		self._buffer.clear()
+
+	def close(self):
+		if self._file.closed:
+			return
+		self.flush()
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.close()
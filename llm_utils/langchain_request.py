@@ -1,30 +1,47 @@
-from typing import Optional
+from typing import Any, Callable, Optional
+
+import json
+from logging import Logger, getLogger
+import os
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.language_models import BaseChatModel
 
+from file_utils import append_line
 from .prompting import get_demos, get_langchain_template
-from .langchain_utils import BatchCallback
+from .cache import get_response_cache
+from .langchain_utils import BatchCallback, SharedRateLimiter, SharedResponseCache
+from .rate_limit import get_rate_limiter
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+	from langchain_core.rate_limiters import BaseRateLimiter
 	from pydantic.types import SecretStr
 
-def batch_request(
-	user_prompts: list[str],
+def _get_chain(
 	model: BaseChatModel,
 	additional_path: Optional[str] = None,
 	replace: bool = False,
 	prefill: Optional[str] = None,
-	max_concurrency: int = 8,
 	**retry_kwargs,
 ):
 	system, messages = get_demos(additional_path=additional_path, replace=replace)
 	msgs = get_langchain_template(system, messages, prefill)
 
-	chain = ChatPromptTemplate.from_messages(msgs) | model | StrOutputParser()
-	chain = chain.with_retry(**retry_kwargs)
+	# Retry the model call itself: a retrying binding around the chain is bypassed by `batch_as_completed`.
+	return ChatPromptTemplate.from_messages(msgs) | model.with_retry(**retry_kwargs) | StrOutputParser()
+
+def batch_request(
+	user_prompts: list[str],
+	model: BaseChatModel,
+	additional_path: Optional[str] = None,
+	replace: bool = False,
+	prefill: Optional[str] = None,
+	max_concurrency: int = 8,
+	**retry_kwargs,
+):
+	chain = _get_chain(model, additional_path, replace, prefill, **retry_kwargs)
 
 	with BatchCallback(len(user_prompts)) as callback:
 		return chain.batch([
@@ -35,6 +52,35 @@ def batch_request(
 			"callbacks": [callback],
 		})
 
+def _dump_response(response: "str | BaseException"):
+	return response if isinstance(response, str) else {
+		"type": response.__class__.__name__,
+		"fields": {k: str(v) for k, v in vars(response).items()},
+	}
+
+def read_partial(
+	partial_file: str,
+	logger: Logger = getLogger(__name__),
+) -> dict[str, str]:
+	"""
+	Successful responses in a `.partial.jsonl` sidecar of `request_and_save`, keyed by id.
+	"""
+	responses: dict[str, str] = {}
+	if not os.path.exists(partial_file):
+		return responses
+	with open(partial_file, 'r', encoding='utf-8') as file:
+		for n, line in enumerate(file):
+			if not line.strip():
+				continue
+			try:
+				j = json.loads(line)
+			except json.JSONDecodeError:
+				logger.warning('Skipping malformed line %d of %s.', n, partial_file)
+				continue
+			if isinstance(j['response'], str):
+				responses[j['id']] = j['response']
+	return responses
+
 def request_and_save(
 	custom_ids: list[str],
 	user_prompts: list[str],
@@ -43,30 +89,65 @@ def request_and_save(
 	additional_path: Optional[str] = None,
 	prefill: Optional[str] = None,
 	max_concurrency: int = 8,
+	resume: bool = False,
+	on_response: "Optional[Callable[[int, str | BaseException], Any]]" = None,
+	logger: Logger = getLogger(__name__),
 	**retry_kwargs,
 ):
-	import json
+	"""
+	Request the prompts and save the responses in order to `output_file`.
 
+	Responses are appended and synced to a `{output_file}.partial.jsonl` sidecar as they complete,
+	which is removed once `output_file` is written.
+
+	Args:
+		resume: keep the successful responses in the sidecar, and request only the missing or failed ones.
+		on_response: called with the index and response, or exception, of each prompt as soon as it completes,
+			including resumed ones, e.g. `VerificationPipeline.submit`.
+	"""
 	assert len(custom_ids) == len(user_prompts)
-	responses = batch_request(
-		user_prompts,
-		model,
-		additional_path=additional_path,
-		prefill=prefill,
-		max_concurrency=max_concurrency,
-		**retry_kwargs
-	)
+	partial_file = output_file + '.partial.jsonl'
+	completed = read_partial(partial_file, logger) if resume else {}
+	if completed:
+		# Compact, dropping failures and a truncated last line before appending.
+		with open(partial_file, 'w', encoding='utf-8') as file:
+			for custom_id, response in completed.items():
+				print(json.dumps({"id": custom_id, "response": response}, ensure_ascii=False), file=file)
+	pending = [i for i, custom_id in enumerate(custom_ids) if custom_id not in completed]
+	logger.info('Requesting %d prompts, %d already completed.', len(pending), len(custom_ids) - len(pending))
+
+	responses: "dict[str, str | BaseException]" = dict(completed)
+	if on_response is not None:
+		for i, custom_id in enumerate(custom_ids):
+			if custom_id in completed:
+				on_response(i, completed[custom_id])
+	chain = _get_chain(model, additional_path, prefill=prefill, **retry_kwargs)
+	with open(partial_file, 'a' if resume else 'w', encoding='utf-8') as file, BatchCallback(len(pending)) as callback:
+		for j, response in chain.batch_as_completed([
+			{ "user": user_prompts[i] }
+			for i in pending
+		], config={
+			"max_concurrency": max_concurrency,
+			"callbacks": [callback],
+		}, return_exceptions=True):
+			custom_id = custom_ids[pending[j]]
+			responses[custom_id] = response
+			append_line(file, json.dumps({
+				"id": custom_id,
+				"response": _dump_response(response),
+			}, ensure_ascii=False))
+			if on_response is not None:
+				on_response(pending[j], response)
+
 	with open(output_file, 'w', encoding='utf-8') as file:
 		json.dump([
 			{
 				"id": custom_id,
-				"response": response if isinstance(response, str) else {
-					"type": response.__class__.__name__,
-					"fields": vars(response),
-				}
+				"response": _dump_response(responses[custom_id]),
 			}
-			for custom_id, response in zip(custom_ids, responses)
+			for custom_id in custom_ids
 		], file, ensure_ascii=False, indent=0)
+	os.remove(partial_file)
 
 def get_anthropic(
 	task_id: str,
@@ -77,10 +158,18 @@ def get_anthropic(
 	temperature: float = 0,
 	top_p: Optional[float] = None,
 	max_tokens: int = 2048,
+	rate_limiter: "Optional[BaseRateLimiter]" = None,
 	**kwargs,
 ):
+	"""
+	Args:
+		task_id: unused, responses are cached by content in the response cache shared by all tasks and providers.
+		rate_limiter: defaults to the limiter shared with the other clients of the model, reserving `max_tokens` per call.
+	"""
 	from langchain_anthropic.chat_models import ChatAnthropic
-	from langchain_community.cache import SQLiteCache
+
+	if rate_limiter is None:
+		rate_limiter = SharedRateLimiter(get_rate_limiter(f'anthropic/{model_name}'), max_tokens)
 
 	return ChatAnthropic(
 		model_name=model_name,
@@ -90,7 +179,8 @@ def get_anthropic(
 		temperature=temperature,
 		top_p=top_p,
 		max_tokens_to_sample=max_tokens,
-		cache=SQLiteCache(f'cache/{model_name}-{task_id}.db'),
+		cache=SharedResponseCache(get_response_cache(), model_name),
+		rate_limiter=rate_limiter,
 		**kwargs,
 	)
 
@@ -6,6 +6,37 @@ from z3 import CheckSatResult
 
 from .response import process_response, check_responses
 
+def get_response_content(
+	response: "str | BaseException",
+	prefill: Optional[str] = None,
+):
+	"""
+	Content of a response returned by `request_and_save` before it is saved.
+	"""
+	from .response import ResponseError
+
+	if not isinstance(response, str):
+		raise ResponseError(response.__class__.__name__)
+	return (prefill or '') + response
+
+def read_responses(
+	response_file_path: str,
+	prefill: Optional[str] = None,
+	logger: Logger = getLogger(__name__),
+):
+	from .response import ResponseError, collect_responses
+
+	with open(response_file_path, 'r', encoding='utf-8') as file:
+		j: list[dict] = json.load(file)
+
+	def get_content(item: dict) -> str:
+		response = item['response']
+		if not isinstance(response, str):
+			raise ResponseError(response['type'])
+		return (prefill or '') + response
+
+	return collect_responses(j, lambda i, item: item['id'], get_content, logger)
+
 def check_langchain_response(
 	response_file_path: str,
 	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
@@ -14,6 +45,8 @@ def check_langchain_response(
 	use_common_knowledge: bool = True,
 	sync: bool = False,
 	logger: Logger = getLogger(__name__),
+	journal_path: Optional[str] = None,
+	method: str = 'judge',
 ):
 	with open(response_file_path, 'r', encoding='utf-8') as file:
 		j = json.load(file)
@@ -35,21 +68,10 @@ def check_langchain_response(
 			failures.append(i)
 			logger.error('Response #%d failed: %s', i, e)
 
-	i_r = list(set(range(len(j))) - set(failures)) # [0, 1, 2, 3] -> [0, 1, 3, 6]
-	# i_map = {i: i_r.index(i) for i in i_r} # [0, 1, 3, 6] -> [0, 1, 2, 3]
-	def check_cb_wrapper(i: int, results: list[bool | CheckSatResult]):
-		"""
-		Args:
-			i: index of the response ([0, 1, 2, 3])
-		"""
-		# i_r = i + c, where c is the number of failures before i
-		# if [2, 4, 5] fails, [0, 1, 2, 3, 4, 5, 6] -> [0, 1, 3, 6]
-		# i_r[0] = 0, i_r[1] = 1, i_r[2] = 3, i_r[3] = 6
-		# c[0] = 0, c[1] = 0, c[2] = 1, c[3] = 3
-		# c[i] = count(failures < i_r[i])
-		# TOO COMPLICATED
-		return check_cb(i_r[i], results)
-
+	# Dataset indices of the processed responses, e.g. [0, 1, 3, 6] if [2, 4, 5] failed.
+	failed = set(failures)
+	i_r = [i for i in range(len(j)) if i not in failed]
 	correct, wrong, llm_failed, z3_failed, total = check_responses(
-		responses, check_cb_wrapper, use_definitions, use_common_knowledge, sync)
+		responses, check_cb, use_definitions, use_common_knowledge, sync, logger,
+		ids=[j[i]['id'] for i in i_r], journal_path=journal_path, method=method, indices=i_r)
 	return correct, wrong, llm_failed + len(failures), z3_failed, total + len(failures)
@@ -1,9 +1,15 @@
-from typing import Any
+from typing import Any, Optional, Sequence
 from uuid import UUID
 from tqdm.auto import tqdm
 
+from langchain_core.caches import BaseCache
 from langchain_core.callbacks import BaseCallbackHandler
-from langchain_core.outputs import LLMResult
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation, LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from .cache import ResponseCache, make_prompt_key
+from .rate_limit import RateLimiter
 
 class BatchCallback(BaseCallbackHandler):
 	def __init__(self, total: int, minus_on_chain_error=False):
@@ -28,3 +34,45 @@ class BatchCallback(BaseCallbackHandler):
 
 	def __del__(self):
 		self.progress_bar.__del__()
+
+class SharedRateLimiter(BaseRateLimiter):
+	"""
+	Langchain view of a shared `RateLimiter`, reserving `tokens_per_request` tokens per call.
+	"""
+	def __init__(self, limiter: RateLimiter, tokens_per_request: float = 0):
+		self.limiter = limiter
+		self.tokens_per_request = tokens_per_request
+
+	def acquire(self, *, blocking: bool = True) -> bool:
+		if not blocking:
+			return self.limiter.try_acquire(self.tokens_per_request)
+		self.limiter.acquire(self.tokens_per_request)
+		return True
+
+	async def aacquire(self, *, blocking: bool = True) -> bool:
+		if not blocking:
+			return self.limiter.try_acquire(self.tokens_per_request)
+		await self.limiter.acquire_async(self.tokens_per_request)
+		return True
+
+class SharedResponseCache(BaseCache):
+	"""
+	Langchain view of a shared `ResponseCache`, keyed by the serialized prompt and model parameters.
+	"""
+	def __init__(self, cache: ResponseCache, model: str = ''):
+		self.cache = cache
+		self.model = model
+
+	def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+		response = self.cache.get(make_prompt_key('langchain', prompt, llm_string))
+		if response is None:
+			return None
+		return [loads(generation) for generation in response['generations']]
+
+	def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+		self.cache.put(make_prompt_key('langchain', prompt, llm_string), 'langchain', self.model, {
+			"generations": [dumps(generation) for generation in return_val],
+		})
+
+	def clear(self, **kwargs: Any):
+		self.cache.evict(max_entries=0)
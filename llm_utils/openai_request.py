@@ -1,11 +1,20 @@
-from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, TypedDict, Union, Unpack
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, TypedDict, Union, Unpack, overload
 from typing import TypeVar
 
+import asyncio
 import json
-from openai import OpenAI
+from logging import Logger, getLogger
+from openai import AsyncOpenAI, OpenAI
+import os
+import time
 
-from file_utils import set_file_read_only
+from file_utils import append_line
+from .batch_writer import OPENAI_LIMITS, ShardedBatchWriter, format_custom_id
+from .cache import get_response_cache, make_key
+from .clients import get_client
 from .prompting import get_demos, get_messages
+from .rate_limit import RateLimiter, estimate_tokens, get_rate_limiter
+from .stream import STOP_SEQUENCE, SyntaxMonitor, read_openai_stream
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -77,30 +86,6 @@ def get_openai_request_body(
 		**kwargs,
 	}
 
-def get_requests(
-	job_prefix: str,
-	bodies: "list[OpenAIRequestBody]",
-	custom_ids: Optional[Sequence[str]] = None,
-	base_id = 0,
-	endpoint = '/v1/chat/completions',
-) -> "list[OpenAIRequest]":
-	if custom_ids:
-		assert len(custom_ids) == len(bodies)
-		prefixes = [
-			f"{job_prefix}-{i + base_id :04}({custom_id})"
-			for i, custom_id in enumerate(custom_ids)
-		]
-	else:
-		prefixes = [f"{job_prefix}-{i + base_id :04}" for i in range(len(bodies))]
-	return [
-		{
-			"custom_id": prefixes[i],
-			"method": "POST",
-			"url": endpoint,
-			"body": bodies[i],
-		} for i in range(len(bodies))
-	]
-
 def generate_batch(
 	user_prompts: list[str],
 	base_id: int,
@@ -115,45 +100,91 @@ def generate_batch(
 	max_tokens = 2048,
 	temperature = 0,
 	top_p = 1,
-):
+	output_dir = 'data/batch_request',
+	max_requests = OPENAI_LIMITS[0],
+	max_bytes = OPENAI_LIMITS[1],
+	cached_output: Optional[str] = None,
+	logger: Logger = getLogger(__name__),
+) -> list[str]:
+	"""
+	Stream requests of `user_prompts[base_id:base_id + size]` into batch files,
+	sharded on the request count and file size limits of the Batch API.
+
+	Args:
+		cached_output: answer prompts from the shared response cache instead of requesting them,
+			and write their results to this file in the batch output format.
+			Check the downloaded results with `indices_from_ids`, as the skipped prompts leave gaps in the shards.
+
+	Returns:
+		paths of the shards, listed in a manifest next to them.
+	"""
 	demos = get_demos(demos_path, additional_path, replace)
 	system, _demos = demos
+	cache = get_response_cache() if cached_output is not None else None
 
-	bodies: "list[OpenAIRequestBody]" = []
+	top = min(base_id + size, len(user_prompts))
+	cached = 0
+	with ShardedBatchWriter(output_dir, job_prefix, base_id, max_requests, max_bytes) as writer, \
+		open(cached_output or os.devnull, 'w', encoding='utf-8') as cached_file:
+		for i in range(base_id, top):
+			messages: "Sequence[ChatCompletionMessageParam]" = get_messages(_demos, user_prompts[i]) # type: ignore
+			request_body = get_openai_request_body(
+				_get_openai_messages(system, messages),
+				model_name,
+				max_tokens=max_tokens,
+				temperature=temperature,
+				top_p=top_p,
+			)
+			custom_id = format_custom_id(job_prefix, i, custom_ids[i] if custom_ids else None)
+			if cache is not None:
+				body = cache.get(make_key('openai', model_name, request_body['messages'], request_body)) # type: ignore
+				if body is not None:
+					print(json.dumps({"id": None, "custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None}), file=cached_file)
+					cached += 1
+					continue
+			request: "OpenAIRequest" = {
+				"custom_id": custom_id,
+				"method": "POST",
+				"url": endpoint,
+				"body": request_body,
+			}
+			writer.write(request, i)
 
-	for user in user_prompts:
-		messages: "Sequence[ChatCompletionMessageParam]" = get_messages(_demos, user) # type: ignore
-		openai_messages = _get_openai_messages(system, messages)
-		request_body = get_openai_request_body(
-			openai_messages,
-			model_name,
-			max_tokens=max_tokens,
-			temperature=temperature,
-			top_p=top_p,
-		)
-		bodies.append(request_body)
+	if cached_output is not None:
+		logger.info('%d prompts answered from the response cache, written to %s.', cached, cached_output)
+	return writer.paths
 
-	top = base_id + size
-	requests = get_requests(job_prefix, bodies[base_id:top], custom_ids[base_id:top] if custom_ids else None, base_id, endpoint)
+@overload
+def _get_openai_client(
+	max_retries: int = 2,
+) -> OpenAI:
+	...
 
-	outfile = f'data/batch_request/{job_prefix}-{base_id:04}-{top:04}.jsonl'
-	with open(outfile, 'w', encoding='utf-8') as file:
-		for request in requests:
-			print(json.dumps(request), file=file)
+@overload
+def _get_openai_client(
+	max_retries: int = 2,
+	*,
+	asynchronous: Literal[True],
+) -> AsyncOpenAI:
+	...
 
-	set_file_read_only(outfile)
-	return outfile
+def _get_openai_client(
+	max_retries=2,
+	*,
+	asynchronous=False,
+):
+	"""
+	Client on the connection pool shared by the process, see `clients.get_client`.
+	An asynchronous client has to be requested inside the event loop using it.
+	"""
+	from private.apikey import openai_base_url, openai_key
+	return get_client('openai', openai_base_url, openai_key.get_secret_value(), max_retries, asynchronous)
 
 def submit_batch(
 	outfile: str,
 	endpoint: "Literal['/v1/chat/completions', '/v1/embeddings', '/v1/completions']" = '/v1/chat/completions',
 ):
-	from private.apikey import openai_base_url, openai_key
-
-	client = OpenAI(
-		api_key=openai_key.get_secret_value(),
-		base_url=openai_base_url,
-	)
+	client = _get_openai_client()
 
 	batch_file = client.files.create(
 		purpose='batch',
@@ -165,3 +196,114 @@ def submit_batch(
 		input_file_id=batch_file.id,
 		completion_window='24h',
 	)
+
+async def stream_request_async(
+	user_prompts: "Sequence[str]",
+	output_file: str,
+	model_name = 'gpt-4o-2024-08-06',
+	demos_path = 'demos/common.py',
+	additional_path: Optional[str] = None,
+	replace = False,
+	custom_ids: Optional[Sequence[str]] = None,
+	max_tokens = 2048,
+	temperature = 0,
+	top_p = 1,
+	max_concurrency: int = 2,
+	rate_limiter: Optional[RateLimiter] = None,
+	max_rate_limit_retries: int = 8,
+	use_response_cache: bool = True,
+	logger: Logger = getLogger(__name__),
+):
+	"""
+	Request the prompts online with streaming, stopping at `return l` and aborting on irrecoverable syntax, see `SyntaxMonitor`.
+
+	Responses are saved in the Batch API output format, so that they are checked like batch results.
+	Aborted responses have `finish_reason` `aborted`. Failed requests are saved with no `response` and an `error`,
+	and are counted as LLM failures by `openai_response.check_batch_response`.
+
+	Args:
+		use_response_cache: answer prompts from the shared response cache, and store new responses in it,
+			see `anthropic_request.batch_request_async`. Aborted responses are not cached.
+	"""
+	from openai import RateLimitError
+
+	from .anthropic_request import sort_indexed_lines
+
+	client = _get_openai_client(0, asynchronous=True) # retried below, paced by `limiter`
+	system, _demos = get_demos(demos_path, additional_path, replace)
+	limiter = rate_limiter or get_rate_limiter(f'openai/{model_name}')
+	semaphore = asyncio.Semaphore(max_concurrency)
+	ids = list(custom_ids) if custom_ids is not None else [str(i) for i in range(len(user_prompts))]
+	assert len(ids) == len(user_prompts), f'len(custom_ids) ({len(ids)}) does not match len(user_prompts) ({len(user_prompts)}).'
+	cache = get_response_cache() if use_response_cache else None
+	# The stop sequence only cuts the response short, so keys match the requests of `generate_batch`.
+	params = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p}
+
+	async def request(i: int, file):
+		messages: "Sequence[ChatCompletionMessageParam]" = get_messages(_demos, user_prompts[i]) # type: ignore
+		messages = list(_get_openai_messages(system, messages))
+		if cache is not None:
+			key = make_key('openai', model_name, messages, params) # type: ignore
+			cached = cache.get(key)
+			if cached is not None:
+				append_line(file, json.dumps({
+					"index": i,
+					"custom_id": ids[i],
+					"response": {"status_code": 200, "body": cached},
+					"error": None,
+				}))
+				return
+		reserved = estimate_tokens(json.dumps(messages)) + max_tokens
+		async with semaphore:
+			for retry in range(max_rate_limit_retries + 1):
+				await limiter.acquire_async(reserved)
+				try:
+					raw = await client.chat.completions.with_raw_response.create(
+						model=model_name,
+						messages=messages,
+						max_tokens=max_tokens,
+						temperature=temperature,
+						top_p=top_p,
+						stop=[STOP_SEQUENCE],
+						stream=True,
+						stream_options={"include_usage": True},
+					)
+					break
+				except RateLimitError as e:
+					limiter.settle(reserved, 0)
+					if retry == max_rate_limit_retries:
+						raise
+					limiter.on_rate_limited(e.response.headers)
+			limiter.update(raw.headers)
+			start = time.perf_counter()
+			body = await read_openai_stream(raw.parse(), SyntaxMonitor())
+		if body['usage']:
+			limiter.settle(reserved, body['usage']['total_tokens'])
+		if body['choices'][0]['finish_reason'] == 'aborted':
+			logger.warning('Response #%d (%s) aborted after %.2f seconds: %s', i, ids[i], time.perf_counter() - start, body['abort_reason'])
+		elif cache is not None:
+			cache.put(key, 'openai', model_name, body)
+		append_line(file, json.dumps({
+			"index": i,
+			"custom_id": ids[i],
+			"response": {"status_code": 200, "body": body},
+			"error": None,
+		}))
+
+	async def _request(i: int, file):
+		try:
+			await request(i, file)
+		except Exception as e:
+			logger.error('Request #%d (%s) failed: %s', i, ids[i], e)
+			append_line(file, json.dumps({
+				"index": i,
+				"custom_id": ids[i],
+				"response": None,
+				"error": {"type": e.__class__.__name__, "message": str(e)},
+			}))
+
+	with open(output_file, 'w', encoding='utf-8') as file:
+		await asyncio.gather(*(_request(i, file) for i in range(len(user_prompts))))
+	if cache is not None:
+		cache.log_stats()
+	sort_indexed_lines(output_file)
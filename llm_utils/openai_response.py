@@ -1,12 +1,31 @@
-from typing import Callable, Literal
+from typing import Callable, Literal, Optional
 
 import json
+from logging import Logger, getLogger
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
 	from z3 import CheckSatResult
 
+def get_error(result: str) -> Optional[str]:
+	"""
+	Why the request of a saved response failed, if so: an error line, or a response other than 200.
+	"""
+	j = json.loads(result)
+	error = j.get('error')
+	if error:
+		return f"{error.get('type') or error.get('code')}: {error.get('message')}"
+	if not j.get('response'):
+		return 'No response.'
+	if j['response'].get('status_code', 200) != 200:
+		return f"Status {j['response']['status_code']}: {j['response']['body'].get('error')}"
+	return None
+
 def get_assistant_content(result: str):
+	error = get_error(result)
+	if error is not None:
+		from .response import ResponseError
+		raise ResponseError(f'Request failed with {error}')
 	j = json.loads(result)
 	choices: list[dict] = j['response']['body']['choices']
 	assert len(choices) == 1
@@ -15,18 +34,41 @@ def get_assistant_content(result: str):
 	content = message['content']
 	return content
 
+def get_custom_id(result: str) -> str:
+	j = json.loads(result)
+	return j['custom_id']
+
+def read_responses(
+	response_file_path: str,
+):
+	from .response import collect_responses
+
+	with open(response_file_path, 'r', encoding='utf-8') as file:
+		return collect_responses([line for line in file if line.strip()], lambda i, line: get_custom_id(line), get_assistant_content)
+
 def check_batch_response(
 	response_file_path: str,
 	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
 	use_definitions: bool = True,
 	use_common_knowledge: bool = True,
 	sync: bool = False,
+	journal_path: Optional[str] = None,
+	method: str = 'judge',
+	indices_from_ids: bool = False,
+	logger: Logger = getLogger(__name__),
 ):
-	from .response import process_response, check_responses
+	"""
+	Failed requests and responses that cannot be processed are journaled as LLM failures without being checked,
+	so that `retry.get_failed_ids` finds them.
 
-	with open(response_file_path, 'r', encoding='utf-8') as file:
-		responses = [
-			process_response(get_assistant_content(line))
-			for line in file
-		]
-	return check_responses(responses, check_cb, use_definitions, use_common_knowledge, sync)
+	Args:
+		indices_from_ids: pass `check_cb` the prompt index in each custom id by `batch_writer.format_custom_id`
+			instead of the line number, e.g. for batches without the prompts answered from the response cache.
+	"""
+	from .batch_writer import get_custom_id_key
+	from .response import check_responses
+
+	items = read_responses(response_file_path)
+	return check_responses([response for _, response in items], check_cb, use_definitions, use_common_knowledge, sync, logger,
+		ids=[id for id, _ in items], journal_path=journal_path, method=method,
+		indices=[get_custom_id_key(id)[0] for id, _ in items] if indices_from_ids else None)
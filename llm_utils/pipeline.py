@@ -0,0 +1,156 @@
+from typing import Any, Callable, Optional, Sequence
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import Logger, getLogger
+import os
+import threading
+import time
+from z3 import CheckSatResult
+
+from .execute import execute_code
+from .journal import CheckJournal, load_outcome
+from .response import ResponseError, process_response, tally_result
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from .journal import Outcome
+
+_logger = getLogger(__name__)
+
+class VerificationPipeline:
+	"""
+	Verify responses while the rest are still being requested.
+
+	Each response submitted by a request loop, e.g. as `on_response` of `batch_request_async` or `request_and_save`,
+	is processed into a program and executed right away by a pool of `max_workers` threads,
+	each running one program in a subprocess, so that waiting on the LLM and solving overlap.
+	Responses are tallied in order on `close`, prompts never submitted count as LLM failures.
+
+	Args:
+		get_content: extract the program text from a submitted response.
+		ids: ids of the prompts, used as journal keys. Defaults to indices.
+		journal_path: path of the checkpoint journal. Finished items in it are not executed again.
+		method: `Logic` method producing the verdicts.
+	"""
+	def __init__(self,
+		total: int,
+		check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+		get_content: Callable[[Any], str] = lambda response: response,
+		use_definitions: bool = True,
+		use_common_knowledge: bool = True,
+		timeout: Optional[float] = 30,
+		max_workers: Optional[int] = None,
+		ids: Optional[Sequence[str]] = None,
+		journal_path: Optional[str] = None,
+		flush_every: int = 16,
+		method: str = 'judge',
+		logger: Logger = _logger,
+	):
+		self.total = total
+		self.check_cb = check_cb
+		self.get_content = get_content
+		self.use_definitions = use_definitions
+		self.use_common_knowledge = use_common_knowledge
+		self.timeout = timeout
+		self.method = method
+		self.ids = list(ids) if ids is not None else [str(i) for i in range(total)]
+		assert len(self.ids) == total, f'len(ids) ({len(self.ids)}) does not match total ({total}).'
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._executor = ThreadPoolExecutor(max_workers or os.cpu_count())
+		self._futures: dict[int, Future] = {}
+		self._journal = CheckJournal(journal_path, flush_every, logger) if journal_path else None
+
+		self.results: "dict[int, tuple[Outcome, float]]" = {}
+		if self._journal:
+			for i, id in enumerate(self.ids):
+				entry = self._journal.get(id)
+				if entry is not None:
+					self.results[i] = load_outcome(entry), entry['elapsed']
+			logger.info('%d of %d responses already checked.', len(self.results), total)
+
+	def _record(self, i: int, result: "Outcome", elapsed: float):
+		with self._lock:
+			self.results[i] = result, elapsed
+			if self._journal:
+				self._journal.record(self.ids[i], i, result, elapsed)
+
+	def _execute(self, i: int, program: str):
+		start = time.perf_counter()
+		result = execute_code(program, {}, self._logger, self.use_definitions, self.use_common_knowledge, False, self.timeout, self.method)
+		self._record(i, result, time.perf_counter() - start)
+		self._logger.info('Checked response #%d.', i)
+		return result
+
+	def submit(self, i: int, response: Any):
+		"""
+		Process the response to prompt `i` and schedule its program. Safe to call from any thread.
+		"""
+		with self._lock:
+			if i in self.results or i in self._futures:
+				return
+		try:
+			program = process_response(self.get_content(response))
+		except (AssertionError, KeyError, TypeError, ResponseError) as e:
+			self._logger.error('Response #%d (%s) failed: %s', i, self.ids[i], e)
+			self._record(i, (False, ResponseError(str(e))), 0.)
+			return
+		self.submit_program(i, program)
+
+	def submit_program(self, i: int, program: str):
+		"""
+		Schedule an already processed program for prompt `i`.
+		"""
+		with self._lock:
+			if i in self.results or i in self._futures:
+				return
+			self._futures[i] = self._executor.submit(self._execute, i, program)
+
+	def wait(self) -> "dict[int, tuple[Outcome, float]]":
+		"""
+		Wait for the scheduled programs without tallying them.
+
+		Returns:
+			(outcome, elapsed seconds) of each submitted prompt, by index.
+		"""
+		self._executor.shutdown(wait=True)
+		if self._journal:
+			self._journal.close()
+		return self.results
+
+	def close(self):
+		"""
+		Wait for the scheduled programs and tally the results.
+
+		Returns:
+			correct, wrong, llm_failed, z3_failed, total
+		"""
+		self.wait()
+		for i in range(self.total):
+			if i not in self.results:
+				self._logger.error('No response to #%d (%s).', i, self.ids[i])
+				self.results[i] = (False, ResponseError('No response.')), 0.
+
+		correct = 0
+		wrong = 0
+		llm_failed = 0
+		z3_failed = 0
+		total = 0
+		for i in range(self.total):
+			c, w, l, f, t = tally_result(i, self.results[i][0], self.check_cb, self._logger)
+			correct += c
+			wrong += w
+			llm_failed += l
+			z3_failed += f
+			total += t
+		return correct, wrong, llm_failed, z3_failed, total
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		if exc_type is not None:
+			# Drop the programs not started yet, the running ones finish within the timeout.
+			self._executor.shutdown(wait=True, cancel_futures=True)
+			if self._journal:
+				self._journal.close()
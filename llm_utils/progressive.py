@@ -0,0 +1,192 @@
+from typing import Callable, Hashable, Optional, Sequence, TypedDict
+
+import asyncio
+import itertools
+from logging import Logger, getLogger
+import math
+import os
+import random
+from statistics import NormalDist
+import time
+
+from async_utils import run_interruptible
+from .execute import execute_code
+from .response import ResponseError, process_response, tally_result
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from z3.z3 import CheckSatResult
+	from .journal import Outcome
+	from .resample import Sampler
+
+_logger = getLogger(__name__)
+
+class ProgressiveResult(TypedDict):
+	correct: int
+	wrong: int
+	llm_failed: int
+	z3_failed: int
+	total: int
+	accuracy: float
+	interval: tuple[float, float]
+	checked: list[int]
+	stopped_early: bool
+
+def wilson_interval(
+	correct: int,
+	total: int,
+	confidence: float = 0.95,
+) -> tuple[float, float]:
+	"""
+	Wilson score interval of a binomial proportion.
+	"""
+	if total == 0:
+		return 0., 1.
+	z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+	p = correct / total
+	denominator = 1 + z * z / total
+	center = (p + z * z / (2 * total)) / denominator
+	half = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+	return max(0., center - half), min(1., center + half)
+
+def stratified_order(
+	strata: Sequence[Hashable],
+	seed: int = 0,
+) -> list[int]:
+	"""
+	Random order of indices in which every prefix is approximately stratified.
+
+	Items of each stratum are shuffled, then spread evenly over [0, 1) with a random offset, and merged by position.
+	"""
+	rng = random.Random(seed)
+	groups: dict[Hashable, list[int]] = {}
+	for i, stratum in enumerate(strata):
+		groups.setdefault(stratum, []).append(i)
+
+	keyed: list[tuple[float, float, int]] = []
+	for indices in groups.values():
+		rng.shuffle(indices)
+		offset = rng.random()
+		n = len(indices)
+		for j, i in enumerate(indices):
+			keyed.append(((j + offset) / n, rng.random(), i))
+	keyed.sort()
+	return [i for _, _, i in keyed]
+
+async def progressive_check_async(
+	user_prompts: Sequence[str],
+	sample: "Sampler",
+	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
+	strata: Optional[Sequence[Hashable]] = None,
+	target_width: float = 0.1,
+	confidence: float = 0.95,
+	min_items: int = 30,
+	max_items: Optional[int] = None,
+	seed: int = 0,
+	max_concurrency: int = 4,
+	use_definitions: bool = True,
+	use_common_knowledge: bool = True,
+	timeout: Optional[float] = 30,
+	max_workers: Optional[int] = None,
+	method: str = 'judge',
+	logger: Logger = _logger,
+) -> ProgressiveResult:
+	"""
+	Verify items in a stratified random order until the confidence interval of the accuracy is narrow enough.
+
+	`max_concurrency` items are sampled and verified at a time, and the interval is tested as each one completes.
+	Items still in flight when it is narrow enough are cancelled, and no item beyond `max_items` is ever sampled.
+
+	Args:
+		sample: e.g. `anthropic_request.get_sampler`, called once per item.
+		strata: stratum of each item, e.g. the label. Defaults to a plain random order.
+		target_width: stop once the width of the interval is at most this.
+		min_items: never stop before checking this many items.
+		max_items: never sample more than this many items.
+		max_workers: number of programs executed at a time.
+	"""
+	order = stratified_order(strata if strata is not None else [0] * len(user_prompts), seed)
+	if max_items is not None:
+		order = order[:max_items]
+	solvers = asyncio.Semaphore(max_workers or os.cpu_count() or 1)
+
+	async def check(i: int) -> "Outcome":
+		try:
+			program = process_response(await sample(user_prompts[i], []))
+		except Exception as e:
+			logger.error('Response #%d failed: %s', i, e)
+			return False, ResponseError(str(e))
+		async with solvers:
+			return await asyncio.to_thread(
+				execute_code, program, {}, logger, use_definitions, use_common_knowledge, False, timeout, method)
+
+	counts = [0, 0, 0, 0, 0]
+	checked: list[int] = []
+	interval = 0., 1.
+	start = time.perf_counter()
+	queue = iter(order)
+	running: "dict[asyncio.Task[Outcome], int]" = {}
+	try:
+		while True:
+			for i in itertools.islice(queue, max_concurrency - len(running)):
+				running[asyncio.create_task(check(i))] = i
+			if not running:
+				break
+			done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				i = running.pop(task)
+				for k, count in enumerate(tally_result(i, task.result(), check_cb, logger)):
+					counts[k] += count
+				checked.append(i)
+
+			correct, total = counts[0], counts[4]
+			interval = wilson_interval(correct, total, confidence)
+			logger.info('%d/%d checked, accuracy %.4f, %.0f%% CI [%.4f, %.4f].',
+				len(checked), len(order), correct / total if total else float('nan'), confidence * 100, *interval)
+			if len(checked) >= min_items and interval[1] - interval[0] <= target_width:
+				break
+	finally:
+		for task in running:
+			task.cancel()
+		await asyncio.gather(*running, return_exceptions=True)
+
+	correct, wrong, llm_failed, z3_failed, total = counts
+	stopped_early = len(checked) < len(order)
+	logger.info('%s after %d items in %.2f seconds.',
+		'Stopped early' if stopped_early else 'Finished', len(checked), time.perf_counter() - start)
+	return {
+		"correct": correct,
+		"wrong": wrong,
+		"llm_failed": llm_failed,
+		"z3_failed": z3_failed,
+		"total": total,
+		"accuracy": correct / total if total else float('nan'),
+		"interval": interval,
+		"checked": checked,
+		"stopped_early": stopped_early,
+	}
+
+def progressive_check(
+	user_prompts: Sequence[str],
+	sample: "Sampler",
+	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
+	strata: Optional[Sequence[Hashable]] = None,
+	target_width: float = 0.1,
+	confidence: float = 0.95,
+	min_items: int = 30,
+	max_items: Optional[int] = None,
+	seed: int = 0,
+	max_concurrency: int = 4,
+	use_definitions: bool = True,
+	use_common_knowledge: bool = True,
+	timeout: Optional[float] = 30,
+	max_workers: Optional[int] = None,
+	method: str = 'judge',
+	logger: Logger = _logger,
+) -> ProgressiveResult:
+	"""
+	See `progressive_check_async`.
+	"""
+	return run_interruptible(progressive_check_async(
+		user_prompts, sample, check_cb, strata, target_width, confidence, min_items, max_items, seed, max_concurrency,
+		use_definitions, use_common_knowledge, timeout, max_workers, method, logger))
@@ -0,0 +1,190 @@
+from typing import Any, Iterable, Optional, Sequence, TypedDict
+
+import json
+from logging import Logger, getLogger
+
+from .prompting import get_demos
+from .rate_limit import estimate_tokens
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from anthropic.types.beta.beta_message_param import BetaMessageParam
+	from anthropic.types.beta.beta_text_block_param import BetaTextBlockParam
+
+	from .prompting import Message
+
+_logger = getLogger(__name__)
+
+MAX_BREAKPOINTS = 4
+LOOKBACK_BLOCKS = 20
+"""
+number of blocks before a breakpoint checked for a cache hit
+"""
+
+def min_cacheable_tokens(model: str):
+	"""
+	Shortest prefix the provider caches.
+	"""
+	return 2048 if 'haiku' in model else 1024
+
+def get_demo_boundaries(
+	file_path = 'demos/common.py',
+	additional_path: Optional[str] = None,
+	replace = False,
+) -> list[int]:
+	"""
+	Numbers of demos after which the prompt prefix is shared with other demos variants:
+	demos of `file_path` are shared with runs without `additional_path`, unless replaced.
+	"""
+	if not additional_path or replace:
+		return []
+	_, demos = get_demos(file_path)
+	return [len(demos)]
+
+def plan_breakpoints(
+	system: str,
+	demos: "Sequence[Sequence[Message]]",
+	boundaries: Iterable[int] = (),
+	max_breakpoints: int = MAX_BREAKPOINTS,
+	min_tokens: int = 1024,
+) -> list[int]:
+	"""
+	Place cache breakpoints on the system message and demos to maximize the cached shared prefix.
+
+	Breakpoints are numbers of demos after which the prefix is cached, 0 being the end of the system message.
+	In order of priority: all demos, shared with every prompt; `boundaries`, shared with other demos variants;
+	the system message, shared with any demos; then breakpoints splitting runs longer than the cache lookback.
+	Prefixes shorter than `min_tokens` are not cacheable, and get no breakpoint.
+	"""
+	prefix_tokens = [estimate_tokens(system)]
+	for pair in demos:
+		prefix_tokens.append(prefix_tokens[-1] + sum(estimate_tokens(message['content']) for message in pair))
+
+	breakpoints: list[int] = []
+	def add(position: int):
+		if len(breakpoints) < max_breakpoints and position not in breakpoints and prefix_tokens[position] >= min_tokens:
+			breakpoints.append(position)
+
+	add(len(demos))
+	for position in sorted(set(boundaries), reverse=True):
+		if 0 < position < len(demos):
+			add(position)
+	add(0)
+	while len(breakpoints) < max_breakpoints:
+		# Each demo is two blocks, the system message one.
+		ordered = sorted(breakpoints)
+		gaps = [(b - a, a) for a, b in zip([0, *ordered], ordered) if 2 * (b - a) > LOOKBACK_BLOCKS]
+		if not gaps:
+			break
+		_, start = max(gaps)
+		position = start + LOOKBACK_BLOCKS // 2
+		if position in breakpoints or prefix_tokens[position] < min_tokens:
+			break
+		add(position)
+	return sorted(breakpoints)
+
+def _cached_block(text: str) -> "BetaTextBlockParam":
+	return {
+		"type": 'text',
+		"text": text,
+		"cache_control": {
+			"type": 'ephemeral'
+		},
+	}
+
+def get_cached_prompt(
+	system: str,
+	demos: "Sequence[Sequence[Message]]",
+	boundaries: Iterable[int] = (),
+	max_breakpoints: int = MAX_BREAKPOINTS,
+	min_tokens: int = 1024,
+	logger: Logger = _logger,
+) -> "tuple[list[BetaTextBlockParam], list[BetaMessageParam]]":
+	"""
+	System blocks and demo messages with cache breakpoints placed by `plan_breakpoints`.
+	"""
+	breakpoints = plan_breakpoints(system, demos, boundaries, max_breakpoints, min_tokens)
+	logger.debug('Cache breakpoints after demos %s.', breakpoints)
+	system_blocks: "list[BetaTextBlockParam]" = [
+		_cached_block(system) if 0 in breakpoints else {"type": 'text', "text": system}
+	]
+	messages: "list[BetaMessageParam]" = []
+	for i, pair in enumerate(demos):
+		for j, message in enumerate(pair):
+			cached = i + 1 in breakpoints and j == len(pair) - 1
+			messages.append({
+				"role": message['role'],
+				"content": [_cached_block(message['content'])] if cached else message['content'],
+			})
+	return system_blocks, messages
+
+class CacheUsage(TypedDict):
+	requests: int
+	hits: int
+	"""
+	requests reading from the cache
+	"""
+	writes: int
+	"""
+	requests writing to the cache
+	"""
+	cache_read_input_tokens: int
+	cache_creation_input_tokens: int
+	input_tokens: int
+	"""
+	uncached input tokens
+	"""
+	output_tokens: int
+	hit_rate: float
+	"""
+	share of input tokens read from the cache
+	"""
+
+def summarize_usage(usages: Iterable[dict[str, Any]]) -> CacheUsage:
+	summary: CacheUsage = {
+		"requests": 0,
+		"hits": 0,
+		"writes": 0,
+		"cache_read_input_tokens": 0,
+		"cache_creation_input_tokens": 0,
+		"input_tokens": 0,
+		"output_tokens": 0,
+		"hit_rate": float('nan'),
+	}
+	for usage in usages:
+		read = usage.get('cache_read_input_tokens') or 0
+		creation = usage.get('cache_creation_input_tokens') or 0
+		summary['requests'] += 1
+		summary['hits'] += read > 0
+		summary['writes'] += creation > 0
+		summary['cache_read_input_tokens'] += read
+		summary['cache_creation_input_tokens'] += creation
+		summary['input_tokens'] += usage.get('input_tokens') or 0
+		summary['output_tokens'] += usage.get('output_tokens') or 0
+	total = summary['cache_read_input_tokens'] + summary['cache_creation_input_tokens'] + summary['input_tokens']
+	if total:
+		summary['hit_rate'] = summary['cache_read_input_tokens'] / total
+	return summary
+
+def read_usages(response_file_path: str) -> Iterable[dict[str, Any]]:
+	"""
+	Usage of each saved response, online (`batch_request_async`) or batch results.
+	"""
+	with open(response_file_path, 'r', encoding='utf-8') as file:
+		for line in file:
+			if not line.strip():
+				continue
+			j = json.loads(line)
+			if 'result' in j:
+				if j['result']['type'] == 'succeeded':
+					yield j['result']['message']['usage']
+			elif j.get('usage'):
+				yield j['usage']
+
+def log_usage(
+	summary: CacheUsage,
+	logger: Logger = _logger,
+):
+	logger.info('Prompt cache: %d of %d requests hit, %d wrote; %d tokens read, %d written, %d uncached (%.0f%% read).',
+		summary['hits'], summary['requests'], summary['writes'],
+		summary['cache_read_input_tokens'], summary['cache_creation_input_tokens'], summary['input_tokens'], summary['hit_rate'] * 100)
@@ -0,0 +1,223 @@
+from typing import Mapping, Optional
+
+import asyncio
+from datetime import datetime, timezone
+from logging import Logger, getLogger
+import re
+import threading
+import time
+
+_logger = getLogger(__name__)
+
+class TokenBucket:
+	"""
+	Token bucket refilled continuously at `capacity` per minute.
+	Reservations may overdraw the bucket, the debt is waited out by the caller.
+	"""
+	def __init__(self, per_minute: float):
+		self.capacity = per_minute
+		self.tokens = per_minute
+		self._updated = time.monotonic()
+
+	@property
+	def rate(self):
+		return self.capacity / 60
+
+	def _refill(self, now: float):
+		self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+		self._updated = now
+
+	def available(self, now: float):
+		self._refill(now)
+		return self.tokens
+
+	def reserve(self, amount: float, now: float):
+		"""
+		Take `amount` tokens.
+
+		Returns:
+			seconds to wait before using them.
+		"""
+		self._refill(now)
+		self.tokens -= amount
+		return max(0., -self.tokens / self.rate)
+
+	def refund(self, amount: float, now: float):
+		self._refill(now)
+		self.tokens = min(self.capacity, self.tokens + amount)
+
+	def update(self, limit: Optional[float], remaining: Optional[float], now: float):
+		"""
+		Adopt the limit and remaining tokens reported by the provider.
+		"""
+		self._refill(now)
+		if limit:
+			self.capacity = limit
+		if remaining is not None:
+			self.tokens = min(self.tokens, remaining)
+
+def _header(headers: Mapping[str, str], *names: str):
+	for name in names:
+		value = headers.get(name)
+		if value is not None:
+			return value
+	return None
+
+def _number(value: Optional[str]):
+	try:
+		return float(value) if value is not None else None
+	except ValueError:
+		return None
+
+def parse_duration(value: str) -> Optional[float]:
+	"""
+	Parse a reset hint into seconds: `1.5`, `6m0s`, `20ms` (OpenAI), or an RFC 3339 time (Anthropic).
+	"""
+	number = _number(value)
+	if number is not None:
+		return number
+	parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+	if parts and ''.join(n + u for n, u in parts) == value:
+		return sum(float(n) * {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}[u] for n, u in parts)
+	try:
+		return max(0., (datetime.fromisoformat(value.replace('Z', '+00:00')) - datetime.now(timezone.utc)).total_seconds())
+	except ValueError:
+		return None
+
+class RateLimiter:
+	"""
+	Requests-per-minute and tokens-per-minute limiter, shared by all clients of one provider model.
+
+	It starts from configured limits, adopts the limits and remaining budgets reported in rate-limit response headers,
+	and pauses every caller on 429 or overload responses, for the retry-after hint if given, otherwise with exponential backoff.
+	"""
+	def __init__(self,
+		requests_per_minute: float,
+		tokens_per_minute: Optional[float] = None,
+		max_backoff: float = 60,
+		logger: Logger = _logger,
+	):
+		self.requests = TokenBucket(requests_per_minute)
+		self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+		self.max_backoff = max_backoff
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._paused_until = 0.
+		self._failures = 0
+
+	def reserve(self, tokens: float = 0) -> float:
+		"""
+		Reserve one request and `tokens` tokens.
+
+		Returns:
+			seconds to wait before sending the request.
+		"""
+		with self._lock:
+			now = time.monotonic()
+			wait = self.requests.reserve(1, now)
+			if self.tokens and tokens:
+				wait = max(wait, self.tokens.reserve(tokens, now))
+			return max(wait, self._paused_until - now)
+
+	def try_acquire(self, tokens: float = 0) -> bool:
+		"""
+		Reserve one request and `tokens` tokens only if no wait is needed.
+		"""
+		with self._lock:
+			now = time.monotonic()
+			if now < self._paused_until or self.requests.available(now) < 1 \
+				or self.tokens and tokens and self.tokens.available(now) < tokens:
+				return False
+			self.requests.reserve(1, now)
+			if self.tokens and tokens:
+				self.tokens.reserve(tokens, now)
+			return True
+
+	def acquire(self, tokens: float = 0):
+		wait = self.reserve(tokens)
+		if wait > 0:
+			time.sleep(wait)
+
+	async def acquire_async(self, tokens: float = 0):
+		wait = self.reserve(tokens)
+		if wait > 0:
+			await asyncio.sleep(wait)
+
+	def settle(self, reserved: float, used: float):
+		"""
+		Refund reserved tokens a response did not use.
+		"""
+		if self.tokens and reserved > used:
+			with self._lock:
+				self.tokens.refund(reserved - used, time.monotonic())
+
+	def update(self, headers: Mapping[str, str]):
+		"""
+		Adopt rate-limit headers of a successful response, from Anthropic or OpenAI.
+		"""
+		with self._lock:
+			now = time.monotonic()
+			self._failures = 0
+			self.requests.update(
+				_number(_header(headers, 'anthropic-ratelimit-requests-limit', 'x-ratelimit-limit-requests')),
+				_number(_header(headers, 'anthropic-ratelimit-requests-remaining', 'x-ratelimit-remaining-requests')),
+				now,
+			)
+			token_limit = _number(_header(headers, 'anthropic-ratelimit-tokens-limit', 'x-ratelimit-limit-tokens'))
+			if self.tokens is None and token_limit:
+				self.tokens = TokenBucket(token_limit)
+			if self.tokens:
+				self.tokens.update(
+					token_limit,
+					_number(_header(headers, 'anthropic-ratelimit-tokens-remaining', 'x-ratelimit-remaining-tokens')),
+					now,
+				)
+
+	def on_rate_limited(self, headers: Optional[Mapping[str, str]] = None):
+		"""
+		Pause all callers after a 429 or overload response.
+
+		Returns:
+			seconds paused.
+		"""
+		with self._lock:
+			self._failures += 1
+			retry_after = None
+			if headers:
+				retry_after_ms = _number(headers.get('retry-after-ms'))
+				retry_after = retry_after_ms / 1000 if retry_after_ms is not None else None
+				if retry_after is None and headers.get('retry-after'):
+					retry_after = parse_duration(headers['retry-after'])
+				if retry_after is None:
+					reset = _header(headers, 'anthropic-ratelimit-requests-reset', 'x-ratelimit-reset-requests')
+					retry_after = parse_duration(reset) if reset else None
+			if retry_after is None:
+				retry_after = min(self.max_backoff, 2 ** (self._failures - 1))
+			now = time.monotonic()
+			self._paused_until = max(self._paused_until, now + retry_after)
+			self.requests.tokens = min(self.requests.tokens, 0)
+			self._logger.warning('Rate limited, pausing for %.1f seconds.', retry_after)
+			return retry_after
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(
+	key: str,
+	requests_per_minute: float = 50,
+	tokens_per_minute: Optional[float] = None,
+) -> RateLimiter:
+	"""
+	Shared limiter of `key`, e.g. `anthropic/claude-3-5-sonnet-20240620`, created with the given limits on first use.
+	"""
+	with _limiters_lock:
+		limiter = _limiters.get(key)
+		if limiter is None:
+			limiter = _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+		return limiter
+
+def estimate_tokens(text: str) -> int:
+	"""
+	Rough token count of a text, for reservations before the usage is known.
+	"""
+	return len(text) // 4 + 1
@@ -0,0 +1,185 @@
+from typing import Awaitable, Callable, Optional, Sequence
+
+import asyncio
+from collections import Counter
+import json
+from logging import Logger, getLogger
+import os
+import time
+from z3 import CheckSatResult, sat, unsat
+
+from async_utils import run_interruptible
+from file_utils import append_line
+from .execute import execute_code
+from .journal import dump_outcome
+from .response import ResponseError, process_response, tally_result
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from .journal import Outcome
+
+	Sampler = Callable[[str, Sequence[tuple[str, str]]], Awaitable[str]]
+
+_logger = getLogger(__name__)
+
+def is_decisive(outcome: "Outcome"):
+	"""
+	Whether the program executed and no verdict is `unknown` or `unsat` (paradox premises).
+	"""
+	if outcome[0] != True:
+		return False
+	return all(isinstance(verdict, bool) or verdict == sat for verdict in outcome[1])
+
+def get_feedback(outcome: "Outcome") -> str:
+	"""
+	Feedback on a failed candidate, asking for a corrected program.
+	"""
+	if outcome[0] != True:
+		error = outcome[1]
+		if isinstance(error, ResponseError):
+			problem = f'Your response does not contain a processable function: {error}'
+		elif isinstance(error, TimeoutError):
+			problem = 'Solving the function timed out. Simplify the quantified expressions.'
+		else:
+			problem = f'Executing the function failed with {error.__class__.__name__}: {error}'
+	elif any(isinstance(verdict, CheckSatResult) and verdict == unsat for verdict in outcome[1]):
+		problem = 'The premises and the assertions are contradictory (paradox). Check the claims and common knowledge.'
+	else:
+		problem = 'Z3 returned unknown on the assertions. Avoid undecidable constructs, e.g. nested quantifiers over infinite sorts.'
+	return problem + '\nFix the function, and answer with the whole corrected function only.'
+
+def _key(outcome: "Outcome"):
+	return tuple(str(verdict) for verdict in outcome[1])
+
+async def resample_async(
+	user_prompts: Sequence[str],
+	sample: "Sampler",
+	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+	output_file: str,
+	max_candidates: int = 4,
+	quorum: int = 1,
+	feedback: bool = True,
+	custom_ids: Optional[Sequence[str]] = None,
+	use_definitions: bool = True,
+	use_common_knowledge: bool = True,
+	timeout: Optional[float] = 30,
+	max_workers: Optional[int] = None,
+	method: str = 'judge',
+	logger: Logger = _logger,
+):
+	"""
+	Sample up to `max_candidates` candidates per prompt, verifying each one as soon as it arrives,
+	and stop sampling a prompt once `quorum` decisive candidates agree on the verdicts.
+	Prompts are resolved concurrently, sampling is paced by the sampler and solving by `max_workers`.
+
+	The selected candidate is the agreeing one, otherwise the most voted decisive one,
+	otherwise the first one that executed, otherwise the last one.
+	The candidates of each prompt are written to `output_file` as a line tagged with its `index` and `custom_id`.
+
+	Args:
+		sample: e.g. `anthropic_request.get_sampler`, with temperature > 0 for independent samples.
+		feedback: show the sampler the failed candidates with their errors, so that it corrects them.
+
+	Returns:
+		correct, wrong, llm_failed, z3_failed, total, and the number of candidates sampled.
+	"""
+	from .anthropic_request import sort_indexed_lines
+
+	ids = list(custom_ids) if custom_ids is not None else [str(i) for i in range(len(user_prompts))]
+	assert len(ids) == len(user_prompts), f'len(custom_ids) ({len(ids)}) does not match len(user_prompts) ({len(user_prompts)}).'
+	solvers = asyncio.Semaphore(max_workers or os.cpu_count() or 1)
+	selected: "list[Outcome]" = [(False, ResponseError('No candidate.'))] * len(user_prompts)
+	sampled = 0
+
+	async def verify(content: str) -> "tuple[Outcome, float]":
+		try:
+			program = process_response(content)
+		except (AssertionError, ResponseError) as e:
+			return (False, ResponseError(str(e))), 0.
+		async with solvers:
+			start = time.perf_counter()
+			outcome = await asyncio.to_thread(
+				execute_code, program, {}, logger, use_definitions, use_common_knowledge, False, timeout, method)
+			return outcome, time.perf_counter() - start
+
+	async def resolve(i: int, file):
+		nonlocal sampled
+		history: list[tuple[str, str]] = []
+		candidates: "list[tuple[Optional[str], Outcome, float]]" = []
+		votes: Counter[tuple[str, ...]] = Counter()
+		for k in range(max_candidates):
+			try:
+				content = await sample(user_prompts[i], history)
+			except Exception as e:
+				logger.error('Sampling candidate %d of #%d failed: %s', k, i, e)
+				candidates.append((None, (False, e), 0.))
+				continue
+			sampled += 1
+			outcome, elapsed = await verify(content)
+			candidates.append((content, outcome, elapsed))
+			if is_decisive(outcome):
+				votes[_key(outcome)] += 1
+				if votes[_key(outcome)] >= quorum:
+					break
+			elif feedback:
+				history.append((content, get_feedback(outcome)))
+
+		if votes:
+			verdicts, count = votes.most_common(1)[0]
+			choice = next(j for j, (_, outcome, _) in enumerate(candidates) if is_decisive(outcome) and _key(outcome) == verdicts)
+		else:
+			count = 0
+			choice = next((j for j, (_, outcome, _) in enumerate(candidates) if outcome[0] == True), len(candidates) - 1)
+		selected[i] = candidates[choice][1]
+		logger.info('#%d resolved after %d candidates, %d agreeing.', i, len(candidates), count)
+		append_line(file, json.dumps({
+			"index": i,
+			"custom_id": ids[i],
+			"selected": choice,
+			"candidates": [
+				{"response": content, **dump_outcome(ids[i], i, outcome, elapsed)}
+				for content, outcome, elapsed in candidates
+			],
+		}, ensure_ascii=False))
+
+	with open(output_file, 'w', encoding='utf-8') as file:
+		await asyncio.gather(*(resolve(i, file) for i in range(len(user_prompts))))
+	sort_indexed_lines(output_file)
+
+	correct = 0
+	wrong = 0
+	llm_failed = 0
+	z3_failed = 0
+	total = 0
+	for i, outcome in enumerate(selected):
+		c, w, l, f, t = tally_result(i, outcome, check_cb, logger)
+		correct += c
+		wrong += w
+		llm_failed += l
+		z3_failed += f
+		total += t
+	logger.info('Sampled %d candidates for %d prompts.', sampled, len(user_prompts))
+	return correct, wrong, llm_failed, z3_failed, total, sampled
+
+def resample(
+	user_prompts: Sequence[str],
+	sample: "Sampler",
+	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+	output_file: str,
+	max_candidates: int = 4,
+	quorum: int = 1,
+	feedback: bool = True,
+	custom_ids: Optional[Sequence[str]] = None,
+	use_definitions: bool = True,
+	use_common_knowledge: bool = True,
+	timeout: Optional[float] = 30,
+	max_workers: Optional[int] = None,
+	method: str = 'judge',
+	logger: Logger = _logger,
+):
+	"""
+	See `resample_async`.
+	"""
+	return run_interruptible(resample_async(
+		user_prompts, sample, check_cb, output_file, max_candidates, quorum, feedback, custom_ids,
+		use_definitions, use_common_knowledge, timeout, max_workers, method, logger))
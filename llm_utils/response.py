@@ -1,15 +1,27 @@
-from typing import Callable, Literal, Union
+from typing import Callable, Iterable, Optional, Sequence, TypeVar
 
 import asyncio
 from logging import Logger, getLogger
 from z3 import CheckSatResult, unknown
 
+from async_utils import run_interruptible
+from z3_utils import ABLATION_GRID
 from .execute import execute_codes
+from .journal import CheckJournal, load_outcome
 
 from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from .journal import Outcome
+
+T = TypeVar('T')
 
 _logger = getLogger(__name__)
 
+class ResponseError(ValueError):
+	"""
+	The LLM response does not contain a processable program.
+	"""
+
 def process_response(content: str):
 	content = content.strip()
 	if content.__contains__('```'):
@@ -25,67 +37,233 @@ def process_response(content: str):
 		#assert content.endswith('return l'), f'Expecting code block to end with "return l", got "{content[-10:]}".'
 		return content
 
+def collect_responses(
+	items: Iterable[T],
+	get_id: Callable[[int, T], str],
+	get_content: Callable[[T], str],
+	logger: Logger = _logger,
+) -> "list[tuple[str, str | ResponseError]]":
+	"""
+	Process raw responses into programs, keeping unprocessable ones as `ResponseError` in place.
+	"""
+	responses: "list[tuple[str, str | ResponseError]]" = []
+	for i, item in enumerate(items):
+		id = get_id(i, item)
+		try:
+			responses.append((id, process_response(get_content(item))))
+		except (AssertionError, KeyError, TypeError, ResponseError) as e:
+			logger.error('Response #%d (%s) failed: %s', i, id, e)
+			responses.append((id, ResponseError(str(e))))
+	return responses
+
 def check_responses(
-	responses: list[str],
+	responses: "Sequence[str | ResponseError]",
 	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
 	use_definitions: bool = True,
 	use_common_knowledge: bool = True,
 	sync: bool = False,
 	logger: Logger = _logger,
+	ids: Optional[Sequence[str]] = None,
+	journal_path: Optional[str] = None,
+	flush_every: int = 16,
+	method: str = 'judge',
+	indices: Optional[Sequence[int]] = None,
 ):
-	return asyncio.run(check_responses_async(responses, check_cb, use_definitions, use_common_knowledge, sync, logger))
+	"""
+	Args:
+		responses: programs, or `ResponseError` for responses that could not be processed,
+			which are journaled as failures without being executed, e.g. by `collect_responses`.
+		ids: ids of the responses, used as journal keys. Defaults to indices.
+		journal_path: path of the checkpoint journal. Finished items in it are skipped.
+		flush_every: number of outcomes to buffer before flushing the journal.
+		method: `Logic` method producing the verdicts, e.g. `judge_steps` for step-wise verdicts.
+		indices: dataset indices of the responses, if some were dropped before checking.
+			They are journaled and passed to `check_cb`. Defaults to positions in `responses`.
+	"""
+	return run_interruptible(check_responses_async(
+		responses, check_cb, use_definitions, use_common_knowledge, sync, logger, ids, journal_path, flush_every, method, indices))
+
+def tally_result(
+	i: int,
+	result: "Outcome",
+	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+	logger: Logger = _logger,
+) -> tuple[int, int, int, int, int]:
+	"""
+	Returns:
+		correct, wrong, llm_failed, z3_failed, total
+	"""
+	if result[0] == True or result[0] == False and isinstance(result[1], TimeoutError):
+		if isinstance(result[1], TimeoutError):
+			# Execution timed out. It should be a Z3 failure, however, it is very possible that the result is False.
+			logger.error('Execution timed out for #%d.', i)
+			c, w, f, t = check_cb(i, [unknown])
+		else:
+			if TYPE_CHECKING:
+				assert result[0] == True # very stupid
+			c, w, f, t = check_cb(i, result[1])
+		return c, w, 0, f, t
+	else:
+		logger.error('Failed to execute #%d: %s', i, result[1])
+		return 0, 0, 1, 0, 1
+
+async def execute_responses_async(
+	responses: "Sequence[str | ResponseError]",
+	use_definitions: bool,
+	use_common_knowledge: bool,
+	sync: bool,
+	logger: Logger,
+	ids: Optional[Sequence[str]] = None,
+	journal_path: Optional[str] = None,
+	flush_every: int = 16,
+	method: str = 'judge',
+	indices: Optional[Sequence[int]] = None,
+) -> "list[tuple[Outcome, float]]":
+	"""
+	Execute responses, skipping the ones finished in the journal. `ResponseError`s are journaled as failures.
+
+	Args:
+		indices: dataset indices of the responses to journal, defaults to positions in `responses`.
+
+	Returns:
+		(outcome, elapsed seconds) of each response.
+	"""
+	if ids is None:
+		ids = [str(i) for i in range(len(responses))]
+	assert len(ids) == len(responses), f'len(ids) ({len(ids)}) does not match len(responses) ({len(responses)}).'
+	if indices is None:
+		indices = range(len(responses))
+	assert len(indices) == len(responses), f'len(indices) ({len(indices)}) does not match len(responses) ({len(responses)}).'
+
+	journal = CheckJournal(journal_path, flush_every, logger) if journal_path else None
+
+	results: "dict[int, tuple[Outcome, float]]" = {}
+	pending: list[int] = []
+	for i, id in enumerate(ids):
+		entry = journal.get(id) if journal else None
+		response = responses[i]
+		if isinstance(response, ResponseError):
+			results[i] = (False, response), 0.
+			if journal and entry is None:
+				journal.record(id, indices[i], (False, response), 0.)
+		elif entry is None:
+			pending.append(i)
+		else:
+			results[i] = load_outcome(entry), entry['elapsed']
+
+	def on_result(j: int, result: "Outcome", elapsed: float):
+		i = pending[j]
+		results[i] = result, elapsed
+		if journal:
+			journal.record(ids[i], indices[i], result, elapsed)
+
+	logger.debug('Executing %d responses, %d skipped...', len(pending), len(responses) - len(pending))
+	tasks = execute_codes(
+		[responses[i] for i in pending], # type: ignore # ResponseErrors are not pending
+		use_definitions=use_definitions,
+		use_common_knowledge=use_common_knowledge,
+		sync=sync,
+		on_result=on_result,
+		method=method,
+	)
+
+	try:
+		for i, task in zip(pending, tasks):
+			logger.info('Checking response #%d...', i)
+			await task
+	except (KeyboardInterrupt, asyncio.CancelledError):
+		logger.warning('Interrupted, %d of %d responses checked.', len(results), len(responses))
+		raise
+	finally:
+		if journal:
+			journal.close()
+
+	return [results[i] for i in range(len(responses))]
 
 async def check_responses_async(
-	responses: list[str],
+	responses: "Sequence[str | ResponseError]",
 	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
 	use_definitions: bool,
 	use_common_knowledge: bool,
 	sync: bool,
 	logger: Logger,
+	ids: Optional[Sequence[str]] = None,
+	journal_path: Optional[str] = None,
+	flush_every: int = 16,
+	method: str = 'judge',
+	indices: Optional[Sequence[int]] = None,
 ):
+	results = await execute_responses_async(
+		responses, use_definitions, use_common_knowledge, sync, logger, ids, journal_path, flush_every, method, indices)
+
 	correct = 0
 	wrong = 0
 	llm_failed = 0
 	z3_failed = 0
 	total = 0
+	for i, (result, _) in enumerate(results):
+		c, w, l, f, t = tally_result(indices[i] if indices is not None else i, result, check_cb, logger)
+		correct += c
+		wrong += w
+		llm_failed += l
+		z3_failed += f
+		total += t
+
+	return correct, wrong, llm_failed, z3_failed, total
+
+def check_responses_grid(
+	responses: list[str],
+	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+	grid: Sequence[tuple[bool, bool]] = ABLATION_GRID,
+	sync: bool = False,
+	timeout: Optional[float] = None,
+	logger: Logger = _logger,
+):
+	"""
+	Check responses under each (use_definitions, use_common_knowledge) combination,
+	executing each response once and judging all combinations from the same `Logic`.
 
-	logger.debug('Executing %d responses...', len(responses))
+	Args:
+		timeout: timeout of each response, defaults to 30 seconds per combination.
+
+	Returns:
+		(correct, wrong, llm_failed, z3_failed, total) of each combination.
+	"""
+	return run_interruptible(check_responses_grid_async(responses, check_cb, grid, sync, timeout, logger))
+
+async def check_responses_grid_async(
+	responses: list[str],
+	check_cb: Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]],
+	grid: Sequence[tuple[bool, bool]],
+	sync: bool,
+	timeout: Optional[float],
+	logger: Logger,
+):
+	grid = list(grid)
 	tasks = execute_codes(
 		responses,
-		use_definitions=use_definitions,
-		use_common_knowledge=use_common_knowledge,
+		logger=logger,
+		# Assertions included in the premises fail only the combinations using them, see `judge_grid`.
+		use_definitions=False,
+		use_common_knowledge=False,
+		timeout=timeout or 30 * len(grid),
 		sync=sync,
+		method='judge_grid',
+		method_args=(grid,),
 	)
 
-	results = [] # type: list[Union[tuple[Literal[True], list[bool | CheckSatResult]], tuple[Literal[False], Exception]]]
+	tallies = {flags: [0, 0, 0, 0, 0] for flags in grid}
 	i = -1
 	for task in tasks:
 		i += 1
 		logger.info('Checking response #%d...', i)
 		result = await task
-		results.append(result)
-		if result[0] == True or result[0] == False and isinstance(result[1], TimeoutError):
-			if isinstance(result[1], TimeoutError):
-				# Execution timed out. It should be a Z3 failure, however, it is very possible that the result is False.
-				logger.error('Execution timed out for #%d.', i)
-				c, w, f, t = check_cb(i, [unknown])
-			else:
-				if TYPE_CHECKING:
-					assert result[0] == True # very stupid
-				c, w, f, t = check_cb(i, result[1])
-			correct += c
-			wrong += w
-			z3_failed += f
-			total += t
-			continue
-		else:
-			llm_failed += 1
-			total += 1
-			logger.error('Failed to execute #%d: %s', i, result[1])
-
-	print([
-		r[1][0] if r[0] == True else None
-		for r in results
-	])
+		for k, flags in enumerate(grid):
+			outcome = result[1][k] if result[0] == True else result
+			for n, count in enumerate(tally_result(i, outcome, check_cb, logger)):
+				tallies[flags][n] += count
 
-	return correct, wrong, llm_failed, z3_failed, total
+	return {
+		flags: tuple(tally)
+		for flags, tally in tallies.items()
+	}
@@ -0,0 +1,156 @@
+from typing import Any, Callable, Mapping, Optional, Sequence, TypeVar
+
+from logging import Logger, getLogger
+
+from .journal import JournalEntry, dump_outcome, load_outcome, read_journal
+from .response import ResponseError, tally_result
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	import pandas as pd
+	from z3.z3 import CheckSatResult
+
+T = TypeVar('T')
+
+_logger = getLogger(__name__)
+
+COUNT_COLUMNS = ['correct', 'wrong', 'llm_failed', 'z3_failed', 'total']
+
+def get_failure_class(entry: JournalEntry) -> Optional[str]:
+	"""
+	Returns:
+		`None` if nothing failed, otherwise one of `llm`, `timeout`, `exec`, `paradox`, `z3`.
+	"""
+	if not entry['success']:
+		if entry['error_type'] == ResponseError.__name__:
+			return 'llm'
+		return 'timeout' if entry['error_type'] == TimeoutError.__name__ else 'exec'
+	results = entry['results'] or []
+	if 'unknown' in results:
+		return 'z3'
+	if 'unsat' in results:
+		return 'paradox'
+	return None
+
+def _prediction(verdict: bool | str) -> str:
+	return str(verdict) # True, False, sat, unsat, unknown
+
+def build_results_table(
+	entries: "str | Mapping[str, JournalEntry]",
+	source: Sequence[T],
+	check_cb: "Callable[[int, list[bool | CheckSatResult]], tuple[int, int, int, int]]",
+	get_labels: Callable[[T], list[str]],
+	get_split: Optional[Callable[[T], str]] = None,
+	flags: Optional[Mapping[str, Any]] = None,
+	ids: Optional[Sequence[str]] = None,
+	get_prediction: Optional[Callable[[bool | str], str]] = None,
+	logger: Logger = _logger,
+) -> "pd.DataFrame":
+	"""
+	Build a results table with one row per response from a check journal.
+	Nothing is executed again, `check_cb` is replayed on the journaled verdicts.
+
+	Args:
+		entries: journal path, or entries read by `read_journal`.
+		source: dataset records, indexed by `JournalEntry.index` unless `ids` is given.
+		get_labels: gold labels of a record, one per assertion.
+		get_split: split name of a record.
+		flags: constant columns, e.g. `use_definitions`, to tell runs apart after concatenation.
+		ids: response ids of the records of `source`, in order. Records are looked up by id,
+			and ids missing from the journal, e.g. responses that could not be processed, are LLM failures.
+		get_prediction: label predicted by a verdict, e.g. `get_prediction` of the dataset module,
+			so that predictions and labels share the label set.
+	"""
+	import pandas as pd
+
+	if isinstance(entries, str):
+		entries = read_journal(entries, logger)
+	get_prediction = get_prediction or _prediction
+	if ids is not None:
+		missing = [id for id in ids if id not in entries]
+		if missing:
+			logger.warning('%d of %d ids are missing from the journal, counted as LLM failures.', len(missing), len(ids))
+		entries = {
+			id: {**entries[id], "index": i} if id in entries else dump_outcome(id, i, (False, ResponseError('Not checked, no processable response.')), 0.)
+			for i, id in enumerate(ids)
+		}
+
+	rows: list[dict[str, Any]] = []
+	for entry in sorted(entries.values(), key=lambda e: e['index']):
+		i = entry['index']
+		data = source[i]
+		labels = get_labels(data)
+		predictions = [get_prediction(r) for r in entry['results']] if entry['results'] is not None else []
+		# Pad to the labels, so that labels and predictions can be exploded together.
+		predictions = (predictions + ['error'] * len(labels))[:len(labels)]
+		counts = tally_result(i, load_outcome(entry), check_cb, logger)
+		rows.append({
+			"id": entry['id'],
+			"index": i,
+			"split": get_split(data) if get_split else None,
+			"labels": labels,
+			"predictions": predictions,
+			"n_assertions": len(entry['results']) if entry['results'] is not None else 0,
+			"failure": get_failure_class(entry),
+			"elapsed": entry['elapsed'],
+			**dict(zip(COUNT_COLUMNS, counts)),
+			**(flags or {}),
+		})
+
+	df = pd.DataFrame(rows, columns=[
+		'id', 'index', 'split', 'labels', 'predictions', 'n_assertions', 'failure', 'elapsed',
+		*COUNT_COLUMNS, *(flags or {}).keys(),
+	])
+	df['failure'] = df['failure'].astype('category')
+	return df
+
+def accuracy(df: "pd.DataFrame") -> float:
+	total = df['total'].sum()
+	return float(df['correct'].sum() / total) if total else float('nan')
+
+def summarize(
+	df: "pd.DataFrame",
+	by: "Optional[str | list[str]]" = 'split',
+) -> "pd.DataFrame":
+	"""
+	Sum up counts, per group if `by` is given, with accuracy and mean elapsed time.
+	"""
+	if by is None:
+		summary = df[COUNT_COLUMNS].sum().to_frame().T
+		summary['elapsed'] = df['elapsed'].mean()
+	else:
+		grouped = df.groupby(by, observed=True, dropna=False)
+		summary = grouped[COUNT_COLUMNS].sum()
+		summary['elapsed'] = grouped['elapsed'].mean()
+	summary['accuracy'] = summary['correct'] / summary['total']
+	return summary
+
+def confusion_matrix(
+	df: "pd.DataFrame",
+	by: "Optional[str | list[str]]" = None,
+) -> "pd.DataFrame":
+	"""
+	Confusion matrix of gold labels (rows) against predicted verdicts (columns), per assertion.
+	"""
+	import pandas as pd
+
+	keys = [] if by is None else [by] if isinstance(by, str) else list(by)
+	exploded = df.explode(['labels', 'predictions'])
+	return pd.crosstab(
+		[exploded[k] for k in keys] + [exploded['labels'].rename('label')],
+		exploded['predictions'].rename('prediction'),
+	)
+
+def compare_results(
+	tables: "Mapping[str, pd.DataFrame]",
+	column: str = 'correct',
+) -> "pd.DataFrame":
+	"""
+	Put one column of several results tables side by side, aligned on dataset index.
+	"""
+	import pandas as pd
+
+	return pd.concat({
+		name: df.set_index('index')[column]
+		for name, df in tables.items()
+	}, axis=1)
@@ -0,0 +1,117 @@
+from typing import Any, Iterable, Literal, Optional
+
+import json
+from logging import Logger, getLogger
+import os
+
+from file_utils import set_file_read_only
+from .batch_writer import ANTHROPIC_LIMITS, OPENAI_LIMITS, ShardedBatchWriter, read_requests
+from .journal import JournalEntry, read_journal
+
+_logger = getLogger(__name__)
+
+Provider = Literal['openai', 'anthropic']
+
+def needs_retry(
+	entry: Optional[JournalEntry],
+	retry_unknown: bool = True,
+):
+	"""
+	Whether a response has to be requested again: it has no outcome, e.g. it failed at `process_response`,
+	it failed to execute, or, if `retry_unknown`, a verdict is `unknown`.
+	"""
+	if entry is None or not entry['success']:
+		return True
+	return retry_unknown and entry['results'] is not None and 'unknown' in entry['results']
+
+def _succeeded(result: dict[str, Any], provider: Provider) -> bool:
+	if provider == 'anthropic':
+		return result['result']['type'] == 'succeeded'
+	return bool(result.get('response')) and result['response']['status_code'] == 200
+
+def read_results(result_path: str) -> Iterable[dict[str, Any]]:
+	with open(result_path, 'r', encoding='utf-8') as file:
+		for line in file:
+			if line.strip():
+				yield json.loads(line)
+
+def get_failed_ids(
+	result_path: str,
+	journal_path: str,
+	retry_unknown: bool = True,
+	logger: Logger = _logger,
+) -> list[str]:
+	"""
+	Custom ids of the batch results in `result_path` to retry after a check run journaled to `journal_path`.
+	"""
+	journal = read_journal(journal_path, logger)
+	ids = [result['custom_id'] for result in read_results(result_path)]
+	failed = [id for id in ids if needs_retry(journal.get(id), retry_unknown)]
+	logger.info('%d of %d responses to retry.', len(failed), len(ids))
+	return failed
+
+def generate_retry_batch(
+	request_paths: Iterable[str],
+	failed_ids: Iterable[str],
+	output_dir: str,
+	job_prefix: str,
+	provider: Provider,
+	**overrides,
+) -> list[str]:
+	"""
+	Write the original requests of `failed_ids` into a new batch, keeping their custom ids.
+
+	Args:
+		request_paths: batch files of the original run, e.g. the shards listed in its manifest.
+		overrides: request parameters to replace, e.g. `model` or `max_tokens`.
+
+	Returns:
+		paths of the shards.
+	"""
+	failed = set(failed_ids)
+	key = 'params' if provider == 'anthropic' else 'body'
+	max_requests, max_bytes = ANTHROPIC_LIMITS if provider == 'anthropic' else OPENAI_LIMITS
+	with ShardedBatchWriter(output_dir, job_prefix, 0, max_requests, max_bytes) as writer:
+		for request_path in request_paths:
+			for request in read_requests(request_path):
+				if request['custom_id'] not in failed:
+					continue
+				failed.remove(request['custom_id'])
+				writer.write({**request, key: {**request[key], **overrides}})
+	if failed:
+		_logger.warning('%d failed ids not found in the requests: %s', len(failed), sorted(failed)[:10])
+	return writer.paths
+
+def merge_results(
+	result_path: str,
+	retry_paths: Iterable[str],
+	output_path: str,
+	provider: Provider,
+	logger: Logger = _logger,
+) -> list[str]:
+	"""
+	Replace results of `result_path` by the successful results of the retry with the same custom ids,
+	keeping the original order.
+
+	Returns:
+		custom ids of the replaced results.
+	"""
+	retried: dict[str, dict[str, Any]] = {}
+	for retry_path in retry_paths:
+		for result in read_results(retry_path):
+			if _succeeded(result, provider):
+				retried[result['custom_id']] = result
+
+	replaced: list[str] = []
+	tmp_path = output_path + '.part'
+	with open(tmp_path, 'w', encoding='utf-8') as file:
+		for result in read_results(result_path):
+			custom_id = result['custom_id']
+			if custom_id in retried:
+				result = retried[custom_id]
+				replaced.append(custom_id)
+			print(json.dumps(result, ensure_ascii=False), file=file)
+	os.replace(tmp_path, output_path)
+	set_file_read_only(output_path)
+	logger.info('Merged %d of %d retried results into %s.', len(replaced), len(retried), output_path)
+	return replaced
@@ -0,0 +1,165 @@
+from typing import Any, Optional
+
+import codeop
+import warnings
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	from anthropic import AsyncStream as AnthropicStream
+	from anthropic.types.beta.beta_raw_message_stream_event import BetaRawMessageStreamEvent
+	from openai import AsyncStream as OpenAIStream
+	from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+
+# Programs end at `return l`, the stop sequence is excluded from the response and appended back,
+# with the closing fence of the code block if any.
+STOP_SEQUENCE = 'return l\n'
+STOP_TEXT = 'return l'
+
+class SyntaxMonitor:
+	"""
+	Incremental check that a streamed response can still be processed into a program by `process_response`:
+	either it starts with `def ` (always expected with a prefill), or it has a code block after at most `max_preamble` characters.
+	The code is compiled at each line break, and an irrecoverable syntax error aborts the response.
+	"""
+	def __init__(self,
+		prefill: Optional[str] = None,
+		max_preamble: int = 2000,
+	):
+		self.prefill = prefill or ''
+		self.max_preamble = max_preamble
+		self.generated = ''
+		self.error: Optional[str] = None
+		self._done = False
+
+	@property
+	def text(self):
+		return self.prefill + self.generated
+
+	def feed(self, chunk: str) -> Optional[str]:
+		"""
+		Returns:
+			why the response cannot be processed, if so.
+		"""
+		self.generated += chunk
+		if self.error is None and not self._done:
+			self.error = self._check('\n' in chunk)
+		return self.error
+
+	def _code(self) -> Optional[str]:
+		text = self.text
+		fence = text.find('```')
+		if fence != -1:
+			start = text.find('\n', fence)
+			if start == -1:
+				return None
+			end = text.find('```', start)
+			if end != -1:
+				self._done = True
+				return text[start + 1:end]
+			return text[start + 1:]
+		stripped = text.lstrip()
+		if stripped.startswith('def '):
+			return stripped
+		if self.prefill and len(stripped) >= 4:
+			raise SyntaxError(f'Expecting the response to start with "def ", got "{stripped[:10]}".')
+		if len(text) > self.max_preamble:
+			raise SyntaxError(f'No code in the first {self.max_preamble} characters.')
+		return None
+
+	def _check(self, line_break: bool) -> Optional[str]:
+		try:
+			code = self._code()
+			if code is None or not line_break and not self._done:
+				return None
+			if not self._done:
+				code = code[:code.rfind('\n') + 1]
+			with warnings.catch_warnings():
+				warnings.simplefilter('ignore')
+				codeop.compile_command(code, '<response>', 'exec')
+		except (SyntaxError, ValueError, OverflowError) as e:
+			return f'{e.__class__.__name__}: {e}'
+		return None
+
+def _stop_text(text: str):
+	"""
+	Text the stop sequence cut, closing the code block if the response stopped inside one.
+	"""
+	return STOP_TEXT + '\n```' if text.count('```') % 2 == 1 else STOP_TEXT
+
+def _ends_at_stop(text: str):
+	"""
+	Whether a response stopped without a stop reason ended at the stop sequence, i.e. after the indentation of a line.
+	"""
+	last_line = text[text.rfind('\n') + 1:]
+	return bool(last_line) and last_line.isspace()
+
+async def read_anthropic_stream(
+	stream: "AnthropicStream[BetaRawMessageStreamEvent]",
+	monitor: SyntaxMonitor,
+) -> dict[str, Any]:
+	"""
+	Accumulate a streamed message, closing the stream as soon as `monitor` reports an error.
+
+	Returns:
+		message as returned by the non-streaming API, with `stop_reason` `aborted` and the error in `abort_reason` if aborted.
+	"""
+	message: dict[str, Any] = {}
+	async for event in stream:
+		if event.type == 'message_start':
+			message = event.message.to_dict()
+		elif event.type == 'content_block_delta' and event.delta.type == 'text_delta':
+			error = monitor.feed(event.delta.text)
+			if error is not None:
+				await stream.close()
+				message['stop_reason'] = 'aborted'
+				message['abort_reason'] = error
+				break
+		elif event.type == 'message_delta':
+			message['stop_reason'] = event.delta.stop_reason
+			message['stop_sequence'] = event.delta.stop_sequence
+			message['usage']['output_tokens'] = event.usage.output_tokens
+	text = monitor.generated
+	if message.get('stop_reason') == 'stop_sequence' and message.get('stop_sequence') == STOP_SEQUENCE:
+		text += _stop_text(monitor.text)
+	message['content'] = [{"type": 'text', "text": text}]
+	return message
+
+async def read_openai_stream(
+	stream: "OpenAIStream[ChatCompletionChunk]",
+	monitor: SyntaxMonitor,
+) -> dict[str, Any]:
+	"""
+	Accumulate a streamed chat completion, closing the stream as soon as `monitor` reports an error.
+
+	Returns:
+		completion body as returned by the non-streaming API, with `finish_reason` `aborted` and the error in `abort_reason` if aborted.
+	"""
+	body: dict[str, Any] = {"object": 'chat.completion', "usage": None}
+	finish_reason: Optional[str] = None
+	async for chunk in stream:
+		body['id'] = chunk.id
+		body['model'] = chunk.model
+		body['created'] = chunk.created
+		if chunk.usage is not None:
+			body['usage'] = chunk.usage.to_dict()
+		if not chunk.choices:
+			continue
+		choice = chunk.choices[0]
+		if choice.delta.content:
+			error = monitor.feed(choice.delta.content)
+			if error is not None:
+				await stream.close()
+				finish_reason = 'aborted'
+				body['abort_reason'] = error
+				break
+		if choice.finish_reason is not None:
+			finish_reason = choice.finish_reason
+	text = monitor.generated
+	if finish_reason == 'stop' and _ends_at_stop(text):
+		text += _stop_text(monitor.text)
+	body['choices'] = [{
+		"index": 0,
+		"message": {"role": 'assistant', "content": text},
+		"finish_reason": finish_reason,
+	}]
+	return body
@@ -21,11 +21,11 @@ def openai_request():
 		#'data/proofwriter/test-80.jsonl',
 		#'data/proofwriter/OWA/depth-5/meta-test.jsonl',
 		'data/reveal/eval/musique_test.csv',
-		#filter=lambda record: record['dataset'] == 'musique',
+		#datasets=['musique'],
 		return_ids=True,
 		#baseline=True,
 	)
-	outfile = generate_batch(
+	outfiles = generate_batch(
 		prompts,
 		0, 120,
 		#'baseline-proofwriter-test-80-cot-gpt4o0806',
@@ -43,8 +43,9 @@ def openai_request():
 		custom_ids=ids,
 		max_tokens=4096,
 	)
-	input('Press Enter to submit batch.')
-	submit_batch(outfile)
+	input(f'Press Enter to submit {len(outfiles)} batch(es).')
+	for outfile in outfiles:
+		submit_batch(outfile)
 
 def langchain_request():
 	from llm_utils.langchain_request import request_and_save, get_anthropic, get_anthropic_api_error
@@ -66,10 +67,10 @@ def langchain_request():
 	#prompts = generate_prompts('data/FOLIO/folio_v2_train.jsonl')
 	prompts, ids = generate_prompts(
 		'data/proofwriter/OWA/depth-5/meta-dev.jsonl',
-	#	filter=lambda record: record['dataset'] == 'strategy_qa',
+	#	datasets=['strategy_qa'],
 		return_ids=True,
+		s=slice(0, 20),
 	)
-	prompts = prompts[0:20]
 	#ids = [str(i) for i in range(20)]
 	if TYPE_CHECKING:
 		assert isinstance(prompts, list) # idiot pylance
@@ -83,6 +84,7 @@ def langchain_request():
 		#'data/langchain_response/z3py-3-shot-v21-reveal-strategyqa-claude35sonnet-0000-0020.json',
 		prefill='def',
 		max_concurrency=2,
+		#resume=True,
 		retry_if_exception_type=(get_anthropic_api_error(),),
 	)
 
@@ -101,8 +103,8 @@ def anthropic_request():
 		#'data/reveal/eval/musique_test.csv',
 		return_ids=True,
 		baseline=True,
+		s=slice(0, 120),
 	)
-	prompts = prompts[0:120]
 	#asyncio.run(batch_request_async(
 	#	prompts,
 	#	'claude-3-5-sonnet-20240620',
@@ -114,10 +116,12 @@ def anthropic_request():
 	#	prefill='def',
 	#	max_tokens=4096,
 	#	max_concurrency=2,
+	#	#custom_ids=ids,
+	#	#resume=True,
 	#))
 
 	#return
-	requests = generate_batch(
+	outfiles = generate_batch(
 		prompts,
 		0, 80,
 		#'baseline-proofwriter-test-80-cot-35sonnet',
@@ -133,17 +137,148 @@ def anthropic_request():
 		prefill='def',
 		max_tokens=4096,
 	)
-	input('Press Enter to submit batch.')
-	b = submit_batch(requests)
-	print(b.id)
+	input(f'Press Enter to submit {len(outfiles)} batch(es).')
+	for outfile in outfiles:
+		b = submit_batch(outfile)
+		print(b.id)
+
+def anthropic_pipeline():
+	from llm_utils.anthropic_request import batch_request_async
+	from llm_utils.anthropic_response import get_message_content
+	from llm_utils.pipeline import VerificationPipeline
+	from dataset_utils.reveal import check_result, generate_prompts, get_data
+
+	data_path = 'data/reveal/eval/musique_test.csv'
+	prompts = generate_prompts(data_path)[:120]
+	source = get_data(data_path)
+
+	# Verify each response as soon as it arrives, instead of after the last one.
+	with VerificationPipeline(
+		len(prompts),
+		lambda i, results: check_result(results, source[i]),
+		get_content=lambda message: get_message_content(message, 'def'),
+		#journal_path='data/check_journal/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+	) as pipeline:
+		asyncio.run(batch_request_async(
+			prompts,
+			'claude-3-5-sonnet-20240620',
+			'data/anthropic_response/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+			prefill='def',
+			max_tokens=4096,
+			max_concurrency=2,
+			on_response=pipeline.submit,
+		))
+		correct, wrong, llm_failed, z3_failed, total = pipeline.close()
+	print(f'Correct: {correct}, Wrong: {wrong}, LLM failed: {llm_failed}, Z3 failed: {z3_failed}, Total: {total}')
+
+def anthropic_resample():
+	from llm_utils.anthropic_request import get_sampler
+	from llm_utils.resample import resample
+	from dataset_utils.reveal import check_result, generate_prompts, get_data
+
+	data_path = 'data/reveal/eval/musique_test.csv'
+	prompts = generate_prompts(data_path)[:120]
+	source = get_data(data_path)
+
+	correct, wrong, llm_failed, z3_failed, total, sampled = resample(
+		prompts,
+		get_sampler(
+			'claude-3-5-sonnet-20240620',
+			prefill='def',
+			max_tokens=4096,
+			temperature=0.7,
+		),
+		lambda i, results: check_result(results, source[i]),
+		'data/anthropic_response/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-resample-0000-0120.jsonl',
+		max_candidates=4,
+		#quorum=2,
+		#feedback=False,
+	)
+	print(f'Correct: {correct}, Wrong: {wrong}, LLM failed: {llm_failed}, Z3 failed: {z3_failed}, Total: {total}, Sampled: {sampled}')
+
+def progressive_check():
+	from llm_utils.anthropic_request import get_sampler
+	from llm_utils.progressive import progressive_check
+	from dataset_utils.reveal import check_result, generate_prompts, get_data
+
+	data_path = 'data/reveal/eval/musique_test.csv'
+	prompts = generate_prompts(data_path)
+	source = get_data(data_path)
+
+	result = progressive_check(
+		prompts,
+		get_sampler(
+			'claude-3-5-sonnet-20240620',
+			prefill='def',
+			max_tokens=4096,
+		),
+		lambda i, results: check_result(results, source[i]),
+		strata=[record['answer_is_logically_correct'] for record in source],
+		target_width=0.1,
+		max_items=200,
+		max_concurrency=4,
+	)
+	print(f"Correct: {result['correct']}, Wrong: {result['wrong']}, LLM failed: {result['llm_failed']}, Z3 failed: {result['z3_failed']}, Total: {result['total']}")
+	print(f"Accuracy: {result['accuracy']:.4f}, 95% CI: [{result['interval'][0]:.4f}, {result['interval'][1]:.4f}], stopped early: {result['stopped_early']}")
+
+def retry_batch(
+	result_path: str = 'data/anthropic_batch_response/z3py-3-shot-v24-reveal-musique-test-35sonnet-0000-0120.jsonl',
+	manifest_path: str = 'data/anthropic_batch_request/z3py-3-shot-v24-reveal-musique-test-35sonnet-0000-0120.manifest.json',
+	journal_path: str = 'data/check_journal/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+):
+	from llm_utils.anthropic_request import submit_batch
+	from llm_utils.batch_writer import read_manifest
+	from llm_utils.retry import generate_retry_batch, get_failed_ids
+
+	failed_ids = get_failed_ids(result_path, journal_path)
+	outfiles = generate_retry_batch(
+		[shard['path'] for shard in read_manifest(manifest_path)['shards']],
+		failed_ids,
+		'data/anthropic_batch_request',
+		'z3py-3-shot-v24-reveal-musique-test-35sonnet-retry',
+		'anthropic',
+		max_tokens=8192,
+		#model='claude-3-5-sonnet-20241022',
+	)
+	input(f'Press Enter to submit {len(outfiles)} batch(es) of {len(failed_ids)} failed requests.')
+	for outfile in outfiles:
+		b = submit_batch(outfile)
+		print(b.id)
+
+def merge_retry(
+	result_path: str = 'data/anthropic_batch_response/z3py-3-shot-v24-reveal-musique-test-35sonnet-0000-0120.jsonl',
+	retry_path: str = 'data/anthropic_batch_response/z3py-3-shot-v24-reveal-musique-test-35sonnet-retry-0000-0010.jsonl',
+	output_path: str = 'data/anthropic_batch_response/z3py-3-shot-v24-reveal-musique-test-35sonnet-merged-0000-0120.jsonl',
+	journal_path: str = 'data/check_journal/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+):
+	from llm_utils.journal import drop_entries
+	from llm_utils.retry import merge_results
+
+	replaced = merge_results(result_path, [retry_path], output_path, 'anthropic')
+	# Check only the replaced responses again when `anthropic_check` resumes from the journal.
+	drop_entries(journal_path, replaced)
+
+def cache_report(
+	*response_file_paths: str,
+):
+	from llm_utils.prompt_cache import read_usages, summarize_usage
+
+	for response_file_path in response_file_paths or (
+		'data/anthropic_response/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+	):
+		summary = summarize_usage(read_usages(response_file_path))
+		print(f"{response_file_path}: {summary['hits']}/{summary['requests']} hits, {summary['writes']} writes, "
+			f"{summary['cache_read_input_tokens']} read, {summary['cache_creation_input_tokens']} written, "
+			f"{summary['input_tokens']} uncached input tokens, hit rate {summary['hit_rate']:.1%}")
 
 def _reveal(
 	data_path: str = 'data/reveal/eval/reveal_eval.csv',
 	s: Optional[slice] = None,
-	filter: "Optional[Callable[[RevealRecord], bool]]" = lambda record: record['dataset'] == 'strategy_qa',
+	filter: "Optional[Callable[[RevealRecord], bool]]" = None,
+	datasets: Optional[tuple[str, ...]] = ('strategy_qa',),
 ):
 	from dataset_utils.reveal import check_result, get_data
-	source = get_data(data_path, filter=filter)
+	source = get_data(data_path, filter=filter, datasets=datasets)
 	if s:
 		source = source[s]
 	return source, check_result
@@ -153,7 +288,7 @@ def _folio(
 	s: Optional[slice] = None,
 ):
 	from dataset_utils.folio import check_result, get_data
-	source = get_data(data_path)
+	source = get_data(data_path, lazy=True)
 	if s:
 		source = source[s]
 	return source, check_result
@@ -163,7 +298,7 @@ def _proofwriter(
 	s: Optional[slice] = None,
 ):
 	from dataset_utils.proofwriter import check_result, get_data
-	source = get_data(data_path)
+	source = get_data(data_path, lazy=True)
 	if s:
 		source = source[s]
 	return source, check_result
@@ -198,6 +333,7 @@ def openai_check(
 		#use_definitions=False,
 		#use_common_knowledge=False,
 		sync=True,
+		#journal_path='data/check_journal/z3py-3-shot-v24-reveal-strategyqa-test-gpt4o0806-0000-0120.jsonl',
 	)
 	#print([
 	#	data['label']
@@ -212,7 +348,7 @@ def langchain_check():
 	#from dataset_utils.reveal import check_result, get_data
 
 	source = get_data('data/FOLIO/folio_v2_train.jsonl')
-	#source = get_data(filter = lambda record: record['dataset'] == 'strategy_qa')
+	#source = get_data(datasets=['strategy_qa'])
 	source = source[0:20]
 
 	correct, wrong, llm_failed, z3_failed, total = check_langchain_response(
@@ -254,9 +390,83 @@ def anthropic_check():
 		#use_definitions=False,
 		#use_common_knowledge=False,
 		sync=True,
+		#journal_path='data/check_journal/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
 	)
 	print(f'Correct: {correct}, Wrong: {wrong}, LLM failed: {llm_failed}, Z3 failed: {z3_failed}, Total: {total}')
 
+def compare_check():
+	from llm_utils import anthropic_response, openai_response
+	from llm_utils.compare import compare_items, compare_runs
+	#from dataset_utils.folio import check_result, get_data, get_labels, get_prediction
+	#from dataset_utils.proofwriter import check_result, get_data, get_labels, get_prediction, get_split
+	from dataset_utils.reveal import check_result, get_data, get_labels, get_prediction, get_split
+
+	source = get_data('data/reveal/eval/musique_test.csv')
+	source = source[0:120]
+
+	summary, tables = compare_runs(
+		{
+			'gpt4o0806': openai_response.read_responses(
+				'data/batch_response/z3py-3-shot-v24-reveal-musique-gpt4o0806-0000-0120.jsonl'),
+			'gpt4o0806-identifier': openai_response.read_responses(
+				'data/batch_response/z3py-3-shot-v24-reveal-musique-ablation-identifier-gpt4o0806-0000-0120.jsonl'),
+			'claude35sonnet': anthropic_response.read_responses(
+				'data/anthropic_response/z3py-3-shot-v24-reveal-musique-test-claude35sonnet-0000-0120.jsonl',
+				prefill='def'),
+		},
+		source,
+		lambda i, results: check_result(results, source[i]),
+		get_labels,
+		get_split,
+		get_prediction,
+		#use_definitions=False,
+		#use_common_knowledge=False,
+		#journal_path='data/check_journal/compare-reveal-musique-0000-0120.jsonl',
+	)
+	print(summary)
+	print(compare_items(tables))
+
+def gold_check():
+	from dataset_utils.folio import check_gold, get_fol_data
+
+	source = get_fol_data('data/FOLIO/folio_v2_validation.jsonl')
+
+	(correct, wrong, failed, total), unparsed, elapsed = check_gold(source)
+	print(f'Correct: {correct}, Wrong: {wrong}, Z3 failed: {failed}, Total: {total}, Unparsed: {len(unparsed)}, Elapsed: {elapsed:.2f}s')
+
+def batch_manage(
+	state_path: str = 'data/batch_state/batches.json',
+):
+	from llm_utils.batch_manager import AnthropicBatchProvider, BatchManager, BatchRecord
+	from llm_utils.cache import get_response_cache
+	from llm_utils.anthropic_response import check_batch_response
+	#from llm_utils.openai_response import check_batch_response
+	from dataset_utils.reveal import check_result, get_data
+
+	source = get_data('data/reveal/eval/musique_test.csv')
+
+	def on_ended(record: BatchRecord):
+		first = record['first']
+		return check_batch_response(
+			record['output_path'],
+			lambda i, results: check_result(results, source[first + i]),
+			batch=True,
+			prefill='def',
+			sync=True,
+		)
+
+	manager = BatchManager(
+		state_path,
+		[AnthropicBatchProvider()],
+		#[OpenAIBatchProvider()],
+		output_dir='data/anthropic_batch_response',
+		on_ended=on_ended,
+		response_cache=get_response_cache(),
+	)
+	#manager.submit_manifest('anthropic', 'data/anthropic_batch_request/z3py-3-shot-v24-reveal-musique-test-35sonnet-0000-0120.manifest.json')
+	for record in manager.run().values():
+		print(record['id'], record['status'], record['result'] or record['error'])
+
 def _prompt_dataset(
 	dataset: Literal['folio', 'proofwriter', 'reveal'],
 	data_path: str,
@@ -267,7 +477,7 @@ def _prompt_dataset(
 
 	generate_prompts = getattr(module, 'generate_prompts')
 	if dataset == 'reveal' and split:
-		prompts = generate_prompts(data_path, filter = lambda record: record['dataset'] == split)
+		prompts = generate_prompts(data_path, datasets=[split])
 	else:
 		prompts = generate_prompts(data_path)
 	return prompts
@@ -280,7 +490,7 @@ if __name__ == '__main__':
 	parser.add_argument('method',
 		choices=[
 			method.__name__
-			for method in [openai_request, langchain_request, anthropic_request, openai_check, langchain_check, anthropic_check]
+			for method in [openai_request, langchain_request, anthropic_request, anthropic_pipeline, anthropic_resample, progressive_check, retry_batch, merge_retry, cache_report, openai_check, langchain_check, anthropic_check, compare_check, gold_check, batch_manage]
 		],
 		help='method to run')
 	parser.add_argument('-l', '--log-level',
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Literal, Tuple, TypeVar
+from typing import Any, Callable, Literal, Sequence, Tuple, TypeVar
 from typing_extensions import deprecated
 
 from logging import Logger, getLogger
@@ -8,6 +8,7 @@ from typing import TYPE_CHECKING
 
 T = TypeVar('T')
 LABEL_PREFIX = 'DEFLBLPREF_'
+ABLATION_GRID = [(True, True), (True, False), (False, True), (False, False)] # (use_definitions, use_common_knowledge)
 
 def verify(s: Solver, expr):
 	assert s.check() != unsat, 'Paradox premises.' # sanity check
@@ -158,31 +159,38 @@ class LogicBase:
 			self.s.push()
 
 			if self.use_definitions:
-				defs: dict[str, tuple[int, Expr]] = dict()
-				for i, (desc, expr) in enumerate(self.definitions):
-					label = f'{LABEL_PREFIX}{i}'
-					defs[label] = i, expr
-					self.s.assert_and_track(expr, label)
-				if self.s.check() == unsat:
-					unsat_core = self.s.unsat_core()
-					unsat_core_str = [str(label) for label in unsat_core]
-					unsat_indices = [int(label[len(LABEL_PREFIX):]) for label in unsat_core_str]
-					self._logger.warning('Inconsistent definitions %s.', unsat_indices)
-					self.s.pop()
-					for label, (i, expr) in defs.items():
-						if label not in unsat_core_str:
-							self.s.add(expr)
-					for label in unsat_core_str:
-						i, expr = defs[label]
-						if self.s.check(expr) == sat:
-							self._logger.info('Readded definition #%d.', i)
-							self.s.add(expr)
+				self._add_definitions()
 
 			if self.use_common_knowledge:
 				self._add2(self.common_knowledge)
 
 			self._added = True
 
+	def _add_definitions(self) -> None:
+		"""
+		Add the definitions to the current scope.
+		If they are inconsistent, the current scope is popped, and consistent definitions are re-added to the parent scope.
+		"""
+		defs: dict[str, tuple[int, Expr]] = dict()
+		for i, (desc, expr) in enumerate(self.definitions):
+			label = f'{LABEL_PREFIX}{i}'
+			defs[label] = i, expr
+			self.s.assert_and_track(expr, label)
+		if self.s.check() == unsat:
+			unsat_core = self.s.unsat_core()
+			unsat_core_str = [str(label) for label in unsat_core]
+			unsat_indices = [int(label[len(LABEL_PREFIX):]) for label in unsat_core_str]
+			self._logger.warning('Inconsistent definitions %s.', unsat_indices)
+			self.s.pop()
+			for label, (i, expr) in defs.items():
+				if label not in unsat_core_str:
+					self.s.add(expr)
+			for label in unsat_core_str:
+				i, expr = defs[label]
+				if self.s.check(expr) == sat:
+					self._logger.info('Readded definition #%d.', i)
+					self.s.add(expr)
+
 	def _get_expr(self, exprs: list[Tuple[str, T]]):
 		return [expr for _, expr in exprs]
 
@@ -208,6 +216,112 @@ class LogicBase:
 			for r1, r2 in self.verify()
 		]
 
+	def judge_numbered(self):
+		"""
+		Judge assertions of numbered conclusions, e.g. of a FOLIO story.
+		Each assertion is described starting with its number, so that verdicts out of order fail instead of being misattributed.
+		"""
+		for i, (desc, _) in enumerate(self.assertions):
+			assert isinstance(desc, str) and desc.lstrip().startswith(f'{i + 1}.'), \
+				f'Assertion #{i} is not numbered {i + 1}: {str(desc)[:40]}'
+		return self.judge()
+
+	def _check_assertions(self,
+		use_definitions: bool,
+		use_common_knowledge: bool,
+	):
+		"""
+		Assert that no assertion is trivially given by the premises in use.
+		"""
+		for i, assertion in enumerate(self._get_expr(self.assertions)):
+			if type(assertion) is bool:
+				self._logger.error('Assertion #%d (%s) is bool.', i, assertion)
+				assert False, 'Assertion should not be bool.'
+			if assertion in self._get_expr(self.definitions):
+				self._logger.error('Assertion #%d (%s) is inluded in definitions.', i, assertion)
+				assert not use_definitions, 'Definitions should not include assertions.'
+			elif assertion in self._get_expr(self.common_knowledge):
+				self._logger.error('Assertion #%d (%s) is inluded in common knowledge.', i, assertion)
+				assert not use_common_knowledge, 'Common knowledge should not include assertions.'
+			elif assertion in self._get_expr(self.claims):
+				self._logger.warning('Assertion #%d (%s) is inluded in claims.', i, assertion)
+
+	def judge_grid(self,
+		grid: Sequence[tuple[bool, bool]] = ABLATION_GRID,
+	) -> "list[tuple[Literal[True], list[bool | CheckSatResult]] | tuple[Literal[False], Exception]]":
+		"""
+		Judge the assertion under each (use_definitions, use_common_knowledge) combination.
+		Claims are added once, the other premises are pushed and popped for each combination.
+		Build the instance with both flags off, assertions are checked against the premises of each combination instead.
+		"""
+		assert not self._added, 'Premises are already added.'
+		base = self.s.num_scopes()
+		self.s.push()
+		try:
+			self._add2(self.claims)
+			assert self.s.check() == sat, 'Paradox claims.'
+
+			results: "list[tuple[Literal[True], list[bool | CheckSatResult]] | tuple[Literal[False], Exception]]" = []
+			for use_definitions, use_common_knowledge in grid:
+				self.s.push()
+				self.s.push() # popped by _add_definitions on inconsistency
+				try:
+					self._check_assertions(use_definitions, use_common_knowledge)
+					if use_definitions:
+						self._add_definitions()
+					if use_common_knowledge:
+						self._add2(self.common_knowledge)
+					results.append((True, [
+						judge(*verify(self.s, expr))
+						for expr in self._get_expr(self.assertions)
+					]))
+				except Exception as e:
+					self._logger.error('Failed to judge with use_definitions=%s, use_common_knowledge=%s: %s',
+						use_definitions, use_common_knowledge, e)
+					results.append((False, e))
+				finally:
+					self.s.pop(self.s.num_scopes() - base - 1)
+			return results
+		finally:
+			self.s.pop(self.s.num_scopes() - base)
+
+	def judge_steps(self) -> "list[bool | CheckSatResult]":
+		"""
+		Judge each claim against the claims before it, then the assertions against all claims.
+		Definitions and common knowledge are added first, and claims are added one by one to the same solver,
+		so each step is a single incremental check.
+		A claim contradicting the steps before it is not added.
+
+		Returns:
+			verdicts of the claims, followed by verdicts of the assertions.
+		"""
+		assert not self._added, 'Premises are already added.'
+		base = self.s.num_scopes()
+		self.s.push()
+		try:
+			if self.use_definitions:
+				self.s.push() # popped by _add_definitions on inconsistency
+				self._add_definitions()
+			if self.use_common_knowledge:
+				self._add2(self.common_knowledge)
+
+			results: "list[bool | CheckSatResult]" = []
+			for i, expr in enumerate(self._get_expr(self.claims)):
+				result = judge(*verify(self.s, expr))
+				results.append(result)
+				if result == False:
+					self._logger.warning('Claim #%d contradicts the claims before it.', i)
+				else:
+					self.s.push()
+					self.s.add(expr)
+			results.extend(
+				judge(*verify(self.s, expr))
+				for expr in self._get_expr(self.assertions)
+			)
+			return results
+		finally:
+			self.s.pop(self.s.num_scopes() - base)
+
 	def to_conjunction(self):
 		"""
 		Get all added expressions in the solver as a conjunction.
@@ -238,18 +352,7 @@ class Logic(LogicBase):
 	@assertions.setter
 	def assertions(self, value: list[Tuple[str, Any]]):
 		self._assertions = self._preprocess('assertions', value)
-		for i, assertion in enumerate(self._get_expr(self._assertions)):
-			if type(assertion) is bool:
-				self._logger.error('Assertion #%d (%s) is bool.', i, assertion)
-				assert False, 'Assertion should not be bool.'
-			if assertion in self._get_expr(self.definitions):
-				self._logger.error('Assertion #%d (%s) is inluded in definitions.', i, assertion)
-				assert not self.use_definitions, 'Definitions should not include assertions.'
-			elif assertion in self._get_expr(self.common_knowledge):
-				self._logger.error('Assertion #%d (%s) is inluded in common knowledge.', i, assertion)
-				assert not self.use_common_knowledge, 'Common knowledge should not include assertions.'
-			elif assertion in self._get_expr(self.claims):
-				self._logger.warning('Assertion #%d (%s) is inluded in claims.', i, assertion)
+		self._check_assertions(self.use_definitions, self.use_common_knowledge)
 
 @deprecated('Use Logic instead.')
 class QALogic(LogicBase):